@@ -0,0 +1,198 @@
+import argparse
+import logging
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from .config import RESOURCE_CATALOG_MAX_AGE
+from .crawler import Crawler, CrawlResult
+from .datatools import read_parquet, write_parquet
+from .repo import Repo
+
+logger = logging.getLogger("ocandata")
+
+RESOURCE_COLUMNS = ["Resource Name", "Resource Type", "Format", "Language", "Link", "Status"]
+_CATALOG_FILE = "resource_catalog.parquet"
+
+
+class ResourceCatalog(object):
+    """
+    The resource tables of every dataset in the inventory, crawled once and kept in a single
+    parquet file sorted by portal url. Looking up a dataset's resources is a dict lookup
+    of the url's range of rows and a slice
+    """
+
+    def __init__(self, path):
+        """
+        :param path: the catalog's parquet file
+        """
+        self.path = Path(path)
+        self._data = None
+
+    @classmethod
+    def in_repo(cls, repo: Repo = None):
+        """
+        The catalog in the dataset directory of a repo, by default the repo in the user's home directory
+        """
+        repo = repo or Repo.at_user_home()
+        return cls(repo.dataset / _CATALOG_FILE)
+
+    def exists(self):
+        return self.path.exists()
+
+    @property
+    def data(self):
+        """
+        The catalog, one row per resource, read the first time it is used
+        """
+        if self._data is None:
+            if self.path.exists():
+                data = read_parquet(self.path)
+            else:
+                data = pd.DataFrame(columns=["dataset_url"] + RESOURCE_COLUMNS + ["crawled"])
+            self._set_data(data)
+        return self._data
+
+    def _set_data(self, data: pd.DataFrame):
+        self._data = data
+        # The rows of each url, from the start of its run in the sorted urls
+        urls, starts = np.unique(data["dataset_url"].to_numpy(dtype=object), return_index=True)
+        ends = np.append(starts[1:], len(data))
+        self._ranges = dict(zip(urls, zip(starts, ends)))
+        self._resources = data[RESOURCE_COLUMNS].astype(object).reset_index(drop=True)
+
+    def reload(self):
+        """
+        Read the catalog again, after another process has refreshed it
+        """
+        self._data = None
+
+    def _rows(self, url: str):
+        self.data
+        start, end = self._ranges.get(url, (0, 0))
+        return self._resources.iloc[start:end]
+
+    def __contains__(self, url: str):
+        return len(self._rows(url)) > 0
+
+    def resources(self, url: str):
+        """
+        :param url: the portal url of a dataset
+        :return: the dataset's resource table, or None if it is not in the catalog
+        """
+        rows = self._rows(url)
+        if len(rows) == 0:
+            return None
+        return rows.reset_index(drop=True)
+
+    def stale_urls(self, urls: List[str], max_age: float = None):
+        """
+        :return: the urls that are not in the catalog, or were crawled more than max_age seconds ago
+        """
+        max_age = RESOURCE_CATALOG_MAX_AGE if max_age is None else max_age
+        data = self.data
+        crawled = data.groupby("dataset_url")["crawled"].min() if len(data) else pd.Series(dtype=float)
+        crawled = crawled.reindex(list(urls)).fillna(0).values
+        return [url for url, when in zip(urls, crawled) if time.time() - when >= max_age]
+
+    def update(self, results: Dict[str, CrawlResult]):
+        """
+        Replace the resources of the crawled datasets in the catalog, and write it.
+        A dataset that could not be crawled keeps the resources it had, and is crawled again next time
+        """
+        now = time.time()
+        frames, urls, crawled = [], [], []
+        for url, result in results.items():
+            if result.resources is not None:
+                rows = result.resources
+                if list(rows.columns) != RESOURCE_COLUMNS:
+                    rows = rows.reindex(columns=RESOURCE_COLUMNS)
+                # Missing cells would be stored as "nan", and a table without a Status has the page's status
+                rows = rows.fillna({"Status": result.status}).fillna("")
+            elif result.status != "Error" or url not in self:
+                rows = pd.DataFrame([("", "", "", "", url, result.status)], columns=RESOURCE_COLUMNS)
+            else:
+                continue
+            frames.append(rows)
+            urls.append(url)
+            crawled.append(0.0 if result.status == "Error" else now)
+        if not frames:
+            return
+        counts = [len(rows) for rows in frames]
+        crawled_rows = pd.concat(frames, ignore_index=True)
+        crawled_rows.insert(0, "dataset_url", np.repeat(urls, counts))
+        crawled_rows["crawled"] = np.repeat(crawled, counts)
+        data = self.data
+        kept = data[~data["dataset_url"].isin(urls)]
+        data = pd.concat([kept, crawled_rows], ignore_index=True).astype({col: str for col in ["dataset_url"] + RESOURCE_COLUMNS})
+        data = data.sort_values("dataset_url", kind="stable").reset_index(drop=True)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        write_parquet(data, self.path)
+        self._set_data(data)
+
+    def refresh(self, urls: List[str], max_age: float = None, checkpoint: str = None, **crawler_options):
+        """
+        Crawl the datasets whose resources are missing from the catalog or stale, and update it
+        :param urls: the portal urls of the datasets
+        :param max_age: seconds a dataset's resources are used before they are crawled again
+        :param checkpoint: a file to record crawled pages in, so an interrupted refresh can resume
+        :param crawler_options: options for the Crawler
+        :return: the number of datasets crawled
+        """
+        stale = self.stale_urls(urls, max_age=max_age)
+        logger.info(f"{len(stale)} of {len(urls)} datasets need to be crawled")
+        if stale:
+            self.update(Crawler(checkpoint=checkpoint, **crawler_options).run(stale))
+        return len(stale)
+
+    def __len__(self):
+        return self.data["dataset_url"].nunique()
+
+    def __repr__(self):
+        return f"<ResourceCatalog at {self.path}>"
+
+
+_default_catalog = None
+
+
+def default_catalog():
+    """
+    The catalog in the user's repo, that Dataset reads its resources from
+    """
+    global _default_catalog
+    if _default_catalog is None:
+        _default_catalog = ResourceCatalog.in_repo()
+    return _default_catalog
+
+
+def main(args=None):
+    """
+    Build or refresh the resource catalog for the inventory
+        python -m ocandata.catalog --max-age 604800 --checkpoint crawl.jsonl
+    """
+    from .inventory import Inventory, is_page_url
+    parser = argparse.ArgumentParser(description="Crawl the resources of every dataset in the inventory")
+    parser.add_argument("--repo", help="the directory of the repo, by default the user's home directory")
+    parser.add_argument("--max-age", type=float, default=None,
+                        help="seconds a dataset's resources are used before they are crawled again")
+    parser.add_argument("--checkpoint", help="a file to record crawled pages in, to resume an interrupted crawl")
+    parser.add_argument("--per-host-limit", type=int, default=8, help="connections to the portal at once")
+    parser.add_argument("--limit", type=int, default=None, help="only crawl this many datasets")
+    options = parser.parse_args(args)
+
+    repo = Repo.at(options.repo) if options.repo else None
+    catalog = ResourceCatalog.in_repo(repo)
+    inventory = Inventory()
+    urls = [url for url in inventory.data["portal_url_en"] if is_page_url(url)]
+    if options.limit:
+        urls = urls[:options.limit]
+    crawled = catalog.refresh(urls, max_age=options.max_age, checkpoint=options.checkpoint,
+                              per_host_limit=options.per_host_limit)
+    print(f"Crawled {crawled} datasets, {len(catalog)} in the catalog at {catalog.path}")
+
+
+if __name__ == "__main__":
+    main()
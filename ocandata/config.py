@@ -11,6 +11,12 @@ env.read_env()
 
 CACHE_DIR = env('cache_dir', '.')
 DOTPATH = env('DOTPATH', 'canadadata')
-
-
-
+# How long, in seconds, a downloaded file is used before it is revalidated with the server
+DOWNLOAD_MAX_AGE = env.float('download_max_age', 12 * 60 * 60)
+# How long, in seconds, a page in the http cache is used before it is revalidated, and the most bytes the cache keeps
+HTTP_CACHE_TTL = env.float('http_cache_ttl', 24 * 60 * 60)
+HTTP_CACHE_MAX_BYTES = env.int('http_cache_max_bytes', 512 * 1024 * 1024)
+# How long, in seconds, a dataset's resources in the resource catalog are used before they are crawled again
+RESOURCE_CATALOG_MAX_AGE = env.float('resource_catalog_max_age', 7 * 24 * 60 * 60)
+# How long, in seconds, the inventory snapshot is used before it is revalidated in the background
+INVENTORY_MAX_AGE = env.float('inventory_max_age', 24 * 60 * 60)
@@ -1,7 +1,9 @@
 from typing import Any
 import requests
-import concurrent
+import concurrent.futures
+import itertools
 import os
+from collections import deque
 from collections.abc import Iterable
 from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from types import SimpleNamespace
@@ -21,7 +23,22 @@ _default_cpus = min(16, num_cpus())
 defaults = SimpleNamespace(cpus=_default_cpus, cmap='viridis', return_fig=False, silent=False)
 
 
-def get(url):
+_http_cache = None
+
+
+def http_cache():
+    "The disk cache that `get` uses, in the user's repo."
+    global _http_cache
+    if _http_cache is None:
+        from .httpcache import HttpCache
+        _http_cache = HttpCache.in_repo()
+    return _http_cache
+
+
+def get(url, cache: bool = True, ttl: float = None):
+    "Get the text of `url`, through the disk cache unless `cache` is False. None if the server doesn't answer 200."
+    if cache:
+        return http_cache().get(url, ttl=ttl)
     res = requests.get(url)
     if res.status_code == 200:
         return res.text
@@ -32,15 +49,81 @@ def ifnone(a: Any, b: Any) -> Any:
     return b if a is None else a
 
 
-def parallel(func, arr: Collection, max_workers: int = None, leave=False):
-    "Call `func` on every element of `arr` in parallel using `max_workers`."
-    max_workers = ifnone(max_workers, defaults.cpus)
+def _apply_chunk(func, chunk: list, return_exceptions: bool):
+    "Call `func` on each element of `chunk`, in a worker."
+    results = []
+    for o in chunk:
+        try:
+            results.append(func(o))
+        except Exception as e:
+            if not return_exceptions: raise
+            results.append(e)
+    return results
+
+
+def _chunks(arr: Iterable, chunksize: int):
+    "Split `arr` into lists of `chunksize` elements, reading it lazily."
+    it = iter(arr)
+    while True:
+        chunk = list(itertools.islice(it, chunksize))
+        if not chunk: return
+        yield chunk
+
+
+_EXECUTORS = {'thread': ThreadPoolExecutor, 'process': ProcessPoolExecutor}
+
+
+def parallel_iter(func, arr: Iterable, max_workers: int = None, backend: str = 'thread', ordered: bool = True,
+                  chunksize: int = 1, max_in_flight: int = None, return_exceptions: bool = False):
+    """
+    Call `func` on every element of `arr` in parallel, yielding the results as they are ready.
+    `arr` is read lazily and at most `max_in_flight` chunks are submitted at a time, so a long or unbounded
+    iterable never has more than that many tasks and results buffered
+    :param func: the function to call. It has to be picklable for the process backend
+    :param arr: the elements to call it on
+    :param max_workers: the number of workers. Less than 2 calls `func` serially in this thread
+    :param backend: 'thread' for work that waits on IO, 'process' for CPU bound work
+    :param ordered: yield the results in the order of `arr`, otherwise in the order they finish
+    :param chunksize: the number of elements sent to a worker in each task
+    :param max_in_flight: the most chunks submitted and not yet yielded, by default twice `max_workers`
+    :param return_exceptions: yield the exception raised for an element instead of raising it
+    """
+    if backend not in _EXECUTORS:
+        raise ValueError(f"backend should be one of {list(_EXECUTORS)}, not {backend}")
+    max_workers = ifnone(max_workers, num_cpus() if backend == 'process' else defaults.cpus)
     if max_workers < 2:
-        results = [func(o, i) for i, o in progress_bar(enumerate(arr), total=len(arr), leave=leave)]
-    else:
-        with ThreadPoolExecutor(max_workers=max_workers) as ex:
-            futures = [ex.submit(func, o) for i, o in enumerate(arr)]
-            results = []
-            for f in progress_bar(concurrent.futures.as_completed(futures), total=len(arr), leave=leave):
-                results.append(f.result())
-    if any([o is not None for o in results]): return results
\ No newline at end of file
+        for chunk in _chunks(arr, chunksize):
+            yield from _apply_chunk(func, chunk, return_exceptions)
+        return
+    max_in_flight = max(1, ifnone(max_in_flight, 2 * max_workers))
+    chunks = _chunks(arr, chunksize)
+    in_flight = deque()
+    with _EXECUTORS[backend](max_workers=max_workers) as ex:
+        try:
+            exhausted = False
+            while True:
+                while not exhausted and len(in_flight) < max_in_flight:
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        exhausted = True
+                    else:
+                        in_flight.append(ex.submit(_apply_chunk, func, chunk, return_exceptions))
+                if not in_flight: return
+                if ordered:
+                    future = in_flight.popleft()
+                else:
+                    done, _ = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+                    future = next(iter(done))
+                    in_flight.remove(future)
+                yield from future.result()
+        finally:
+            for future in in_flight: future.cancel()
+
+
+def parallel(func, arr: Collection, max_workers: int = None, leave=False, backend: str = 'thread',
+             ordered: bool = True, chunksize: int = 1, max_in_flight: int = None, return_exceptions: bool = False):
+    "Call `func` on every element of `arr` in parallel using `max_workers`, and return a list of the results. See `parallel_iter`."
+    results = parallel_iter(func, arr, max_workers=max_workers, backend=backend, ordered=ordered,
+                            chunksize=chunksize, max_in_flight=max_in_flight, return_exceptions=return_exceptions)
+    if not hasattr(arr, '__len__'): return list(results)
+    return list(progress_bar(results, total=len(arr), leave=leave))
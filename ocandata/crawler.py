@@ -0,0 +1,202 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from concurrent.futures import Executor
+from typing import Dict, List
+from urllib.parse import urljoin
+
+import aiohttp
+import pandas as pd
+
+from .inventory import parse_dataset_page
+
+logger = logging.getLogger("ocandata")
+
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CrawlResult(object):
+    """
+    The outcome of crawling one dataset page
+    """
+
+    def __init__(self, url: str, status: str, resources: pd.DataFrame = None, error: str = None):
+        """
+        :param url: the url of the dataset page
+        :param status: Active, Deleted or Error
+        :param resources: the resource table on the page, if there is one
+        :param error: why the crawl failed, if it did
+        """
+        self.url = url
+        self.status = status
+        self.resources = resources
+        self.error = error
+
+    def to_record(self):
+        record = {"url": self.url, "status": self.status, "error": self.error}
+        if self.resources is not None:
+            record["resources"] = self.resources.to_dict("split")
+        return record
+
+    @classmethod
+    def from_record(cls, record: dict):
+        resources = record.get("resources")
+        if resources is not None:
+            resources = pd.DataFrame(resources["data"], columns=resources["columns"])
+        return cls(record["url"], record["status"], resources=resources, error=record.get("error"))
+
+    def __repr__(self):
+        return f"<CrawlResult: {self.url} {self.status}>"
+
+
+def read_checkpoint(checkpoint: str):
+    """
+    Read the results recorded in a checkpoint file, one json record per line.
+    A line that was cut off when a crawl was interrupted is skipped
+    :return: a dict of url to CrawlResult
+    """
+    results = {}
+    try:
+        with open(checkpoint, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    result = CrawlResult.from_record(json.loads(line))
+                except (ValueError, KeyError):
+                    continue
+                results[result.url] = result
+    except FileNotFoundError:
+        pass
+    return results
+
+
+def _open_checkpoint(checkpoint: str):
+    # Start on a new line if the last crawl was cut off in the middle of one
+    f = open(checkpoint, "a+", encoding="utf-8")
+    if f.tell() > 0:
+        f.seek(f.tell() - 1)
+        if f.read(1) != "\n":
+            f.write("\n")
+    return f
+
+
+class Crawler(object):
+    """
+    Crawl dataset pages on the portal concurrently with asyncio.
+    Connections are limited per host, failed requests are retried with jittered exponential backoff,
+    and the pages are parsed in an executor so parsing doesn't hold up the downloads.
+    With a checkpoint file each result is appended as it finishes, and a crawl that is run again
+    skips the pages that were already crawled and retries the ones that failed
+    """
+
+    def __init__(
+        self,
+        checkpoint: str = None,
+        max_connections: int = 64,
+        per_host_limit: int = 8,
+        timeout: float = 30,
+        retries: int = 3,
+        backoff_factor: float = 0.5,
+        executor: Executor = None,
+    ):
+        """
+        :param checkpoint: a file to record the results in, so an interrupted crawl can resume
+        :param max_connections: the number of pages crawled at once
+        :param per_host_limit: the number of connections open to a host at once
+        :param timeout: the seconds to wait for a page
+        :param retries: the number of times to retry a page
+        :param backoff_factor: a retry waits a random time up to backoff_factor * 2 ** retry seconds
+        :param executor: the executor to parse pages in, by default the event loop's thread pool.
+        A ProcessPoolExecutor parses on every core
+        """
+        self.checkpoint = checkpoint
+        self.max_connections = max_connections
+        self.per_host_limit = per_host_limit
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.executor = executor
+
+    async def _get(self, session: aiohttp.ClientSession, url: str):
+        for attempt in range(self.retries + 1):
+            try:
+                async with session.get(url) as response:
+                    if response.status not in _RETRY_STATUSES:
+                        response.raise_for_status()
+                        return await response.text()
+                    error = f"HTTP {response.status}"
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if isinstance(e, aiohttp.ClientResponseError):
+                    raise
+                error = f"{type(e).__name__} {e}"
+            if attempt < self.retries:
+                delay = random.uniform(0, self.backoff_factor * 2 ** attempt)
+                logger.debug(f"Retrying {url} in {delay:.2f}s after {error}")
+                await asyncio.sleep(delay)
+        raise IOError(f"Could not get {url}: {error}")
+
+    async def _parse(self, html: str):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, parse_dataset_page, html)
+
+    async def crawl_page(self, session: aiohttp.ClientSession, url: str):
+        """
+        Crawl a dataset page, following the link to the dataset if the resources aren't on the page
+        :return: a CrawlResult
+        """
+        try:
+            resources, status, dataset_link = await self._parse(await self._get(session, url))
+            if resources is None and status is None and dataset_link:
+                dataset_link = urljoin(url, dataset_link)
+                resources, status, dataset_link = await self._parse(await self._get(session, dataset_link))
+            if resources is not None or status is not None:
+                return CrawlResult(url, status, resources=resources)
+            return CrawlResult(url, "Error", error="No resource table on the page")
+        except Exception as e:
+            return CrawlResult(url, "Error", error=f"{type(e).__name__} {e}")
+
+    async def crawl(self, urls: List[str]) -> Dict[str, CrawlResult]:
+        """
+        Crawl the dataset pages
+        :param urls: the urls of the dataset pages
+        :return: a dict of url to CrawlResult, including the results from the checkpoint
+        """
+        results = read_checkpoint(self.checkpoint) if self.checkpoint else {}
+        queue = asyncio.Queue()
+        for url in dict.fromkeys(urls):
+            if url not in results or results[url].status == "Error":
+                queue.put_nowait(url)
+        logger.info(f"Crawling {queue.qsize()} pages, {len(results)} in the checkpoint")
+        start = time.time()
+        checkpoint = _open_checkpoint(self.checkpoint) if self.checkpoint else None
+
+        async def worker():
+            while True:
+                try:
+                    url = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                result = await self.crawl_page(session, url)
+                results[url] = result
+                if checkpoint:
+                    checkpoint.write(json.dumps(result.to_record()) + "\n")
+                    checkpoint.flush()
+
+        connector = aiohttp.TCPConnector(limit=self.max_connections, limit_per_host=self.per_host_limit)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        try:
+            async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+                workers = min(self.max_connections, queue.qsize())
+                await asyncio.gather(*[worker() for _ in range(workers)])
+        finally:
+            if checkpoint:
+                checkpoint.close()
+        logger.info(f"Crawled in {time.time() - start:.2f}s")
+        return {url: results[url] for url in dict.fromkeys(urls) if url in results}
+
+    def run(self, urls: List[str]) -> Dict[str, CrawlResult]:
+        """
+        Crawl the dataset pages from code that isn't running in an event loop
+        """
+        return asyncio.run(self.crawl(urls))
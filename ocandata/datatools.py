@@ -1,17 +1,140 @@
-import requests, zipfile, io
+import requests, zipfile
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
+import json
+import time
 import hashlib
+import logging
+import tempfile
+import pandas as pd
+
+logger = logging.getLogger("ocandata")
+
+_CHUNK_SIZE = 1024 * 1024
 
 
 def hash(data: str):
     return hashlib.sha1(data.encode()).hexdigest()
 
 
+def create_session(pool_size: int = 10, retries: int = 3, backoff_factor: float = 0.5):
+    """
+    Create a requests Session that keeps up to pool_size connections alive per host,
+    and retries failed requests with exponential backoff
+    :param pool_size: the number of connections to keep per host
+    :param retries: the number of times to retry a request
+    :param backoff_factor: retries wait backoff_factor * 2 ** (retry - 1) seconds
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET", "HEAD"],
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
 def unzip_data(zip_url: str, path="."):
-    response = requests.get(zip_url)
-    zip_file = zipfile.ZipFile(io.BytesIO(response.content))
-    zip_file.extractall(path=path)
-    return tuple([os.path.join(path, f) for f in zip_file.namelist()])
+    """
+    Download a zip file and extract it. The download is spooled to a temporary file
+    and the members are extracted one at a time, so memory use stays the same
+    however big the archive is
+    :return: the paths of the extracted files, in the order they appear in the zip
+    """
+    with tempfile.TemporaryFile() as spool:
+        with requests.get(zip_url, stream=True) as response:
+            response.raise_for_status()
+            stream_response(response, spool)
+        spool.seek(0)
+        return extract_zip(spool, path)
+
+
+def extract_zip(zip_file, path="."):
+    """
+    Extract the members of a zip file one at a time. Each member is streamed to disk
+    and its CRC is checked as it is read
+    :param zip_file: the zip filename or an open binary file
+    :return: the paths of the extracted files, in the order they appear in the zip
+    """
+    with zipfile.ZipFile(zip_file) as archive:
+        files = []
+        for member in archive.infolist():
+            archive.extract(member, path=path)
+            files.append(os.path.join(path, member.filename))
+        return tuple(files)
+
+
+class ZipMember:
+    """
+    A file inside a zip file on disk, that is read straight out of the zip without extracting it
+    """
+
+    def __init__(self, zip_filename, name: str):
+        self.zip_filename = zip_filename
+        self.name = name
+
+    def open(self):
+        """
+        Open the member for reading. The member is decompressed as it is read
+        :return: a binary file object
+        """
+        with zipfile.ZipFile(self.zip_filename) as archive:
+            # The member stays readable after the archive is closed
+            return archive.open(self.name)
+
+    def __repr__(self):
+        return f"<ZipMember: {self.name} in {self.zip_filename}>"
+
+
+def zip_members(zip_filename):
+    """
+    :return: a ZipMember for each file in a zip file, in the order they appear in the zip
+    """
+    with zipfile.ZipFile(zip_filename) as archive:
+        return tuple([ZipMember(zip_filename, name) for name in archive.namelist()])
+
+
+def open_binary(source):
+    """
+    Open a file path or a ZipMember for reading bytes
+    """
+    if isinstance(source, ZipMember):
+        return source.open()
+    return open(source, "rb")
+
+
+def format_rate(size: int, elapsed: float):
+    rate = size / elapsed if elapsed > 0 else float(size)
+    for unit in ["B", "KB", "MB", "GB"]:
+        if rate < 1024:
+            break
+        rate /= 1024
+    return f"{rate:.1f} {unit}/s"
+
+
+def stream_response(response, fd, chunk_size: int = _CHUNK_SIZE):
+    """
+    Write a streamed response to an open file in chunks, and check that all of it arrived
+    :return: the number of bytes written
+    """
+    start = time.time()
+    size = 0
+    for chunk in response.iter_content(chunk_size=chunk_size):
+        fd.write(chunk)
+        size += len(chunk)
+    elapsed = time.time() - start
+    content_length = response.headers.get("Content-Length")
+    encoded = response.headers.get("Content-Encoding") not in (None, "identity")
+    if content_length is not None and not encoded and int(content_length) != size:
+        raise IOError(f"Incomplete download of {response.url}: got {size} of {content_length} bytes")
+    logger.info(f"Downloaded {response.url} {size:,} bytes in {elapsed:.2f}s ({format_rate(size, elapsed)})")
+    return size
 
 
 def get_filename_from_url(path: str):
@@ -22,11 +145,110 @@ def get_filename_from_url(path: str):
 
 
 def download_file(url: str, path="."):
-    response = requests.get(url)
     filename = get_filename_from_url(url)
     if path:
         filename = os.path.join(path, filename)
-    with open(filename, "wb") as fd:
-        for chunk in response.iter_content(chunk_size=128):
-            fd.write(chunk)
+    with requests.get(url, stream=True) as response:
+        response.raise_for_status()
+        with open(filename, "wb") as fd:
+            stream_response(response, fd)
     return filename
+
+
+def read_manifest(manifest_file: str):
+    """
+    Read the sidecar manifest that records the validators of a downloaded file
+    :return: the manifest as a dict, or None if there is no manifest
+    """
+    if not os.path.exists(manifest_file):
+        return None
+    with open(manifest_file, "r") as f:
+        try:
+            return json.load(f)
+        except ValueError:
+            return None
+
+
+def write_manifest(manifest_file: str, manifest: dict):
+    temp_file = f"{manifest_file}.part"
+    with open(temp_file, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temp_file, manifest_file)
+
+
+def conditional_headers(manifest: dict):
+    """
+    Build the If-None-Match / If-Modified-Since headers from a manifest
+    """
+    headers = {}
+    if manifest:
+        if manifest.get("etag"):
+            headers["If-None-Match"] = manifest["etag"]
+        if manifest.get("last_modified"):
+            headers["If-Modified-Since"] = manifest["last_modified"]
+    return headers
+
+
+def is_fresh(manifest: dict, max_age: float):
+    """
+    Whether a download recorded in a manifest was validated less than max_age seconds ago
+    """
+    if not manifest or max_age is None:
+        return False
+    return time.time() - manifest.get("checked", 0) < max_age
+
+
+def download_if_modified(url: str, filename: str, manifest: dict = None, session: requests.Session = None):
+    """
+    Download url to filename, sending a conditional GET if there is a manifest from an earlier download
+    :param url: the url to download
+    :param filename: where to save the file
+    :param manifest: the manifest from the previous download of this url
+    :param session: the requests Session to download with
+    :return: the new manifest, and whether the file was downloaded
+    """
+    headers = conditional_headers(manifest) if os.path.exists(filename) else {}
+    now = time.time()
+    with (session or requests).get(url, headers=headers, stream=True) as response:
+        if response.status_code == 304:
+            manifest = dict(manifest, checked=now)
+            return manifest, False
+        response.raise_for_status()
+        temp_file = f"{filename}.part"
+        try:
+            with open(temp_file, "wb") as fd:
+                size = stream_response(response, fd)
+        except IOError:
+            os.remove(temp_file)
+            raise
+        os.replace(temp_file, filename)
+        manifest = {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "content_length": size,
+            "downloaded": now,
+            "checked": now,
+        }
+        return manifest, True
+
+
+def write_parquet(data: pd.DataFrame, filename: str):
+    """
+    Write a dataframe to a parquet file. The file is written to a temporary name and then
+    moved into place, so other processes never see a partly written file
+    """
+    temp_file = f"{filename}.{os.getpid()}.part"
+    try:
+        data.to_parquet(temp_file)
+        os.replace(temp_file, filename)
+    finally:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+
+
+def read_parquet(filename: str, columns=None):
+    """
+    Read a parquet file, memory mapping it rather than reading it into a buffer first
+    """
+    return pd.read_parquet(filename, columns=columns, memory_map=True)
@@ -0,0 +1,118 @@
+import logging
+import threading
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+
+from .repo import Repo
+
+logger = logging.getLogger("ocandata")
+
+_DATA_DIR = Path(__file__).parent / "data"
+_EXPIRED_DATASETS = _DATA_DIR / "ExpiredDatasets.txt"
+_DELTA_FILE = "expired_datasets.txt"
+
+
+def hash_urls(urls):
+    """
+    :return: a uint64 hash of each url. The hashes are only compared within one process,
+    they are made from the url lists each time they are loaded
+    """
+    return pd.util.hash_array(np.asarray(urls, dtype=object))
+
+
+def read_urls(url_file):
+    """
+    Read a list of urls, one per line
+    """
+    with open(url_file, "r") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+class ExpiredDatasets(object):
+    """
+    The urls of datasets that are no longer on the portal, as a sorted array of 64 bit url hashes.
+    The array is built from the list of urls that ships with the package the first time it is used.
+    Urls found to be dead later are appended to a delta file in the repo, so adding them never
+    changes the shipped list
+    """
+
+    def __init__(self, url_file=_EXPIRED_DATASETS, delta_file=None):
+        """
+        :param url_file: the list of expired dataset urls, one per line
+        :param delta_file: the list of urls added since, by default in the user's repo
+        """
+        self.url_file = Path(url_file)
+        self.delta_file = Path(delta_file) if delta_file else Repo.at_user_home().dataset / _DELTA_FILE
+        self._hashes = None
+        self._lock = threading.Lock()
+
+    @property
+    def hashes(self):
+        if self._hashes is None:
+            with self._lock:
+                if self._hashes is None:
+                    if self.url_file.exists():
+                        urls = read_urls(self.url_file)
+                    else:
+                        logger.warning(f"There is no list of expired datasets at {self.url_file}, "
+                                       f"no datasets will be dropped as expired")
+                        urls = []
+                    if self.delta_file.exists():
+                        urls += read_urls(self.delta_file)
+                    self._hashes = np.unique(hash_urls(urls)) if urls else np.empty(0, dtype=np.uint64)
+        return self._hashes
+
+    def contains(self, urls):
+        """
+        :param urls: urls, e.g. a column of the inventory
+        :return: a boolean array that is True for the urls of expired datasets
+        """
+        urls = np.asarray(urls, dtype=object)
+        hashes = self.hashes
+        if len(hashes) == 0:
+            return np.zeros(len(urls), dtype=bool)
+        url_hashes = hash_urls(urls)
+        found = np.minimum(np.searchsorted(hashes, url_hashes), len(hashes) - 1)
+        return (hashes[found] == url_hashes) & pd.notnull(urls)
+
+    def __contains__(self, url: str):
+        return bool(self.contains([url])[0])
+
+    def add(self, urls: Iterable[str]):
+        """
+        Record urls of datasets that are no longer on the portal
+        :return: the number of urls that were not already recorded
+        """
+        urls = list(dict.fromkeys(url for url in urls if pd.notnull(url)))
+        new = [url for url, expired in zip(urls, self.contains(urls)) if not expired] if urls else []
+        if len(new) == 0:
+            return 0
+        with self._lock:
+            self.delta_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.delta_file, "a") as f:
+                f.writelines(f"{url}\n" for url in new)
+            self._hashes = np.union1d(self._hashes, hash_urls(new))
+        logger.info(f"Recorded {len(new)} expired datasets in {self.delta_file}")
+        return len(new)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def __repr__(self):
+        return f"<ExpiredDatasets: {len(self)} urls>"
+
+
+_expired_datasets = None
+
+
+def expired_datasets():
+    """
+    The expired datasets that the inventory drops, shared by every Inventory
+    """
+    global _expired_datasets
+    if _expired_datasets is None:
+        _expired_datasets = ExpiredDatasets()
+    return _expired_datasets
@@ -0,0 +1,197 @@
+import numpy as np
+import pandas as pd
+from typing import List
+
+
+class MemberHierarchy:
+    """
+    The parent / child hierarchy of the members of a statscan dimension,
+    e.g. the terminals that roll up to "Canadian National, System-wide".
+
+    The members are numbered in depth first order, so the descendants of a member are
+    the contiguous range of numbers from the member's start to its end. Selecting the
+    descendants of a member, or the ancestor of every member at a level, are array operations
+    """
+
+    def __init__(self, dimension: str, member_ids, parent_ids, names):
+        """
+        :param dimension: the column in the data that holds this dimension
+        :param member_ids: the Member ID of each member
+        :param parent_ids: the Parent Member ID of each member, or -1 if it has no parent
+        :param names: the Member Name of each member
+        """
+        self.dimension = dimension
+        self.member_ids = np.asarray(member_ids, dtype=np.int64)
+        self.names = np.asarray(names, dtype=object)
+        parent_ids = np.asarray(parent_ids, dtype=np.int64)
+
+        # Position of each member id, and the position of each member's parent
+        id_order = np.argsort(self.member_ids, kind="stable")
+        sorted_ids = self.member_ids[id_order]
+        found = np.searchsorted(sorted_ids, parent_ids)
+        found = np.minimum(found, len(sorted_ids) - 1)
+        has_parent = (parent_ids >= 0) & (sorted_ids[found] == parent_ids)
+        self.parent = np.where(has_parent, id_order[found], -1)
+        self._id_order, self._sorted_ids = id_order, sorted_ids
+        self._number_members()
+        # The first member with each name, for looking up members by name
+        names_index = pd.Index(self.names)
+        self._name_positions = pd.Series(np.arange(len(self.names)), index=names_index)[
+            ~names_index.duplicated()
+        ]
+
+    def _number_members(self):
+        n = len(self.parent)
+        # The children of each member, in metadata order
+        child_order = np.argsort(self.parent, kind="stable")
+        child_counts = np.bincount(self.parent + 1, minlength=n + 1)
+        child_starts = np.concatenate([[0], np.cumsum(child_counts)])
+        self.start = np.zeros(n, dtype=np.int64)
+        self.end = np.zeros(n, dtype=np.int64)
+        self.depth = np.zeros(n, dtype=np.int64)
+        self.order = np.zeros(n, dtype=np.int64)
+        number = 0
+        # Depth first walk from the roots, the children of the virtual root at -1
+        stack = [(p, 0) for p in child_order[child_starts[0]:child_starts[1]][::-1]]
+        while stack:
+            position, depth = stack.pop()
+            if position < 0:
+                self.end[-position - 1] = number
+                continue
+            self.start[position] = number
+            self.order[number] = position
+            self.depth[position] = depth
+            number += 1
+            stack.append((-position - 1, depth))
+            children = child_order[child_starts[position + 1]:child_starts[position + 2]]
+            stack.extend((child, depth + 1) for child in children[::-1])
+        if number < n:
+            raise ValueError(f"The {self.dimension} hierarchy has a cycle")
+        self.is_leaf = self.end - self.start == 1
+
+    @classmethod
+    def from_dimension_values(cls, dimension: str, dimension_values: pd.DataFrame):
+        """
+        Build the hierarchy from the rows of the DimensionValues metadata section for one dimension
+        """
+        parent_ids = pd.to_numeric(dimension_values["Parent Member ID"].replace("", np.nan))
+        return cls(
+            dimension,
+            member_ids=pd.to_numeric(dimension_values["Member ID"]).values,
+            parent_ids=parent_ids.fillna(-1).values,
+            names=dimension_values["Member Name"].values,
+        )
+
+    def position(self, member):
+        """
+        :param member: a member name, or a member id as an int
+        :return: the position of the member
+        """
+        if isinstance(member, (int, np.integer)):
+            found = np.searchsorted(self._sorted_ids, member)
+            if found < len(self._sorted_ids) and self._sorted_ids[found] == member:
+                return self._id_order[found]
+        elif member in self._name_positions.index:
+            return self._name_positions[member]
+        raise KeyError(f"{member} is not a member of {self.dimension}")
+
+    def positions(self, values):
+        """
+        :param values: member names, e.g. a column of statscan data
+        :return: the position of each member, or -1 for values that are not members
+        """
+        values = pd.Series(values)
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # Look up each category once and take the codes
+            category_positions = self._name_positions.reindex(values.cat.categories).fillna(-1).values
+            codes = values.cat.codes.values
+            return np.where(codes >= 0, category_positions[codes], -1).astype(np.int64)
+        return self._name_positions.reindex(values.values).fillna(-1).values.astype(np.int64)
+
+    def parent_of(self, member):
+        parent = self.parent[self.position(member)]
+        return None if parent < 0 else self.names[parent]
+
+    def children(self, member):
+        return self.names[self.parent == self.position(member)]
+
+    def descendants(self, member, include_self=False):
+        """
+        :return: the names of all the members below a member, in depth first order
+        """
+        position = self.position(member)
+        start = self.start[position] + (0 if include_self else 1)
+        return self.names[self.order[start:self.end[position]]]
+
+    def descendant_mask(self, values, member, include_self=True):
+        """
+        :param values: member names, e.g. a column of statscan data
+        :return: a boolean array that is True for the values that are descendants of the member
+        """
+        position = self.position(member)
+        positions = self.positions(values)
+        numbers = np.where(positions >= 0, self.start[positions], -1)
+        low = self.start[position] + (0 if include_self else 1)
+        return (numbers >= low) & (numbers < self.end[position])
+
+    def select(self, data: pd.DataFrame, member, include_self=True):
+        """
+        :return: the rows of the data for a member and all the members below it
+        """
+        return data[self.descendant_mask(data[self.dimension], member, include_self=include_self)]
+
+    def levels(self):
+        """
+        :return: the depth of each member, 0 for the members at the top of the hierarchy
+        """
+        return pd.Series(self.depth, index=self.names, name="level")
+
+    def ancestors_at(self, level: int):
+        """
+        :return: the position of the ancestor of each member at a level, or of the member itself
+        if it is at that level, or -1 if the member is above the level
+        """
+        ancestors = np.arange(len(self.parent))
+        for _ in range(int(self.depth.max(initial=0)) - level):
+            ancestors = np.where(self.depth[ancestors] > level, self.parent[ancestors], ancestors)
+        return np.where(self.depth >= level, ancestors, -1)
+
+    def rollup(
+        self,
+        data: pd.DataFrame,
+        level: int = 0,
+        value_column: str = "VALUE",
+        by: List[str] = None,
+        aggfunc="sum",
+        leaves_only=True,
+    ):
+        """
+        Roll the values of statscan data in long format up to the members at a level of the hierarchy
+        :param data: statscan data in long format
+        :param level: the level to roll up to, 0 is the top of the hierarchy
+        :param value_column: the column with the values
+        :param by: the other columns to group by, by default every column but the dimension, the values
+        and the control columns like VECTOR and COORDINATE, which are different for every member
+        :param aggfunc: how to combine the values of the members below each member at the level
+        :param leaves_only: only use the values of members with no children, so a total that
+        is published alongside its parts isn't counted twice
+        :return: a dataframe with the rolled up values
+        """
+        if by is None:
+            from .statscan import CONTROL_COLS
+            by = [col for col in data.columns if col not in [self.dimension, value_column] + CONTROL_COLS]
+        positions = self.positions(data[self.dimension])
+        ancestors = np.where(positions >= 0, self.ancestors_at(level)[positions], -1)
+        keep = ancestors >= 0
+        if leaves_only:
+            keep &= (positions >= 0) & self.is_leaf[positions]
+        rows = data.loc[keep, by + [value_column]].copy()
+        rows[self.dimension] = self.names[ancestors[keep]]
+        return rows.groupby(by + [self.dimension], observed=True, sort=False)[value_column] \
+            .agg(aggfunc).reset_index()
+
+    def __len__(self):
+        return len(self.names)
+
+    def __repr__(self):
+        return f"<MemberHierarchy: {self.dimension} {len(self)} members, {int(self.depth.max(initial=0)) + 1} levels>"
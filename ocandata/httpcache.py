@@ -0,0 +1,294 @@
+import hashlib
+import logging
+import os
+import time
+from pathlib import Path
+
+import requests
+
+from .config import HTTP_CACHE_TTL, HTTP_CACHE_MAX_BYTES
+from .datatools import read_manifest, write_manifest, conditional_headers
+from .repo import Repo
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger("ocandata")
+
+
+class _FileLock(object):
+    """
+    An exclusive lock on a file, held by one process at a time
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    def __enter__(self):
+        self.f = open(self.path, "a+")
+        if fcntl:
+            fcntl.flock(self.f.fileno(), fcntl.LOCK_EX)
+        else:
+            self.f.seek(0)
+            msvcrt.locking(self.f.fileno(), msvcrt.LK_LOCK, 1)
+        return self
+
+    def __exit__(self, *args):
+        if fcntl:
+            fcntl.flock(self.f.fileno(), fcntl.LOCK_UN)
+        else:
+            self.f.seek(0)
+            msvcrt.locking(self.f.fileno(), msvcrt.LK_UNLCK, 1)
+        self.f.close()
+
+
+class HttpCache(object):
+    """
+    A cache of http responses on disk, shared by every process that uses the same directory.
+    Each url has an entry with its ETag, Last-Modified and ttl, and the body is stored under the sha1
+    of its content, so pages with the same content are stored once. Within its ttl an entry is used
+    as is, after that it is revalidated with a conditional GET.
+    The bytes of the bodies and the number of entries that use each body are kept up to date as entries
+    are stored, so storing a page doesn't scan the cache. When the bodies take more than max_bytes
+    the least recently used entries are evicted
+    """
+
+    def __init__(self, directory, ttl: float = None, max_bytes: int = None, session: requests.Session = None):
+        """
+        :param directory: the directory to keep the cache in
+        :param ttl: seconds an entry is used before it is revalidated, for entries stored without a ttl of their own
+        :param max_bytes: the most bytes of response bodies to keep
+        :param session: the requests Session to fetch with
+        """
+        self.directory = Path(directory)
+        self.ttl = HTTP_CACHE_TTL if ttl is None else ttl
+        self.max_bytes = HTTP_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.session = session
+        self.entries = self.directory / "entries"
+        self.bodies = self.directory / "bodies"
+        self.entries.mkdir(parents=True, exist_ok=True)
+        self.bodies.mkdir(parents=True, exist_ok=True)
+        self._lock_file = self.directory / ".lock"
+        self._index_file = self.directory / "index.json"
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.evicted = 0
+
+    @classmethod
+    def in_repo(cls, repo: Repo = None, **options):
+        """
+        The cache in the http directory of a repo, by default the repo in the user's home directory
+        """
+        repo = repo or Repo.at_user_home()
+        return cls(repo.path / "http", **options)
+
+    def _entry_file(self, url: str):
+        return self.entries / f"{hashlib.sha1(url.encode()).hexdigest()}.json"
+
+    def _body_file(self, digest: str):
+        return self.bodies / digest[:2] / digest
+
+    def _references_file(self, digest: str):
+        return self.bodies / digest[:2] / f"{digest}.refs"
+
+    def _bodies(self):
+        return [body for body in self.bodies.glob("*/*") if not body.name.endswith((".part", ".refs"))]
+
+    def _lookup(self, url: str):
+        entry_file = self._entry_file(url)
+        entry = read_manifest(entry_file)
+        if not entry or entry.get("url") != url:
+            return None, None
+        try:
+            with open(self._body_file(entry["digest"]), "rb") as f:
+                content = f.read()
+        except FileNotFoundError:
+            # Evicted by another process since the entry was read
+            return None, None
+        return entry, content
+
+    def get_content(self, url: str, ttl: float = None):
+        """
+        Get a url through the cache
+        :param url: the url to get
+        :param ttl: seconds the cached response is used before it is revalidated. By default the ttl
+        the entry was stored with, and the response is stored with this ttl
+        :return: the body, and the cache entry with the encoding and validators, or None, None
+        if the server doesn't answer 200
+        """
+        entry, content = self._lookup(url)
+        now = time.time()
+        if entry and now - entry["checked"] < (entry.get("ttl", self.ttl) if ttl is None else ttl):
+            self.hits += 1
+            self._touch(url)
+            return content, entry
+        ttl = self.ttl if ttl is None else ttl
+        headers = conditional_headers(entry) if entry else {}
+        response = (self.session or requests).get(url, headers=headers)
+        if response.status_code == 304 and entry:
+            self.hits += 1
+            self.revalidated += 1
+            entry = dict(entry, checked=now, ttl=ttl)
+            with _FileLock(self._lock_file):
+                write_manifest(self._entry_file(url), entry)
+            return content, entry
+        self.misses += 1
+        if response.status_code != 200:
+            return None, None
+        return response.content, self._store(url, response, now, ttl)
+
+    def get(self, url: str, ttl: float = None):
+        """
+        :return: the text of the url, or None if the server doesn't answer 200
+        """
+        content, entry = self.get_content(url, ttl=ttl)
+        if content is None:
+            return None
+        return content.decode(entry.get("encoding") or "utf-8", errors="replace")
+
+    def _touch(self, url: str):
+        # The modified time of an entry is when it was last used, for evicting the least recently used
+        try:
+            os.utime(self._entry_file(url))
+        except FileNotFoundError:
+            pass
+
+    def _store(self, url: str, response: requests.Response, now: float, ttl: float):
+        content = response.content
+        digest = hashlib.sha1(content).hexdigest()
+        entry = {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "encoding": response.encoding,
+            "digest": digest,
+            "size": len(content),
+            "fetched": now,
+            "checked": now,
+            "ttl": ttl,
+        }
+        with _FileLock(self._lock_file):
+            index = self._read_index()
+            body_file = self._body_file(digest)
+            if not body_file.exists():
+                body_file.parent.mkdir(exist_ok=True)
+                temp_file = body_file.with_name(f"{digest}.part")
+                with open(temp_file, "wb") as f:
+                    f.write(content)
+                os.replace(temp_file, body_file)
+                index["bytes"] += len(content)
+            previous = read_manifest(self._entry_file(url))
+            previous_digest = previous.get("digest") if previous else None
+            write_manifest(self._entry_file(url), entry)
+            if previous_digest != digest:
+                self._add_reference(digest, 1, index)
+                if previous_digest:
+                    self._add_reference(previous_digest, -1, index)
+            if index["bytes"] > self.max_bytes:
+                self._evict(index)
+            write_manifest(self._index_file, index)
+        return entry
+
+    def _read_index(self):
+        """
+        The bytes of the bodies in the cache. Built by scanning the cache if there is no index yet.
+        Called with the lock held
+        """
+        index = read_manifest(self._index_file)
+        if index is None:
+            index = self._rebuild_index()
+        return index
+
+    def _rebuild_index(self):
+        references = {}
+        for entry_file in self.entries.glob("*.json"):
+            entry = read_manifest(entry_file)
+            if entry:
+                references[entry["digest"]] = references.get(entry["digest"], 0) + 1
+        total = 0
+        for body in self._bodies():
+            if body.name in references:
+                self._references_file(body.name).write_text(str(references[body.name]))
+                total += body.stat().st_size
+            else:
+                body.unlink()
+        index = {"bytes": total}
+        write_manifest(self._index_file, index)
+        return index
+
+    def _add_reference(self, digest: str, count: int, index: dict):
+        """
+        Change the number of entries that use a body, and remove the body when no entry uses it.
+        Called with the lock held
+        """
+        references_file = self._references_file(digest)
+        try:
+            references = int(references_file.read_text()) + count
+        except (FileNotFoundError, ValueError):
+            references = count
+        if references > 0:
+            references_file.write_text(str(references))
+            return
+        body_file = self._body_file(digest)
+        if body_file.exists():
+            index["bytes"] -= body_file.stat().st_size
+            body_file.unlink()
+        if references_file.exists():
+            references_file.unlink()
+
+    def size(self):
+        """
+        :return: the bytes of response bodies in the cache
+        """
+        index = read_manifest(self._index_file)
+        if index is None:
+            with _FileLock(self._lock_file):
+                index = self._read_index()
+        return index["bytes"]
+
+    def _evict(self, index: dict):
+        """
+        Remove the least recently used entries until the bodies fit in 90% of max_bytes,
+        so the entries aren't scanned again for every page stored once the cache is full.
+        Called with the lock held
+        """
+        target = self.max_bytes * 0.9
+        entries = sorted((entry_file.stat().st_mtime, entry_file) for entry_file in self.entries.glob("*.json"))
+        # Keep the most recently used entry, even if it is bigger than the budget
+        for _, entry_file in entries[:-1]:
+            if index["bytes"] <= target:
+                break
+            entry = read_manifest(entry_file)
+            entry_file.unlink()
+            self.evicted += 1
+            if entry:
+                self._add_reference(entry["digest"], -1, index)
+
+    def stats(self):
+        """
+        :return: the hits, misses, revalidations and evictions of this cache object,
+        and the entries and bytes in the cache, counted on disk
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidated": self.revalidated,
+            "evicted": self.evicted,
+            "entries": len(list(self.entries.glob("*.json"))),
+            "bytes": sum(body.stat().st_size for body in self._bodies()),
+        }
+
+    def clear(self):
+        with _FileLock(self._lock_file):
+            for entry_file in self.entries.glob("*.json"):
+                entry_file.unlink()
+            for body in self.bodies.glob("*/*"):
+                body.unlink()
+            write_manifest(self._index_file, {"bytes": 0})
+
+    def __repr__(self):
+        return f"<HttpCache at {self.directory}: {self.hits} hits, {self.misses} misses>"
@@ -1,21 +1,50 @@
 from functools import lru_cache
 
 import ipywidgets as widgets
+import numpy as np
 import pandas as pd
 from jinja2 import Template
 from bs4 import BeautifulSoup
 from .text import get_language
-from .core import get
+from .core import get, defaults
 from typing import List
-from .text import Bm25Index
-from .core import parallel
+from .text import Bm25Index, MultiFieldIndex
+from .snapshot import CsvSnapshot
+from .repo import Repo
+from .expired import expired_datasets
 import re
 import os
+import hashlib
+import json
+import logging
+import shutil
+
+logger = logging.getLogger("ocandata")
 
 _INVENTORY_URL = 'https://open.canada.ca/data/dataset/4ed351cf-95d8-4c10-97ac-6b3511f359b7/resource/d0df95a8-31a9-46c9-853b-6952819ec7b4/download/inventory.csv'
 
 _DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
-_EXPIRED_DATASETS = os.path.join(_DATA_DIR, 'ExpiredDatasets.txt')
+
+# The number of saved search indexes of each field that are kept, the most recently used
+_SEARCH_INDEXES_KEPT = 4
+
+# The fields that are searched, and how much a match in each counts
+SEARCH_FIELD_WEIGHTS = {'title': 2.0, 'description': 1.0, 'keywords': 1.5, 'publisher': 0.5}
+# How the search indexes split text into words, see text.preprocess
+SEARCH_TOKENIZER = 'nltk'
+
+
+_inventory_snapshot = None
+
+
+def inventory_snapshot():
+    """
+    The snapshot of the inventory csv in the user's repo
+    """
+    global _inventory_snapshot
+    if _inventory_snapshot is None:
+        _inventory_snapshot = CsvSnapshot(_INVENTORY_URL, 'inventory')
+    return _inventory_snapshot
 
 
 class Inventory:
@@ -23,67 +52,217 @@ class Inventory:
     The Open Canada Data Inventory
     """
 
-    def __init__(self, data: pd.DataFrame = None, language: str = 'en', sort_by_date=True):
-        self.language = language
+    def __init__(self, data: pd.DataFrame = None, language: str = 'en', sort_by_date=True, max_age: float = None,
+                 repo: Repo = None):
+        """
+        :param data: the inventory data, by default read from the snapshot in the user's repo
+        :param language: the language of the inventory, 'en' or 'fr'
+        :param sort_by_date: sort the datasets by release date, newest first
+        :param max_age: seconds the snapshot is used before it is revalidated in the background
+        :param repo: the repo to save the search indexes in. By default the snapshot's repo if the data
+        is read from the snapshot, otherwise the search indexes are not saved
+        """
         if data is None:
-            data = self.read_inventory(drop_expired=True)
+            data = self.read_inventory(drop_expired=True, max_age=max_age)
+            repo = repo or inventory_snapshot().repo
         data = data.dropna(subset=['released'])
         data = data[data.released.str.match('20[0-9]{2}')]
         if 'portal_url_en' in data.columns:
             data = data.dropna(subset=['portal_url_en'])
             data = data[data['portal_url_en'].str.match('http://')]
-        self.data = data
         if sort_by_date:
-            self.data = self.data.sort_values(['released'], ascending=False).reset_index(drop=True)
+            data = data.sort_values(['released'], ascending=False).reset_index(drop=True)
+        self._set_data(data, language, sort_by_date, repo)
 
+    def _set_data(self, data: pd.DataFrame, language: str, sort_by_date: bool, repo: Repo = None):
+        self.language = language
+        self.repo = repo
+        self.data = data
         self.english_cols = [col for col in data.columns if not col.endswith("_fr")]
         self.french_cols = [col for col in data.columns if not col.endswith("_en")]
         self.sort_by_date = sort_by_date
+        self._views = {}
+        self._filter_masks = {}
+        self._released_days = None
+
+    @classmethod
+    def _from_filtered(cls, data: pd.DataFrame, language: str = 'en', sort_by_date=True, repo: Repo = None):
+        """
+        An Inventory of data that is already filtered and sorted, like a language view or search results,
+        without filtering and sorting it again
+        """
+        inventory = cls.__new__(cls)
+        inventory._set_data(data, language, sort_by_date, repo)
+        return inventory
+
+    def _column_name(self, field: str):
+        """
+        The column of a field in this inventory's language, e.g. title_fr for a French inventory,
+        or title in a language view
+        """
+        return field if field in self.data.columns else f'{field}_{self.language}'
+
+    def _search_index_dir(self, column: pd.Series):
+        """
+        Where the search index of a column is saved in the repo, named by the language and a hash of what
+        the saved index depends on: the column's contents, the tokenizer and the language.
+        The field weights are only applied when searching, so changing them keeps the saved index
+        """
+        content_hash = hashlib.sha1(pd.util.hash_pandas_object(column, index=False).values.tobytes())
+        content_hash.update(json.dumps([SEARCH_TOKENIZER, self.language]).encode())
+        content_hash = content_hash.hexdigest()
+        return self.repo.dataset / 'search' / f'{column.name}-{self.language}-{content_hash[:16]}'
 
     def create_search_indexes(self):
         """
-        Create the search indexes for the inventory
+        Create the search indexes of the searched fields in the inventory, or load them from the repo
+        if the fields have not changed since they were saved. French fields are stemmed as French.
+        An inventory without a repo builds its indexes and doesn't save them
         """
+        self.search_indexes = {}
+        for field in SEARCH_FIELD_WEIGHTS:
+            col = self._column_name(field)
+            if col not in self.data.columns:
+                continue
+            directory = None if self.repo is None else self._search_index_dir(self.data[col])
+            index = None
+            if directory is not None:
+                try:
+                    index = Bm25Index.load(directory)
+                    # The modified time is when the index was last used, for pruning the least recently used
+                    os.utime(directory)
+                except FileNotFoundError:
+                    pass
+            if index is None:
+                print(f"Creating search index for {col}")
+                index = Bm25Index(self.data[col], tokenizer=SEARCH_TOKENIZER, workers=defaults.cpus,
+                                  language=self.language)
+                if directory is not None:
+                    index.save(directory)
+                    self._prune_search_indexes(directory)
+            self.search_indexes[field] = index
 
-        print("Creating search indexes")
-        description_col = 'description' if 'description' in self.data.columns else f'description_{self.language}'
-        self.search_indexes = {'description': Bm25Index(self.data[description_col])}
+    @staticmethod
+    def _prune_search_indexes(directory):
+        """
+        Remove the saved indexes of the same field and language as an index that was just saved,
+        except the most recently used, so the indexes of old versions of the inventory don't pile up
+        """
+        prefix = directory.name.rsplit('-', 1)[0]
+        saved = [path for path in directory.parent.glob(f'{prefix}-*') if path.is_dir()]
+        saved.sort(key=lambda path: path.stat().st_mtime, reverse=True)
+        for path in saved[_SEARCH_INDEXES_KEPT:]:
+            if path != directory:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def _value_mask(self, col: str, value):
+        """
+        The rows where a column has a value, made once for each column and value and kept
+        """
+        key = (col, value)
+        if key not in self._filter_masks:
+            self._filter_masks[key] = (self.data[col] == value).values
+        return self._filter_masks[key]
 
-    def search(self, search_term: str):
+    def _released(self):
+        """
+        The released dates as days, made once and kept
+        """
+        if self._released_days is None:
+            self._released_days = pd.to_datetime(self.data.released, errors='coerce').values.astype('datetime64[D]')
+        return self._released_days
+
+    def filter_mask(self, released_after=None, released_before=None, **filters):
+        """
+        The rows that pass some filters, as a boolean array
+        :param released_after: only datasets released after this date. A year or month means after the end of it,
+        so released_after='2018' is datasets released in 2019 or later
+        :param released_before: only datasets released before this date, or before the start of a year or month
+        :param filters: column=value for the rows with that value, or column=[values] for any of the values.
+        A column without a language suffix is in this inventory's language, e.g. publisher is publisher_en
+        :return: the mask, or None if there are no filters
+        """
+        mask = None
+        for field, values in filters.items():
+            col = self._column_name(field)
+            if col not in self.data.columns:
+                raise KeyError(f"Cannot filter on {field}, the inventory has no {col} column")
+            if not pd.api.types.is_list_like(values):
+                values = [values]
+            field_mask = np.zeros(len(self.data), dtype=bool)
+            for value in values:
+                field_mask |= self._value_mask(col, value)
+            mask = field_mask if mask is None else mask & field_mask
+        if released_after is not None or released_before is not None:
+            days = self._released()
+            date_mask = np.ones(len(self.data), dtype=bool)
+            if released_after is not None:
+                date_mask &= days > np.datetime64(pd.Period(released_after).end_time.date(), 'D')
+            if released_before is not None:
+                date_mask &= days < np.datetime64(pd.Period(released_before).start_time.date(), 'D')
+            mask = date_mask if mask is None else mask & date_mask
+        return mask
+
+    def search(self, search_term: str, n: int = 10, field_weights: dict = None,
+               released_after=None, released_before=None, **filters):
+        """
+        Search the titles, descriptions, keywords and publishers of the datasets.
+        The filters are applied before the best n datasets are picked, so there are n results
+        if n datasets pass the filters, e.g. search('housing', owner_org='cmhc-schl', released_after='2018')
+        :param search_term: the words to search for
+        :param n: the number of results
+        :param field_weights: how much a match in each field counts, in place of the weights in
+        SEARCH_FIELD_WEIGHTS. A weight of 0 leaves a field out
+        :param released_after: see filter_mask
+        :param released_before: see filter_mask
+        :param filters: see filter_mask
+        :return: an Inventory of the results, best first
+        """
         if not hasattr(self, 'search_indexes'):
             self.create_search_indexes()
-        bm25_index = self.search_indexes['description']
-        index, scores = bm25_index.get_scores(search_term, 10)
-        results = self.data.iloc[index].copy().reset_index(drop=True)
-        return Inventory(results, language=self.language, sort_by_date=False)
+        mask = self.filter_mask(released_after=released_after, released_before=released_before, **filters)
+        index = MultiFieldIndex(self.search_indexes, dict(SEARCH_FIELD_WEIGHTS, **(field_weights or {})))
+        positions, scores = index.top(search_term, n, mask)
+        results = self.data.iloc[positions].copy().reset_index(drop=True)
+        return Inventory._from_filtered(results, language=self.language, sort_by_date=False)
 
-    @lru_cache(maxsize=2)
-    def read_inventory(self, drop_expired: bool = True):
+    def read_inventory(self, drop_expired: bool = True, max_age: float = None):
         """
-        Read the inventory dataset from the Open Canada website
+        Read the inventory dataset from the snapshot of the Open Canada website in the repo
         :param drop_expired:
+        :param max_age: seconds the snapshot is used before it is revalidated in the background
         :return:
         """
-        data = pd.read_csv(_INVENTORY_URL) \
+        data = inventory_snapshot().load(max_age=max_age) \
             .drop(columns=['ref_number', 'size', 'eligible_for_release', 'user_votes']) \
             .rename(columns={'date_released': 'released', 'date_published': 'published'})
         data.portal_url_en = data.portal_url_en.astype(str)
         ## Remove expired datasets
         if drop_expired:
-            with open(_EXPIRED_DATASETS, 'r') as f:
-                expired_datasets = [l.strip() for l in f.readlines()]
-            data = data[~(data.portal_url_en.isin(expired_datasets) | (data.portal_url_fr.isin(expired_datasets)))]
+            expired = expired_datasets()
+            data = data[~(expired.contains(data.portal_url_en) | expired.contains(data.portal_url_fr))]
         return data
 
+    def _language_view(self, language: str):
+        """
+        The columns in one language, with the language suffix dropped from their names.
+        The view shares this inventory's filtered and sorted rows, and is made once and kept
+        """
+        if language not in self._views:
+            suffix, cols = ('_fr', self.french_cols) if language == 'fr' else ('_en', self.english_cols)
+            cols = [col for col in cols if col not in ['owner_org', 'owner_org_title']]
+            view = self.data[cols].rename(columns={col: col.replace(suffix, "") for col in cols})
+            self._views[language] = Inventory._from_filtered(view, language=language, sort_by_date=self.sort_by_date,
+                                                             repo=self.repo)
+        return self._views[language]
+
     @property
     def en(self):
         return self.EN
 
     @property
     def EN(self):
-        cols = [col for col in self.english_cols if not col in ['owner_org', 'owner_org_title']]
-        view = self.data[cols].rename(columns={col: col.replace("_en", "") for col in self.english_cols})
-        return Inventory(data=view, language='en', sort_by_date=self.sort_by_date)
+        return self._language_view('en')
 
     def _view(self):
         if self.language == 'fr':
@@ -96,9 +275,7 @@ class Inventory:
 
     @property
     def FR(self):
-        cols = [col for col in self.french_cols if not col in ['owner_org', 'owner_org_title']]
-        view = self.data[cols].rename(columns={col: col.replace("_fr", "") for col in self.french_cols})
-        return Inventory(data=view, language='fr', sort_by_date=self.sort_by_date)
+        return self._language_view('fr')
 
     def query(self, query_str):
         """
@@ -107,43 +284,64 @@ class Inventory:
         :return: A new Inventory instance with the results of the query
         """
         results = self.data.query(query_str)
-        return Inventory(results)
+        return Inventory._from_filtered(results, language=self.language, sort_by_date=self.sort_by_date)
 
-    def _create_dataset(self, record):
+    def _dataset_fields(self, record):
         if 'title_en' in self.data.columns:
-            return Dataset(title=record.title_en, description=record.description_en,
-                           released=record.released, published=record.published,
-                           publisher=record.publisher_en, url=record.portal_url_en)
+            return record.title_en, record.description_en, record.publisher_en, record.portal_url_en
         elif 'title_fr' in self.data.columns:
-            return Dataset(title=record.title_fr, description=record.description_fr,
-                           released=record.released, published=record.published,
-                           publisher=record.publisher_fr, url=record.portal_url_fr)
-        else:
-            return Dataset(title=record.title, description=record.description,
-                           released=record.released, published=record.published,
-                           publisher=record.publisher, url=record.portal_url)
-
-
-
-    def get_active_inactive_datasets(self, inventory_data: pd.DataFrame):
-        indexes = range(len(inventory_data))
-        def _get_dataset(index):
-            obj = inventory_data.iloc[index]
-            dataset: Dataset = self._create_dataset(obj)
-            return dataset
-
-        datasets = parallel(_get_dataset, indexes)
+            return record.title_fr, record.description_fr, record.publisher_fr, record.portal_url_fr
+        return record.title, record.description, record.publisher, record.portal_url
+
+    def _create_dataset(self, record, crawled: dict = None):
+        title, description, publisher, url = self._dataset_fields(record)
+        resources = None
+        result = (crawled or {}).get(url)
+        if result is not None:
+            resources = result.resources if result.resources is not None \
+                else status_resources(title, url, get_language(self.language), result.status)
+        return Dataset(title=title, description=description,
+                       released=record.released, published=record.published,
+                       publisher=publisher, url=url, langauge=self.language, resources=resources)
+
+    def crawl_resources(self, inventory_data: pd.DataFrame = None, checkpoint: str = None, **crawler_options):
+        """
+        Crawl the portal pages of the datasets for their resources, many at a time
+        :param inventory_data: the rows of the inventory to crawl, by default all of them
+        :param checkpoint: a file to record each crawled page in, so an interrupted crawl can resume
+        :param crawler_options: options for the Crawler, like per_host_limit or timeout
+        :return: a dict of dataset url to CrawlResult
+        """
+        from .crawler import Crawler
+        if inventory_data is None:
+            inventory_data = self.data
+        urls = [self._dataset_fields(record)[3] for record in inventory_data.itertuples()]
+        crawler = Crawler(checkpoint=checkpoint, **crawler_options)
+        return crawler.run([url for url in urls if is_page_url(url)])
+
+    def get_active_inactive_datasets(self, inventory_data: pd.DataFrame, checkpoint: str = None):
+        crawled = self.crawl_resources(inventory_data, checkpoint=checkpoint)
+        datasets = [self._create_dataset(record, crawled) for record in inventory_data.itertuples()]
         return [dataset for dataset in datasets if dataset.is_active()], \
                [dataset for dataset in datasets if not dataset.is_active()],
 
-    def get_active_dataset_urls(self, inventory_data: pd.DataFrame):
-        active_datasets, inactive_datasets = self.get_active_inactive_datasets(inventory_data)
+    def get_active_dataset_urls(self, inventory_data: pd.DataFrame, checkpoint: str = None):
+        active_datasets, inactive_datasets = self.get_active_inactive_datasets(inventory_data, checkpoint=checkpoint)
         return list(set([dataset.url for dataset in active_datasets]))
 
-    def get_inactive_dataset_urls(self, inventory_data: pd.DataFrame):
-        active_datasets, inactive_datasets = self.get_active_inactive_datasets(inventory_data)
+    def get_inactive_dataset_urls(self, inventory_data: pd.DataFrame, checkpoint: str = None):
+        active_datasets, inactive_datasets = self.get_active_inactive_datasets(inventory_data, checkpoint=checkpoint)
         return list(set([dataset.url for dataset in inactive_datasets]))
 
+    def expire_inactive_datasets(self, inventory_data: pd.DataFrame, checkpoint: str = None):
+        """
+        Record the datasets that are deleted or can't be loaded as expired, so the inventory drops them
+        :return: the urls of the inactive datasets
+        """
+        urls = self.get_inactive_dataset_urls(inventory_data, checkpoint=checkpoint)
+        expired_datasets().add(urls)
+        return urls
+
     def __len__(self):
         return len(self.data)
 
@@ -247,7 +445,8 @@ class Dataset:
                  published=None,
                  publisher: str = None,
                  url: str = None,
-                 langauge: str = 'en'):
+                 langauge: str = 'en',
+                 resources: pd.DataFrame = None):
         self.title = title
         self.description = description
         self.released = released
@@ -255,7 +454,10 @@ class Dataset:
         self.publisher = publisher
         self.url = url
         self.language = get_language(langauge)
-        resources = load_dataset_resources(self)
+        if resources is None:
+            resources = catalog_resources(self)
+        if resources is None:
+            resources = load_dataset_resources(self)
         self.resources = DataFrameHolder(resources,
                                          item_getter=Resource.from_series
                                          )
@@ -339,6 +541,54 @@ def get_deleted_message(soup: BeautifulSoup):
 _RESOURCE_COLUMNS = ['Resource Name', 'Resource Type', 'Format', 'Language', 'Link', 'Status']
 
 
+def is_page_url(url: str):
+    """
+    :return: True if the dataset url is a portal page with a resource table, not a file
+    """
+    return not (url.endswith('csv') or url.endswith('xlsx'))
+
+
+def parse_dataset_page(html: str):
+    """
+    Parse a dataset page from the portal
+    :param html: the html of the page
+    :return: the resource table, or None, the status of the dataset if it is known,
+    and the link to follow to the dataset's page if the resource table is not on this one
+    """
+    resource_table = find_dataset_resource_table(html)
+    if resource_table is not None:
+        return resource_table, 'Active', None
+    soup = BeautifulSoup(html, features='lxml')
+    deleted_message = get_deleted_message(soup)
+    if deleted_message:
+        return None, deleted_message, None
+    return None, None, find_dataset_link(soup)
+
+
+def status_resources(title: str, url: str, language, status: str):
+    """
+    The resources of a dataset with no resource table, a single row with the status of the dataset
+    """
+    if status == 'Deleted':
+        return pd.DataFrame([(title, '', '', '', url, status)], columns=_RESOURCE_COLUMNS)
+    return pd.DataFrame([(title, 'Dataset', 'Unknown', language, url, status)], columns=_RESOURCE_COLUMNS)
+
+
+def catalog_resources(dataset):
+    """
+    Look up the resources of a dataset in the resource catalog, built by python -m ocandata.catalog
+    :return: the resources, or None if the dataset is not in the catalog
+    """
+    from .catalog import default_catalog
+    catalog = default_catalog()
+    if not dataset.url or not catalog.exists():
+        return None
+    resources = catalog.resources(dataset.url)
+    if resources is not None and resources['Status'].iloc[0] != 'Active':
+        return status_resources(dataset.title, dataset.url, dataset.language, resources['Status'].iloc[0])
+    return resources
+
+
 @lru_cache(maxsize=512)
 def load_dataset_resources(dataset):
     try:
@@ -350,29 +600,15 @@ def load_dataset_resources(dataset):
             return pd.DataFrame([(dataset.title, 'Dataset', 'XLSX', dataset.language, dataset.url, 'Active')],
                                 columns=_RESOURCE_COLUMNS)
         else:
-            html = get(dataset.url)
-            resource_table = find_dataset_resource_table(html)
+            resource_table, status, dataset_link = parse_dataset_page(get(dataset.url))
+            if resource_table is None and status is None:
+                resource_table, status, dataset_link = parse_dataset_page(get(dataset_link))
             if resource_table is not None:
                 return resource_table
-            else:
-                soup = BeautifulSoup(html, features='lxml')
-                deleted_message = get_deleted_message(soup)
-                if deleted_message:
-                    return pd.DataFrame([(dataset.title, '', '', '', dataset.url, deleted_message)],
-                                        columns=_RESOURCE_COLUMNS)
-                else:
-                    dataset_link = find_dataset_link(soup)
-                    html = get(dataset_link)
-                    resource_table = find_dataset_resource_table(html)
-                    if resource_table is not None:
-                        return resource_table
-                    else:
-                        return pd.DataFrame([(dataset.title, 'Dataset', 'Unknown', dataset.language, dataset.url, 'Error')],
-                                        columns=_RESOURCE_COLUMNS)
+            return status_resources(dataset.title, dataset.url, dataset.language, status or 'Error')
     except Exception as e:
-        # TODO: log error
-        return pd.DataFrame([(dataset.title, 'Dataset', 'Unknown', dataset.language, dataset.url, 'Error')],
-                            columns=_RESOURCE_COLUMNS)
+        logger.warning(f"Could not load the resources of {dataset.url}: {e!r}")
+        return status_resources(dataset.title, dataset.url, dataset.language, 'Error')
 
 
 def find_dataset_resource_table(html: str):
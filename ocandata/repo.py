@@ -1,7 +1,16 @@
 from pathlib import Path
 import re
-from .datatools import unzip_data, hash
-from .config import DOTPATH
+import shutil
+from .datatools import (
+    hash,
+    extract_zip,
+    zip_members,
+    read_manifest,
+    write_manifest,
+    is_fresh,
+    download_if_modified,
+)
+from .config import DOTPATH, DOWNLOAD_MAX_AGE
 
 _REPO_NAME = "repo"
 
@@ -34,14 +43,70 @@ class Repo:
         root = Path.home() / dotpath
         return cls(root)
 
-    def unzip(self, url, resource_id: str = None):
+    def download(self, url, resource_id: str = None, max_age: float = None, session=None):
+        """
+        Download a zip file into the repo, reusing the copy on disk if it is still current.
+        The ETag and Last-Modified of each download are kept in a manifest next to the zip.
+        Within max_age seconds of the last check the copy on disk is used as is,
+        after that a conditional GET revalidates it with the server
+        :param url: the url of the zip file
+        :param resource_id: the id to store the download under
+        :param max_age: seconds a download is used before it is revalidated
+        :param session: the requests Session to download with
+        :return: the path to the zip file, and whether it changed
+        """
+        if not resource_id:
+            resource_id = hash(url)
+        if max_age is None:
+            max_age = DOWNLOAD_MAX_AGE
+        zip_file = self.downloaded / f"{resource_id}.zip"
+        manifest_file = self.downloaded / f"{resource_id}.json"
+        manifest = read_manifest(manifest_file)
+        if manifest and manifest.get("url") != url:
+            manifest = None
+        if manifest and (
+            not zip_file.exists()
+            or zip_file.stat().st_size != manifest.get("content_length")
+        ):
+            manifest = None
+        if manifest and is_fresh(manifest, max_age):
+            return zip_file, False
+        manifest, changed = download_if_modified(url, str(zip_file), manifest, session=session)
+        write_manifest(manifest_file, manifest)
+        return zip_file, changed
+
+    def download_manifest(self, resource_id: str):
+        """
+        :return: the manifest of the last download of this resource, or None
+        """
+        return read_manifest(self.downloaded / f"{resource_id}.json")
+
+    def unzip(self, url, resource_id: str = None, max_age: float = None, session=None):
         if not resource_id:
             resource_id = hash(url)
+        zip_file, changed = self.download(url, resource_id, max_age=max_age, session=session)
+        downloaded = self.download_manifest(resource_id)["downloaded"]
         extract_dir = self.extracted / resource_id
+        extracted = read_manifest(extract_dir / "extracted.json")
+        if extracted and extracted["downloaded"] == downloaded:
+            return tuple(extracted["files"])
+        if extract_dir.exists():
+            shutil.rmtree(extract_dir)
         print("Extracting files to", extract_dir)
-        files = unzip_data(url, extract_dir)
+        files = extract_zip(zip_file, extract_dir)
+        write_manifest(extract_dir / "extracted.json", {"downloaded": downloaded, "files": files})
         return files
 
+    def zip_members(self, url, resource_id: str = None, max_age: float = None, session=None):
+        """
+        Download a zip file into the repo like unzip, but don't extract it.
+        :return: a ZipMember for each file in the zip, to be read straight out of the zip
+        """
+        if not resource_id:
+            resource_id = hash(url)
+        zip_file, changed = self.download(url, resource_id, max_age=max_age, session=session)
+        return zip_members(zip_file)
+
     def __repr__(self):
         return f"Repo at {self.path}"
 
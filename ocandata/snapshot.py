@@ -0,0 +1,119 @@
+import logging
+import threading
+import time
+from pathlib import Path
+
+import pandas as pd
+import requests
+
+from .config import INVENTORY_MAX_AGE
+from .datatools import (
+    read_manifest,
+    write_manifest,
+    is_fresh,
+    download_if_modified,
+    read_parquet,
+    write_parquet,
+)
+from .repo import Repo
+
+logger = logging.getLogger("ocandata")
+
+
+def _read_csv(csv_file):
+    data = pd.read_csv(csv_file, low_memory=False)
+    # Parquet needs a single type per column, and some text columns have numbers in them
+    for col in data.columns:
+        if data[col].dtype == object:
+            data[col] = data[col].where(data[col].isnull(), data[col].astype(str))
+    return data
+
+
+class CsvSnapshot(object):
+    """
+    A local parquet copy of a csv file on the web. The csv is downloaded into the repo and converted
+    once, and the parquet file is read with memory mapping after that. Within max_age seconds
+    of the last check the copy is used as is. After that it is still used, and a conditional GET
+    in a background thread downloads and converts the csv again only if its ETag has changed
+    """
+
+    def __init__(self, url: str, name: str, repo: Repo = None, session: requests.Session = None):
+        """
+        :param url: the url of the csv file
+        :param name: the name to store the snapshot under in the repo
+        :param repo: the repo to keep the snapshot in
+        :param session: the requests Session to download with
+        """
+        self.url = url
+        self.name = name
+        self.repo = repo or Repo.at_user_home()
+        self.session = session
+        self.csv_file: Path = self.repo.downloaded / f"{name}.csv"
+        self.manifest_file: Path = self.repo.downloaded / f"{name}.json"
+        self.parquet_file: Path = self.repo.dataset / f"{name}.parquet"
+        self._lock = threading.Lock()
+        self._refresh_thread = None
+
+    def _manifest(self):
+        manifest = read_manifest(self.manifest_file)
+        if manifest and manifest.get("url") == self.url and self.parquet_file.exists():
+            return manifest
+        return None
+
+    def refresh(self):
+        """
+        Check the csv with the server, and download and convert it if it changed
+        :return: whether the snapshot changed
+        """
+        with self._lock:
+            manifest = self._manifest()
+            manifest, changed = download_if_modified(
+                self.url, str(self.csv_file), manifest, session=self.session
+            )
+            if changed or not self.parquet_file.exists():
+                start = time.time()
+                write_parquet(_read_csv(self.csv_file), str(self.parquet_file))
+                logger.info(f"Converted {self.url} to {self.parquet_file} in {time.time() - start:.2f}s")
+            write_manifest(self.manifest_file, manifest)
+            return changed
+
+    def _refresh_in_background(self):
+        def _refresh():
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning(f"Could not refresh {self.name} from {self.url}: {e}")
+
+        if self._refresh_thread is None or not self._refresh_thread.is_alive():
+            self._refresh_thread = threading.Thread(target=_refresh, daemon=True)
+            self._refresh_thread.start()
+
+    def wait(self, timeout: float = None):
+        """
+        Wait for a background refresh to finish
+        """
+        if self._refresh_thread is not None:
+            self._refresh_thread.join(timeout)
+
+    def load(self, max_age: float = None, background: bool = True, columns=None):
+        """
+        Load the snapshot, downloading it the first time
+        :param max_age: seconds the snapshot is used before it is revalidated with the server
+        :param background: revalidate a stale snapshot in a background thread and return it as is,
+        rather than waiting for the refresh
+        :param columns: the columns to read, or None for all of them
+        :return: a Dataframe
+        """
+        max_age = INVENTORY_MAX_AGE if max_age is None else max_age
+        manifest = self._manifest()
+        if not manifest:
+            self.refresh()
+        elif not is_fresh(manifest, max_age):
+            if background:
+                self._refresh_in_background()
+            else:
+                self.refresh()
+        return read_parquet(str(self.parquet_file), columns=columns)
+
+    def __repr__(self):
+        return f"<CsvSnapshot {self.name} of {self.url}>"
@@ -1,10 +1,35 @@
 import numpy as np
 import pandas as pd
+import io
 import os
 import re
+import csv
+import json
+import codecs
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
+import requests
 from .repo import Repo
+from .hierarchy import MemberHierarchy
+from .datatools import (
+    hash,
+    read_manifest,
+    write_manifest,
+    read_parquet,
+    write_parquet,
+    ZipMember,
+    open_binary,
+    create_session,
+    format_rate,
+)
 import logging
+from typing import List
 from chardet import detect
+from pandas.api.types import union_categoricals
 
 logger = logging.getLogger("ocandata")
 
@@ -39,42 +64,395 @@ STATSCAN_TYPES = {
 }
 
 
-def read_statscan_csv(statcan_fn: str):
-    return pd.read_csv(statcan_fn, dtype=STATSCAN_TYPES, low_memory=False)
+# The Geography dimension is the GEO column in the data file
+_GEOGRAPHY_DIMENSIONS = ["Geography", "Géographie"]
+
+
+def read_statscan_csv(statcan_fn, chunksize: int = None, usecols=None, dimension_dtypes: dict = None):
+    """
+    Read a statscan data file
+    :param statcan_fn: the statscan data file, an open file, or a ZipMember
+    :param chunksize: if set, return an iterator of dataframes with this many rows each.
+    A ZipMember should be opened with open_binary first so it can be closed when the chunks are read.
+    The dimension_dtypes are not applied to chunks, use apply_dimension_dtypes on each chunk
+    :param usecols: the columns to read, or None for all of them
+    :param dimension_dtypes: a CategoricalDtype for each dimension column, from StatscanMetadata.dimension_dtypes
+    :return: a dataframe, or an iterator of dataframes if chunksize is set
+    """
+    if isinstance(statcan_fn, ZipMember) and chunksize is None:
+        with open_binary(statcan_fn) as f:
+            return read_statscan_csv(f, usecols=usecols, dimension_dtypes=dimension_dtypes)
+    if isinstance(statcan_fn, ZipMember):
+        statcan_fn = open_binary(statcan_fn)
+    dtype = dict(STATSCAN_TYPES)
+    dtype.update({column: "category" for column in dimension_dtypes or {}})
+    data = pd.read_csv(
+        statcan_fn, dtype=dtype, low_memory=False, chunksize=chunksize, usecols=usecols
+    )
+    if chunksize is None and dimension_dtypes:
+        data = apply_dimension_dtypes(data, dimension_dtypes)
+    return data
+
+
+def apply_dimension_dtypes(data: pd.DataFrame, dimension_dtypes: dict):
+    """
+    Give the dimension columns the categories from the metadata, in the metadata's order.
+    Values that are missing from the metadata are kept, as extra categories at the end
+    :param data: statscan data with the dimension columns read as categories
+    :param dimension_dtypes: a CategoricalDtype for each dimension column
+    """
+    for column, dtype in dimension_dtypes.items():
+        if column not in data.columns:
+            continue
+        values = data[column]
+        if not isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.astype("category")
+        if values.dtype == dtype:
+            continue
+        extra = values.cat.categories.difference(dtype.categories)
+        if len(extra) > 0:
+            logger.debug(f"{column} has {len(extra)} values that are not in the metadata")
+        data[column] = values.cat.set_categories(dtype.categories.append(extra))
+    return data
+
+
+def file_dimension_dtypes(statcan_fn, dimension_dtypes: dict, chunksize: int = 250_000):
+    """
+    The dimension dtypes of a whole data file: the categories from the metadata, then the values in the file
+    that are missing from the metadata, the same categories apply_dimension_dtypes gives the whole file.
+    Only the dimension columns are read, so the chunks of a file can all be given the same dtypes
+    :param statcan_fn: the statscan data file or a ZipMember
+    :param dimension_dtypes: a CategoricalDtype for each dimension column, from StatscanMetadata.dimension_dtypes
+    :return: a dict of column name to CategoricalDtype
+    """
+    if not dimension_dtypes:
+        return {}
+    extras = {column: set() for column in dimension_dtypes}
+    with open_binary(statcan_fn) as f, read_statscan_csv(
+        f, chunksize=chunksize, usecols=lambda column: column in dimension_dtypes, dimension_dtypes=dimension_dtypes
+    ) as chunks:
+        for chunk in chunks:
+            for column in chunk.columns:
+                extras[column].update(chunk[column].cat.categories.difference(dimension_dtypes[column].categories))
+    dtypes = {}
+    for column, dtype in dimension_dtypes.items():
+        extra = sorted(extras[column])
+        if extra:
+            logger.debug(f"{column} has {len(extra)} values that are not in the metadata")
+        dtypes[column] = pd.CategoricalDtype(dtype.categories.append(pd.Index(extra, dtype=object))) if extra else dtype
+    return dtypes
+
+
+def _float32_is_lossless(values: np.ndarray, decimals: np.ndarray = None):
+    """
+    Whether float64 values survive a round trip through float32. If the number of decimals
+    each value was published with is known, the float32 value only has to round back to it
+    """
+    with np.errstate(over="ignore", invalid="ignore"):
+        single = values.astype(np.float32).astype(np.float64)
+        if decimals is not None:
+            scale = np.power(10.0, decimals)
+            single = np.round(single * scale) / scale
+    return bool(np.array_equal(single, values, equal_nan=True))
+
+
+def compact_statscan_data(data: pd.DataFrame):
+    """
+    Store the columns of statscan data in the smallest dtypes that hold them exactly.
+    VALUE becomes float32 when every value rounds back to its DECIMALS, other float columns
+    become float32 when they round trip exactly, integer columns are downcast, and text
+    columns with many repeated values become categories
+    :param data: statscan data, in long format to make use of the DECIMALS column
+    :return: the compacted data
+    """
+    data = data.copy(deep=False)
+    decimals = None
+    if "DECIMALS" in data.columns and pd.api.types.is_integer_dtype(data["DECIMALS"]):
+        decimals = data["DECIMALS"].to_numpy()
+    for column in data.columns:
+        values = data[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            continue
+        if pd.api.types.is_integer_dtype(values):
+            data[column] = pd.to_numeric(values, downcast="integer")
+        elif pd.api.types.is_float_dtype(values) and values.dtype != np.float32:
+            column_decimals = decimals if column == "VALUE" else None
+            if _float32_is_lossless(values.to_numpy(dtype=np.float64), column_decimals):
+                data[column] = values.astype(np.float32)
+        elif pd.api.types.is_string_dtype(values) or pd.api.types.is_object_dtype(values):
+            if values.nunique() <= len(values) // 2:
+                data[column] = values.astype("category")
+    return data
+
+
+def memory_usage(data: pd.DataFrame):
+    """
+    :return: the bytes used by each column of a dataframe, including the index
+    """
+    return data.memory_usage(index=True, deep=True)
+
+
+def memory_report(before: pd.DataFrame, after: pd.DataFrame):
+    """
+    Compare the bytes used by each column of a dataframe before and after it was compacted
+    :return: a dataframe with the dtype and bytes of each column before and after, and a Total row
+    """
+    bytes_before, bytes_after = memory_usage(before), memory_usage(after)
+    report = pd.DataFrame(
+        {
+            "dtype_before": before.dtypes.astype(str),
+            "bytes_before": bytes_before,
+            "dtype_after": after.dtypes.astype(str),
+            "bytes_after": bytes_after,
+        },
+        index=bytes_before.index,
+    )
+    report.loc["Total"] = ["", bytes_before.sum(), "", bytes_after.sum()]
+    report.loc["Index", ["dtype_before", "dtype_after"]] = ""
+    report["bytes_before"] = report["bytes_before"].astype(np.int64)
+    report["bytes_after"] = report["bytes_after"].astype(np.int64)
+    report["saved"] = 1 - report["bytes_after"] / report["bytes_before"]
+    return report
+
+
+def _ref_date_mask(ref_dates: pd.Series, criteria):
+    dates = pd.to_datetime(ref_dates)
+    if isinstance(criteria, tuple):
+        start, end = criteria
+        mask = np.ones(len(dates), dtype=bool)
+        if start is not None:
+            mask &= (dates >= pd.Timestamp(start)).values
+        if end is not None:
+            mask &= (dates <= pd.Timestamp(end)).values
+        return mask
+    if isinstance(criteria, str):
+        criteria = [criteria]
+    return dates.isin(pd.to_datetime(list(criteria))).values
+
+
+def filter_statscan_data(data: pd.DataFrame, filters: dict):
+    """
+    Select the rows of statscan data that match the filters
+    :param data: statscan data in long format
+    :param filters: a dict of column to values. REF_DATE takes a (start, end) tuple,
+    either end can be None, or a list of dates. Other columns take a list of values
+    :return: the matching rows
+    """
+    mask = np.ones(len(data), dtype=bool)
+    for column, criteria in filters.items():
+        if column == "REF_DATE":
+            mask &= _ref_date_mask(data[column], criteria)
+        else:
+            if isinstance(criteria, str):
+                criteria = [criteria]
+            mask &= data[column].isin(criteria).values
+    return data[mask]
+
+
+def concat_statscan_data(frames):
+    """
+    Concatenate chunks of statscan data, keeping the categorical columns categorical
+    """
+    frames = list(frames)
+    if len(frames) == 0:
+        return pd.DataFrame()
+    data = pd.concat(frames, ignore_index=True)
+    for column, dtype in frames[0].dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype) and not isinstance(data[column].dtype, pd.CategoricalDtype):
+            data[column] = union_categoricals([frame[column] for frame in frames])
+    return data
+
+
+def statscan_row_hashes(data: pd.DataFrame):
+    """
+    Hash every row of statscan data, so rows can be compared across downloads.
+    Categorical columns hash by their values, so the hashes don't depend on the categories
+    :return: a uint64 array with a hash for each row
+    """
+    return pd.util.hash_pandas_object(data, index=False).values
+
+
+def _partition_name(ref_date: str):
+    # REF_DATE can be a fiscal year like 2018/2019, which can't go in a file name as is
+    return re.sub(r"[^0-9A-Za-z_-]", "_", ref_date)
+
+
+def read_statscan_csv_filtered(
+    statcan_fn, filters: dict = None, usecols=None, chunksize: int = 250_000, dimension_dtypes: dict = None
+):
+    """
+    Read the rows of a statscan data file that match the filters. The file is read in chunks
+    and each chunk is filtered as it is read, so only the matching rows are kept
+    :param statcan_fn: the statscan data file or a ZipMember
+    :param filters: a dict of column to values, see filter_statscan_data
+    :param usecols: the columns to read, or None for all of them
+    :param chunksize: the number of rows to read at a time
+    :param dimension_dtypes: a CategoricalDtype for each dimension column
+    :return: a dataframe with the matching rows
+    """
+    with open_binary(statcan_fn) as f, read_statscan_csv(
+        f, chunksize=chunksize, usecols=usecols, dimension_dtypes=dimension_dtypes
+    ) as chunks:
+        return concat_statscan_data(
+            filter_statscan_data(apply_dimension_dtypes(chunk, dimension_dtypes or {}), filters or {})
+            for chunk in chunks
+        )
+
+
+def _column_codes(column: pd.Series):
+    """
+    Integer codes for the values in a column, with missing values getting a code of their own
+    :return: the codes, and the number of distinct codes
+    """
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return column.cat.codes.to_numpy().astype(np.int64) + 1, len(column.cat.categories) + 1
+    codes, uniques = pd.factorize(column, use_na_sentinel=False)
+    return codes.astype(np.int64), max(len(uniques), 1)
+
+
+def _group_codes(data: pd.DataFrame):
+    """
+    Number the distinct rows of a dataframe in the order they first appear
+    :return: the group code of each row, and the position of the first row of each group
+    """
+    combined = np.zeros(len(data), dtype=np.int64)
+    size = 1
+    for col in data.columns:
+        codes, n = _column_codes(data[col])
+        if size * n >= 2 ** 62:
+            # Renumber the combinations seen so far so the combined code can't overflow
+            combined, uniques = pd.factorize(combined)
+            size = len(uniques)
+        combined = combined * n + codes
+        size *= n
+    group_codes, uniques = pd.factorize(combined)
+    first_rows = np.flatnonzero(~pd.Series(combined).duplicated().to_numpy())
+    return group_codes, first_rows
+
+
+def _pivot_codes(column: pd.Series):
+    """
+    Integer codes for the pivot column, numbered in the order of the wide columns.
+    The observed categories are kept in category order, other values are sorted,
+    and missing values go last
+    :return: the codes and the wide column labels
+    """
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        codes = column.cat.codes.to_numpy().astype(np.int64)
+        categories = column.cat.categories
+        observed = np.bincount(codes[codes >= 0], minlength=len(categories)) > 0
+        renumbered = np.cumsum(observed) - 1
+        labels = list(categories[observed])
+        codes = np.where(codes >= 0, renumbered[codes], -1)
+    else:
+        codes, uniques = pd.factorize(column, sort=True)
+        labels = list(uniques)
+    if (codes < 0).any():
+        codes = np.where(codes < 0, len(labels), codes)
+        labels.append(np.nan)
+    return codes, labels
 
 
 def to_wide_format(statscan_data: pd.DataFrame, pivot_column):
     """
-    Converts statscan data to wide format
+    Converts statscan data to wide format.
+    Every distinct combination of the non control columns becomes a row, keeping the control
+    columns of its first row, and each member of the pivot column becomes a column holding the
+    maximum VALUE for that row and member. The rows are numbered from their integer codes and the
+    values scattered into a preallocated array, so the data is only grouped once
     :param statscan_data:
     :return: a dataframe with the statscan data converted to wide format
     """
-    base = statscan_data.copy()
     group_cols = [
         col
-        for col in base.columns.tolist()
+        for col in statscan_data.columns.tolist()
         if col not in CONTROL_COLS + [pivot_column, "VALUE"]
     ]
-    # Assign a group number
-    base["group"] = base.groupby(group_cols).ngroup()
-
-    # Pivot on the group, turning the element into columns
-    values = base.pivot_table(
-        index="group",
-        columns=pivot_column,
-        values="VALUE",
-        aggfunc=np.max,
-        dropna=False,
+    group_codes, first_rows = _group_codes(statscan_data[group_cols])
+    pivot_codes, labels = _pivot_codes(statscan_data[pivot_column])
+
+    value = statscan_data["VALUE"].to_numpy()
+    dtype = value.dtype if np.issubdtype(value.dtype, np.floating) else np.float64
+    values = np.full((len(first_rows), len(labels)), np.nan, dtype=dtype)
+    np.fmax.at(values, (group_codes, pivot_codes), value.astype(dtype, copy=False))
+
+    base = (
+        statscan_data.drop(columns=[pivot_column, "VALUE"])
+        .iloc[first_rows]
+        .reset_index(drop=True)
     )
-    # Drop Element and VALUE columns and drop duplicates
-    base = base.drop(columns=[pivot_column, "VALUE"]).drop_duplicates(subset=group_cols)
-    # Now merge with values
-    return base.merge(values, on="group").drop(columns="group")
+    return pd.concat([base, pd.DataFrame(values, columns=labels)], axis=1)
 
 
 _STATSCAN_DATASET_RE = re.compile("(\d+)(\-(eng|fra))?\.(\w+)+")
 
 
+def _vector_numbers(vectors):
+    # Vector ids are a v followed by a number, so they can be searched as integers
+    return pd.to_numeric(pd.Series(vectors, dtype=str).str.lstrip("vV"), errors="raise").values.astype(np.int64)
+
+
+class VectorIndex(object):
+    """
+    The rows of statscan data sorted by (VECTOR, REF_DATE), with the range of rows of each vector,
+    so one vector's time series is a binary search and a slice of the sorted data
+    """
+
+    def __init__(self, data: pd.DataFrame, vectors: np.ndarray, starts: np.ndarray):
+        """
+        :param data: the data, sorted by vector then date
+        :param vectors: the number of each vector, in sorted order
+        :param starts: the first row of each vector, followed by the number of rows
+        """
+        self.data = data
+        self.vectors = vectors
+        self.starts = starts
+
+    @classmethod
+    def from_statscan_data(cls, data: pd.DataFrame, vector_column: str = "VECTOR"):
+        """
+        :param data: statscan data in long format, with the VECTOR column
+        :return: a VectorIndex of the data. The VECTOR column is kept in the index, not the data
+        """
+        numbers = _vector_numbers(data[vector_column])
+        date_column = "REF_DATE" if "REF_DATE" in data.columns else "Date"
+        dates = pd.factorize(data[date_column], sort=True)[0]
+        order = np.lexsort((dates, numbers))
+        numbers = numbers[order]
+        vectors, starts = np.unique(numbers, return_index=True)
+        starts = np.append(starts, len(numbers))
+        data = data.iloc[order].drop(columns=[vector_column]).reset_index(drop=True)
+        return cls(data, vectors, starts)
+
+    def _locate(self, vector):
+        number = _vector_numbers([vector])[0] if isinstance(vector, str) else int(vector)
+        found = np.searchsorted(self.vectors, number)
+        if found == len(self.vectors) or self.vectors[found] != number:
+            raise KeyError(f"{vector} is not in the data")
+        return found
+
+    def __getitem__(self, vector):
+        """
+        :param vector: a vector id like v1014136365, or its number
+        :return: the rows of the vector, ordered by date
+        """
+        found = self._locate(vector)
+        return self.data.iloc[self.starts[found]:self.starts[found + 1]]
+
+    def __contains__(self, vector):
+        try:
+            self._locate(vector)
+            return True
+        except (KeyError, ValueError):
+            return False
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def __repr__(self):
+        return f"<VectorIndex: {len(self)} vectors, {len(self.data)} rows>"
+
+
 class StatscanUrl:
     def __init__(
         self,
@@ -130,15 +508,71 @@ statscan_zipurl_re = re.compile(r".*[0-9]+(\-(en|fr)\w+?)?\.zip.*?")
 
 
 class StatscanZip(object):
-    def __init__(self, url: str, repo: Repo = None):
+    def __init__(self, url: str, repo: Repo = None, extract=True, session: requests.Session = None):
+        """
+        :param url: the url of the statscan zip file
+        :param repo: the repo to download the zip file to
+        :param extract: whether to extract the zip file in the repo. If False the data and metadata
+        are read straight out of the zip file, which saves writing the uncompressed files to disk
+        :param session: the requests Session to download with
+        """
         assert statscan_zipurl_re.fullmatch(url)
         self.url: str = url
         self.url_info: StatscanUrl = StatscanUrl.parse_from_filename(url)
         self.repo: Repo = repo or Repo.at_user_home()
+        self.extract = extract
+        self.session = session
+        self._vector_lock = threading.Lock()
+
+    def __getstate__(self):
+        # Locks can't be pickled, so a StatscanZip sent to another process gets a new one
+        state = dict(self.__dict__)
+        state.pop("_vector_lock", None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._vector_lock = threading.Lock()
 
     def dimensions(self):
         return self.get_metadata().dimensions
 
+    def dimension_columns(self):
+        """
+        :return: the column in the data file for each dimension
+        """
+        names = self.dimensions()["Dimension name"].tolist()
+        return ["GEO" if name in _GEOGRAPHY_DIMENSIONS else name for name in names]
+
+    def hierarchy(self, dimension: str):
+        """
+        Get the member hierarchy of a dimension, built from the Member ID and Parent Member ID
+        in the metadata. The hierarchy is built once and kept
+        :param dimension: the dimension name or its column, e.g. "Companies", "Geography" or "GEO"
+        :return: a MemberHierarchy on the dimension's column in the data from get_data, so "Geo" for
+        the geography
+        """
+        if not hasattr(self, "_hierarchies"):
+            setattr(self, "_hierarchies", {})
+        dimensions = self.dimensions()
+        columns = self.dimension_columns()
+        if dimension in dimensions["Dimension name"].values:
+            column = columns[dimensions["Dimension name"].tolist().index(dimension)]
+        elif dimension in _GEOGRAPHY_DIMENSIONS or dimension == "Geo":
+            column = "GEO"
+        else:
+            column = dimension
+        if column not in columns:
+            raise ValueError(f"{dimension} is not one of the dimensions {columns}")
+        if column not in self._hierarchies:
+            dimension_id = dimensions["Dimension ID"].values[columns.index(column)]
+            dimension_values = self.get_metadata().dimension_values
+            members = dimension_values[dimension_values["Dimension ID"] == dimension_id]
+            # get_data renames GEO, so build the hierarchy on the column the data will have
+            data_column = "Geo" if column == "GEO" else column
+            self._hierarchies[column] = MemberHierarchy.from_dimension_values(data_column, members)
+        return self._hierarchies[column]
+
     def primary_dimension(self):
         return self.get_metadata().pivot_column()
 
@@ -151,9 +585,21 @@ class StatscanZip(object):
             if col in ["REF_DATE"]:
                 data[col] = pd.to_datetime(data[col]).dt.normalize()
 
-    def _fetch_data(self):
+    def _resource_key(self):
+        # English and French zips share a resource id, so keep their downloads apart
         resource_id: str = self.url_info.resourceid
-        data_file, metadata_file = self.repo.unzip(self.url, resource_id=resource_id)
+        if self.url_info.language:
+            resource_id = f"{resource_id}-{self.url_info.language}"
+        return resource_id
+
+    def _fetch_data(self):
+        resource_id: str = self._resource_key()
+        if self.extract:
+            data_file, metadata_file = self.repo.unzip(self.url, resource_id=resource_id, session=self.session)
+        else:
+            data_file, metadata_file = self.repo.zip_members(
+                self.url, resource_id=resource_id, session=self.session
+            )
         return data_file, metadata_file
 
     def transform_statscan_data(
@@ -164,15 +610,20 @@ class StatscanZip(object):
         drop_control_cols=True,
     ):
         primary_dimension = self.primary_dimension()
-        units_of_measure = (
-            data[[primary_dimension, "UOM"]]
-            .drop_duplicates()
-            .set_index(primary_dimension)
-            .sort_index()
-        )
-        setattr(self, "units_of_measure", units_of_measure)
+        if primary_dimension in data.columns and "UOM" in data.columns:
+            units_of_measure = (
+                data[[primary_dimension, "UOM"]]
+                .drop_duplicates()
+                .set_index(primary_dimension)
+                .sort_index()
+            )
+            setattr(self, "units_of_measure", units_of_measure)
         if wide:
             data = to_wide_format(data, pivot_column=self.primary_dimension())
+        return self._finish_statscan_data(data, index_col=index_col, drop_control_cols=drop_control_cols)
+
+    @classmethod
+    def _finish_statscan_data(cls, data: pd.DataFrame, index_col: str = None, drop_control_cols=True):
         if index_col:
             data = data.set_index(index_col)
 
@@ -180,10 +631,9 @@ class StatscanZip(object):
             drop_cols = [col for col in CONTROL_COLS if col in data.columns]
             data = data.drop(columns=drop_cols)
 
-        # Convert types
+        # Convert types. Missing dates become NaT, so every chunk of a file gets the same dtype
         if 'REF_DATE' in data:
-            if not data['REF_DATE'].isnull().any():
-                data['REF_DATE'] = pd.to_datetime(data['REF_DATE'])
+            data['REF_DATE'] = pd.to_datetime(data['REF_DATE'])
 
         data = data.rename(columns={'REF_DATE': 'Date', 'GEO':'Geo'})
         return data
@@ -198,100 +648,649 @@ class StatscanZip(object):
             self._set_metadata(metadata_file)
         return self.metadata
 
+    def _check_filters(self, filters: dict, columns: List[str], wide: bool):
+        dimension_columns = self.dimension_columns()
+        checked = {}
+        for column, criteria in (filters or {}).items():
+            if column in _GEOGRAPHY_DIMENSIONS:
+                column = "GEO"
+            if column != "REF_DATE" and column not in dimension_columns:
+                raise ValueError(
+                    f"Cannot filter on '{column}'. Filter on REF_DATE or one of the dimensions {dimension_columns}"
+                )
+            checked[column] = criteria
+        usecols = None
+        if columns is not None:
+            usecols = list(dict.fromkeys(list(columns) + list(checked)))
+            if wide:
+                missing = [col for col in ["REF_DATE"] + dimension_columns if col not in usecols]
+                if missing:
+                    raise ValueError(f"The wide format needs the dimension columns {missing}")
+                usecols = list(dict.fromkeys(usecols + ["VALUE", "UOM"]))
+        return checked, usecols
+
+    def _materialized_path(self, **options):
+        """
+        The path in the repo's dataset directory where the transformed data is kept.
+        The file name is a hash of the options that were used to transform the data
+        """
+        name = hash(json.dumps(options, sort_keys=True))[:16]
+        return self.repo.dataset / self._resource_key() / f"{name}.parquet"
+
+    def _source_version(self, max_age: float = None):
+        """
+        Identify the version of the zip file in the repo, so a materialized dataset
+        can be checked against the zip file it was created from
+        """
+        resource_id = self._resource_key()
+        self.repo.download(self.url, resource_id, max_age=max_age, session=self.session)
+        manifest = self.repo.download_manifest(resource_id)
+        return {key: manifest.get(key) for key in ["etag", "last_modified", "content_length", "downloaded"]}
+
+    def _read_materialized(self, path, source_version: dict):
+        manifest = read_manifest(f"{path}.json")
+        if not manifest or manifest["source"] != source_version or not path.exists():
+            return None
+        units_of_measure = manifest.get("units_of_measure")
+        if units_of_measure:
+            units = pd.DataFrame(units_of_measure["records"]).set_index(units_of_measure["index"])
+            setattr(self, "units_of_measure", units)
+        report = manifest.get("memory_report")
+        if report:
+            report = pd.DataFrame(report["data"], index=report["index"], columns=report["columns"])
+            setattr(self, "_memory_report", report.astype({"bytes_before": np.int64, "bytes_after": np.int64,
+                                                           "saved": np.float64}))
+        return read_parquet(path)
+
+    def _write_materialized(self, path, source_version: dict, data: pd.DataFrame):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            write_parquet(data, path)
+        except Exception as e:
+            logger.warning(f"Could not save {self} to {path}: {e}")
+            return
+        manifest = {"url": self.url, "source": source_version}
+        units = getattr(self, "units_of_measure", None)
+        if units is not None:
+            manifest["units_of_measure"] = {
+                "index": units.index.name,
+                "records": units.reset_index().astype(str).to_dict("records"),
+            }
+        report = getattr(self, "_memory_report", None)
+        if report is not None:
+            # Kept so memory_report() works when the compacted data is read back from the repo
+            manifest["memory_report"] = json.loads(report.to_json(orient="split"))
+        write_manifest(f"{path}.json", manifest)
+
     def get_data(
         self,
         wide=True,
         index_col: str = None,
-        drop_control_cols=True
+        drop_control_cols=True,
+        filters: dict = None,
+        columns: List[str] = None,
+        materialize=True,
+        compact=False,
     ):
         """
         Get the data from this zipfile
         :param wide: whether to make this a wide dataset
         :param index_col: the column to use as the index
         :param drop_control_cols: whether to drop the control columns
+        :param filters: only read the rows that match these filters, a dict of column to values.
+        REF_DATE takes a (start, end) tuple or a list of dates, the dimensions take a list of members.
+        e.g. {"GEO": ["Canada"], "REF_DATE": ("2019-01-01", None)}
+        :param columns: only read these columns of the data file
+        :param materialize: whether to keep the transformed data in the repo's dataset directory.
+        The next call, from this or any other process, reads that file instead of transforming
+        the data again, until the zip file changes
+        :param compact: whether to store the columns in the smallest dtypes that hold them exactly,
+        see compact_statscan_data. memory_report() shows the bytes saved
         :return: a Dataframe containing the data
         """
-        if not hasattr(self, "data"):
+        if filters or columns is not None:
             data_file, metadata_file = self._fetch_data()
             self._set_metadata(metadata_file)
-            data_raw = read_statscan_csv(data_file)
-            data = self.transform_statscan_data(
+            filters, usecols = self._check_filters(filters, columns, wide)
+            data_raw = read_statscan_csv_filtered(
+                data_file, filters=filters, usecols=usecols, dimension_dtypes=self.metadata.dimension_dtypes()
+            )
+            if columns is not None and not wide:
+                data_raw = data_raw[[col for col in data_raw.columns if col in columns]]
+            if compact:
+                data_raw = self._compact(data_raw)
+            return self.transform_statscan_data(
                 data_raw,
                 wide=wide,
                 index_col=index_col,
                 drop_control_cols=drop_control_cols,
             )
+        if not hasattr(self, "data"):
+            data = None
+            if materialize:
+                options = dict(wide=wide, index_col=index_col, drop_control_cols=drop_control_cols)
+                if compact:
+                    options["compact"] = True
+                path = self._materialized_path(**options)
+                source_version = self._source_version()
+                data = self._read_materialized(path, source_version)
+            if data is None:
+                data_file, metadata_file = self._fetch_data()
+                self._set_metadata(metadata_file)
+                data_raw = read_statscan_csv(data_file, dimension_dtypes=self.metadata.dimension_dtypes())
+                if compact:
+                    data_raw = self._compact(data_raw)
+                data = self.transform_statscan_data(
+                    data_raw,
+                    wide=wide,
+                    index_col=index_col,
+                    drop_control_cols=drop_control_cols,
+                )
+                if materialize:
+                    self._write_materialized(path, source_version, data)
             setattr(self, "data", data)
         return self.data
 
+    def _partitions_dir(self):
+        return self.repo.dataset / self._resource_key() / "partitions"
+
+    def refresh(self, max_age: float = None):
+        """
+        Refresh the copy of this table kept in the repo, one parquet file per REF_DATE.
+        A new download is compared to the stored partitions row by row on (VECTOR, REF_DATE),
+        and only the partitions that changed are written again
+        :param max_age: seconds a download is used before it is checked with the server again
+        :return: a RefreshReport with the vectors that were added, revised or terminated
+        and the rows that are new or revised
+        """
+        directory = self._partitions_dir()
+        manifest = read_manifest(directory / "partitions.json") or {
+            "source": None,
+            "partitions": {},
+            "vectors": [],
+            "terminated": [],
+        }
+        report = RefreshReport(self.url)
+        source_version = self._source_version(max_age=max_age)
+        if manifest["source"] == source_version:
+            return report
+
+        data_file, metadata_file = self._fetch_data()
+        self._set_metadata(metadata_file)
+        data = read_statscan_csv(data_file, dimension_dtypes=self.metadata.dimension_dtypes())
+        hashes = statscan_row_hashes(data)
+        vectors = data["VECTOR"].astype(str).values
+        codes, ref_dates = pd.factorize(data["REF_DATE"].astype(str))
+        rows_by_date = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[rows_by_date], np.arange(len(ref_dates) + 1))
+
+        directory.mkdir(parents=True, exist_ok=True)
+        stored = manifest["partitions"]
+        partitions = {}
+        changed_rows = np.zeros(len(data), dtype=bool)
+        revised = set()
+        for code, ref_date in enumerate(ref_dates):
+            rows = rows_by_date[bounds[code]:bounds[code + 1]]
+            digest = hashlib.sha1(hashes[rows].tobytes()).hexdigest()
+            partition = {"file": f"{_partition_name(ref_date)}.parquet", "rows": len(rows), "digest": digest}
+            partitions[ref_date] = partition
+            previous = stored.get(ref_date)
+            if previous and previous["digest"] == digest:
+                continue
+            if previous:
+                old = read_parquet(directory / previous["file"])
+                old_hashes = pd.Series(statscan_row_hashes(old), index=old["VECTOR"].astype(str).values)
+                matched = old_hashes.reindex(vectors[rows])
+                changed = matched.isnull().values | (matched.values != hashes[rows])
+                revised.update(vectors[rows][changed & matched.notnull().values])
+                revised.update(old_hashes.index.difference(vectors[rows]))
+                report.ref_dates_revised.append(ref_date)
+            else:
+                changed = np.ones(len(rows), dtype=bool)
+                report.ref_dates_added.append(ref_date)
+            changed_rows[rows[changed]] = True
+            write_parquet(data.iloc[rows].reset_index(drop=True), directory / partition["file"])
+
+        for ref_date, previous in stored.items():
+            if ref_date not in partitions:
+                report.ref_dates_removed.append(ref_date)
+                if (directory / previous["file"]).exists():
+                    (directory / previous["file"]).unlink()
+
+        all_vectors = pd.unique(vectors)
+        if "TERMINATED" in data.columns:
+            terminated = pd.unique(vectors[data["TERMINATED"].notnull().values])
+        else:
+            terminated = []
+        report.added = sorted(set(all_vectors) - set(manifest["vectors"]))
+        report.terminated = sorted(
+            (set(manifest["vectors"]) - set(all_vectors)) | (set(terminated) - set(manifest["terminated"]))
+        )
+        report.revised = sorted(revised - set(report.added) - set(report.terminated))
+        report.rows = data[changed_rows].reset_index(drop=True)
+        write_manifest(
+            directory / "partitions.json",
+            {
+                "url": self.url,
+                "source": source_version,
+                "partitions": partitions,
+                "vectors": sorted(all_vectors),
+                "terminated": sorted(terminated),
+            },
+        )
+        return report
+
+    def read_partitions(self, ref_dates: List[str] = None):
+        """
+        Read the partitions kept by refresh, in long format as they are in the data file
+        :param ref_dates: the REF_DATEs to read, or None for all of them
+        :return: a Dataframe, or None if the table has not been refreshed
+        """
+        directory = self._partitions_dir()
+        manifest = read_manifest(directory / "partitions.json")
+        if not manifest:
+            return None
+        partitions = manifest["partitions"]
+        if ref_dates is None:
+            ref_dates = sorted(partitions)
+        frames = [read_parquet(directory / partitions[ref_date]["file"]) for ref_date in ref_dates
+                  if ref_date in partitions]
+        return concat_statscan_data(frames)
+
+    def _compact(self, data: pd.DataFrame):
+        compacted = compact_statscan_data(data)
+        setattr(self, "_memory_report", memory_report(data, compacted))
+        return compacted
+
+    def memory_report(self):
+        """
+        Show the bytes used by each column of the data before and after compacting it.
+        If the data was not loaded with compact=True this shows what compacting it would save
+        :return: a dataframe with the dtype and bytes of each column before and after
+        """
+        if hasattr(self, "_memory_report"):
+            return self._memory_report
+        # The data from get_data may already be compacted, so compare the data file as it is read
+        data_file, metadata_file = self._fetch_data()
+        self._set_metadata(metadata_file)
+        data = read_statscan_csv(data_file, dimension_dtypes=self.metadata.dimension_dtypes())
+        return memory_report(data, compact_statscan_data(data))
+
+    def iter_data(
+        self,
+        chunksize: int = 100_000,
+        index_col: str = None,
+        drop_control_cols=True
+    ):
+        """
+        Iterate over the data from this zipfile in chunks, without loading all of it at once.
+        The chunks are in long format, since the rows of a wide row can span chunks.
+        Every chunk has the same dtypes, so the chunks can be concatenated
+        :param chunksize: the number of rows in each chunk
+        :param index_col: the column to use as the index
+        :param drop_control_cols: whether to drop the control columns
+        :return: a generator of Dataframes
+        """
+        data_file, metadata_file = self._fetch_data()
+        self._set_metadata(metadata_file)
+        dimension_dtypes = file_dimension_dtypes(data_file, self.metadata.dimension_dtypes(), chunksize=chunksize)
+        with open_binary(data_file) as f, read_statscan_csv(
+            f, chunksize=chunksize, dimension_dtypes=dimension_dtypes
+        ) as chunks:
+            for chunk in chunks:
+                yield self._finish_statscan_data(
+                    apply_dimension_dtypes(chunk, dimension_dtypes),
+                    index_col=index_col,
+                    drop_control_cols=drop_control_cols,
+                )
+
+    get_data_chunks = iter_data
+
+    def vector_index(self):
+        """
+        Get the index of the data by vector, built the first time it is used and kept.
+        It is built from the loaded data if get_data loaded it in long format with the control columns,
+        otherwise from the data file, e.g. when the loaded data is wide
+        :return: a VectorIndex of the data in long format, without the other control columns
+        """
+        with self._vector_lock:
+            if not hasattr(self, "_vector_index"):
+                loaded = getattr(self, "data", None)
+                # Wide data keeps one VECTOR per pivoted row, so only long data can be reused
+                long_columns = {"VECTOR", "Date", "VALUE", self.primary_dimension()}
+                if loaded is not None and long_columns.issubset(loaded.columns):
+                    control_cols = [col for col in CONTROL_COLS if col in loaded.columns and col != "VECTOR"]
+                    data = loaded.drop(columns=control_cols)
+                else:
+                    data_file, metadata_file = self._fetch_data()
+                    self._set_metadata(metadata_file)
+                    data = read_statscan_csv(data_file, dimension_dtypes=self.metadata.dimension_dtypes())
+                    vectors = data["VECTOR"]
+                    data = self._finish_statscan_data(data, drop_control_cols=True)
+                    data["VECTOR"] = vectors
+                setattr(self, "_vector_index", VectorIndex.from_statscan_data(data))
+        return self._vector_index
+
+    def vector(self, vector):
+        """
+        Get the time series of one vector
+        :param vector: the vector id, e.g. v1014136365
+        :return: a Dataframe with the vector's rows ordered by date. It is a slice of the index,
+        so copy it before changing it
+        """
+        return self.vector_index()[vector]
+
+    def vectors(self, vectors: List[str]):
+        """
+        Get the time series of several vectors
+        :param vectors: the vector ids
+        :return: a Dataframe with the rows of each vector ordered by date, and a VECTOR column
+        """
+        index = self.vector_index()
+        frames = [index[vector].assign(VECTOR=vector) for vector in vectors]
+        if not frames:
+            return index.data.iloc[:0].assign(VECTOR=pd.Series(dtype=str))
+        return pd.concat(frames, ignore_index=True)
+
+    @classmethod
+    def fetch_many(
+        cls,
+        urls: List[str],
+        repo: Repo = None,
+        max_workers: int = 8,
+        per_host_limit: int = 4,
+        retries: int = 3,
+        backoff_factor: float = 0.5,
+        extract=True,
+    ):
+        """
+        Download many statscan zip files concurrently and load their metadata.
+        The downloads share one pooled Session that retries with backoff,
+        at most max_workers are in flight, and at most per_host_limit to any one host
+        :param urls: the urls of the zip files
+        :param repo: the repo to download the zip files to
+        :param max_workers: the number of downloads in flight at once
+        :param per_host_limit: the number of downloads in flight to the same host
+        :param retries: the number of times to retry a failed request
+        :param backoff_factor: retries wait backoff_factor * 2 ** (retry - 1) seconds
+        :param extract: whether to extract the zip files in the repo
+        :return: a FetchReport with the loaded StatscanZips and the errors for the urls that failed
+        """
+        repo = repo or Repo.at_user_home()
+        session = create_session(pool_size=per_host_limit, retries=retries, backoff_factor=backoff_factor)
+        host_limits = {
+            urlparse(url).netloc: threading.BoundedSemaphore(per_host_limit) for url in urls
+        }
+        report = FetchReport()
+        start = time.time()
+
+        def _fetch(url):
+            statscan_zip = cls(url, repo=repo, extract=extract, session=session)
+            resource_id = statscan_zip._resource_key()
+            with host_limits[urlparse(url).netloc]:
+                zip_file, changed = repo.download(url, resource_id, session=session)
+            downloaded = repo.download_manifest(resource_id)["content_length"] if changed else 0
+            statscan_zip.get_metadata()
+            # The shared session is closed when the fetch is done, later downloads use their own
+            statscan_zip.session = None
+            return statscan_zip, downloaded
+
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = {executor.submit(_fetch, url): url for url in urls}
+                for future in as_completed(futures):
+                    url = futures[future]
+                    try:
+                        statscan_zip, downloaded = future.result()
+                        report.zips[url] = statscan_zip
+                        report.bytes_downloaded += downloaded
+                    except Exception as e:
+                        logger.warning(f"Could not fetch {url}: {e!r}")
+                        report.errors[url] = repr(e)
+        finally:
+            session.close()
+        report.elapsed = time.time() - start
+        logger.info(str(report))
+        return report
+
     def __repr__(self):
         return f"<{self.__class__.__name__}: {self.url}>"
 
 
+class FetchReport(object):
+    """
+    The results of StatscanZip.fetch_many
+    """
+
+    def __init__(self):
+        self.zips = {}
+        self.errors = {}
+        self.bytes_downloaded = 0
+        self.elapsed = 0.0
+
+    @property
+    def throughput(self):
+        """
+        :return: the bytes downloaded per second over the whole fetch
+        """
+        return self.bytes_downloaded / self.elapsed if self.elapsed > 0 else 0.0
+
+    def __repr__(self):
+        return (
+            f"<FetchReport: {len(self.zips)} fetched, {len(self.errors)} failed, "
+            f"{self.bytes_downloaded:,} bytes in {self.elapsed:.2f}s "
+            f"({format_rate(self.bytes_downloaded, self.elapsed)})>"
+        )
+
+
+class RefreshReport(object):
+    """
+    What changed in a table since the last refresh. A vector is added when it is new to the table,
+    revised when any of its stored observations changed, and terminated when StatCan stops
+    publishing it or flags it as terminated
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self.added: List[str] = []
+        self.revised: List[str] = []
+        self.terminated: List[str] = []
+        self.ref_dates_added: List[str] = []
+        self.ref_dates_revised: List[str] = []
+        self.ref_dates_removed: List[str] = []
+        self.rows: pd.DataFrame = None
+
+    @property
+    def changed(self):
+        return bool(self.ref_dates_added or self.ref_dates_revised or self.ref_dates_removed)
+
+    def __repr__(self):
+        return (
+            f"<RefreshReport: {len(self.added)} vectors added, {len(self.revised)} revised, "
+            f"{len(self.terminated)} terminated, {len(self.ref_dates_added)} new dates, "
+            f"{len(self.ref_dates_revised)} revised dates>"
+        )
+
+
+_METADATA_SECTIONS = {
+    "CubeInfo": ["Cube Title", "Product Id"],
+    "Dimensions": ["Dimension ID", "Dimension name"],
+    "DimensionValues": ["Dimension ID", "Member Name"],
+    "Notes": ["Note ID", "Note"],
+}
+
+# The sections parsed from recently used metadata files, keyed by file and version
+_metadata_cache = OrderedDict()
+_metadata_cache_lock = threading.Lock()
+_METADATA_CACHE_SIZE = 32
+
+
+def _metadata_file_key(metadata_file):
+    """
+    A key that changes when the metadata file changes
+    """
+    if isinstance(metadata_file, ZipMember):
+        path, member = os.path.abspath(metadata_file.zip_filename), metadata_file.name
+    else:
+        path, member = os.path.abspath(metadata_file), None
+    stat = os.stat(path)
+    return path, member, stat.st_mtime_ns, stat.st_size
+
+
+def _section_name(columns):
+    for name, section_columns in _METADATA_SECTIONS.items():
+        if list_contains(columns, section_columns):
+            return name
+
+
+def _section_frame(columns, rows):
+    row_width = max([len(row) for row in rows])
+    if row_width > len(columns):
+        rows = [row[: len(columns)] for row in rows]
+    elif len(columns) > row_width:
+        columns = columns[:row_width]
+    return pd.DataFrame(data=rows, columns=columns)
+
+
+def iter_metadata_sections(metadata_file, wanted=None):
+    """
+    Read the sections of a statscan metadata file in the order they are in the file. Sections are
+    separated by blank lines and start with a header row. The file is tokenized as csv so quoted
+    values can contain commas. Only the wanted sections are turned into dataframes, and reading
+    stops once they are found
+    :param metadata_file: the metadata file or a ZipMember
+    :param wanted: the names of the sections to read, or None for every section in the file
+    :return: yields the name of each section and a dataframe. The sections that are not in
+    _METADATA_SECTIONS, like the Symbol Legend, are named by the first column of their header
+    """
+    wanted = None if wanted is None else set(wanted)
+    found = set()
+    encoding = get_encoding_type(metadata_file)
+    with open_binary(metadata_file) as raw, io.TextIOWrapper(raw, encoding=encoding, newline="") as f:
+        columns, name, rows = None, None, []
+        for row in csv.reader(f):
+            if columns is None:
+                if row:
+                    columns, name, rows = row, _section_name(row) or row[0], []
+                continue
+            if row:
+                if wanted is None or name in wanted:
+                    rows.append(row)
+                continue
+            if (wanted is None or name in wanted) and rows:
+                yield name, _section_frame(columns, rows)
+                found.add(name)
+                if wanted is not None and wanted.issubset(found):
+                    return
+            columns = None
+        if columns is not None and (wanted is None or name in wanted) and rows:
+            yield name, _section_frame(columns, rows)
+
+
+def read_metadata_sections(metadata_file, wanted=None, everything=False):
+    """
+    Read sections from a statscan metadata file, see iter_metadata_sections
+    :param metadata_file: the metadata file or a ZipMember
+    :param wanted: the names of the sections to read, or None for all the sections in _METADATA_SECTIONS
+    :param everything: read every section in the file, including the ones that are not in _METADATA_SECTIONS.
+    If two of those have the same name the first is kept
+    :return: a dict of section name to dataframe
+    """
+    if everything:
+        wanted = None
+    elif wanted is None:
+        wanted = _METADATA_SECTIONS
+    sections = {}
+    for name, section in iter_metadata_sections(metadata_file, wanted):
+        sections.setdefault(name, section)
+    return sections
+
+
 class StatscanMetadata(object):
 
     def __init__(self, metadata_file):
-        self.sections = StatscanMetadata.parse_metadata(metadata_file)
+        self.metadata_file = metadata_file
+
+    def section(self, name: str):
+        """
+        Get a section of the metadata. Only this section is parsed, and the parsed
+        sections are cached for as long as the file doesn't change
+        :param name: CubeInfo, Dimensions, DimensionValues or Notes
+        :return: a copy of the section, so changing it doesn't change the cached section,
+        or None if the file doesn't have it
+        """
+        key = _metadata_file_key(self.metadata_file)
+        with _metadata_cache_lock:
+            cached = _metadata_cache.get(key)
+            if cached is None:
+                cached = _metadata_cache[key] = {}
+                while len(_metadata_cache) > _METADATA_CACHE_SIZE:
+                    _metadata_cache.popitem(last=False)
+            _metadata_cache.move_to_end(key)
+            section = cached.get(name)
+        if section is None and name not in cached:
+            # Parsed outside the lock, if two threads parse the same section they get the same result
+            section = read_metadata_sections(self.metadata_file, wanted=[name]).get(name)
+            with _metadata_cache_lock:
+                cached[name] = section
+        return None if section is None else section.copy()
+
+    @property
+    def sections(self):
+        sections = {name: self.section(name) for name in _METADATA_SECTIONS}
+        return {name: section for name, section in sections.items() if section is not None}
+
+    @property
+    def name(self):
+        return self.cube_info["Cube Title"].values[0]
 
     @property
     def notes(self):
-        return self.sections['Notes']
+        return self.section('Notes')
 
     @property
     def cube_info(self):
-        return self.sections['CubeInfo']
+        return self.section('CubeInfo')
 
     @property
     def dimensions(self):
-        return self.sections['Dimensions']
+        return self.section('Dimensions')
+
+    @property
+    def dimension_values(self):
+        return self.section('DimensionValues')
 
     @classmethod
     def parse_sections(cls, metadata_file):
-        encoding = get_encoding_type(metadata_file)
-        with open(metadata_file, 'r', encoding=encoding) as f:
-            start_section = True
-            for line in f.readlines():
-                line = line.strip()
-                if len(line) > 0:
-                    parts = [p.replace('"', '') for p in line.split(',')]
-                    if start_section:
-                        columns = parts
-                        rows = []
-                        start_section = False
-                    else:
-                        rows.append(tuple(parts))
-                else:
-                    start_section = True
-                    row_widths = [len(row) for row in rows]
-                    if row_widths == []:
-                        continue
-                    row_width = max(row_widths)
-                    if row_width > len(columns):
-                        rows = [row[:len(columns)] for row in rows]
-                    elif len(columns) > row_width:
-                        columns = columns[:row_width]
-                    df = pd.DataFrame(data=rows, columns=columns)
-                    yield df
+        """
+        :return: yields every section of the metadata file as a dataframe, in the order they are in the file
+        """
+        for name, section in iter_metadata_sections(metadata_file):
+            yield section
 
     @classmethod
     def parse_metadata(cls, metadata_file: str):
-        metadata_sections = cls.parse_sections(metadata_file)
-        sections = {}
-        for df in metadata_sections:
-            if list_contains(df.columns, ['Cube Title', 'Product Id']):
-                sections['CubeInfo'] = df
-            elif list_contains(df.columns, ['Dimension ID', 'Dimension name']):
-                sections['Dimensions'] = df
-            elif list_contains(df.columns, ['Dimension ID', 'Member Name']):
-                sections['DimensionValues'] = df
-            elif list_contains(df.columns, ['Note ID', 'Note']):
-                sections['Notes'] = df
-
-        return sections
+        return read_metadata_sections(metadata_file)
 
     def pivot_column(self):
         return self.dimensions.tail(1)["Dimension name"].values[0]
 
+    def dimension_dtypes(self):
+        """
+        A CategoricalDtype for each dimension column in the data file, with the members
+        of the dimension as the categories, in the order they are listed in the metadata
+        :return: a dict of column name to CategoricalDtype
+        """
+        dimension_values = self.dimension_values
+        if dimension_values is None:
+            return {}
+        dtypes = {}
+        for dimension_id, name in self.dimensions[["Dimension ID", "Dimension name"]].values:
+            members = dimension_values.loc[dimension_values["Dimension ID"] == dimension_id, "Member Name"]
+            column = "GEO" if name in _GEOGRAPHY_DIMENSIONS else name
+            dtypes[column] = pd.CategoricalDtype(pd.unique(members.values))
+        return dtypes
+
     def __repr__(self):
         return f"<{self.name}>"
 
@@ -309,11 +1308,33 @@ class StatscanMetadata(object):
         return _html
 
 
+_ENCODING_SAMPLE_SIZE = 64 * 1024
+_BOMS = [
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+
+
 def get_encoding_type(file):
-    with open(file, 'rb') as f:
-        rawdata = f.read()
-        return detect(rawdata)['encoding'].lower()
+    """
+    Detect the encoding of a file from its byte order mark, or from a sample of its start
+    :param file: a file path or a ZipMember
+    """
+    with open_binary(file) as f:
+        sample = f.read(_ENCODING_SAMPLE_SIZE)
+    for bom, encoding in _BOMS:
+        if sample.startswith(bom):
+            return encoding
+    try:
+        sample.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError as e:
+        # A multibyte character can be cut off at the end of the sample
+        if len(sample) == _ENCODING_SAMPLE_SIZE and e.start >= len(sample) - 3:
+            return "utf-8"
+    return (detect(sample)['encoding'] or "utf-8").lower()
 
 
 def list_contains(alist, values):
-    return all([v in alist for v in values])
\ No newline at end of file
+    return all([v in alist for v in values])
@@ -1,9 +1,24 @@
+import json
+import math
+import os
+import re
+import shutil
+import tempfile
+from collections import Counter
+from functools import lru_cache, partial
+from pathlib import Path
+
+import numpy as np
 import pandas as pd
 from nltk.stem import PorterStemmer
+from nltk.stem.snowball import FrenchStemmer
 from nltk.tokenize import word_tokenize
-from rank_bm25 import BM25Okapi
+from scipy.sparse import csr_matrix, csc_matrix
+from .core import parallel
 
 stemmer = PorterStemmer()
+_STEMMERS = {'en': stemmer, 'fr': FrenchStemmer()}
+_NLTK_LANGUAGES = {'en': 'english', 'fr': 'french'}
 
 
 def get_language(language: str):
@@ -13,24 +28,314 @@ def get_language(language: str):
             return 'French'
 
 
-def stem(string: str):
-    return stemmer.stem(string)
+@lru_cache(maxsize=1 << 18)
+def stem(string: str, language: str = 'en'):
+    # Descriptions use the same words over and over, so each distinct word is stemmed once
+    return _STEMMERS[language].stem(string)
+
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def regex_tokenize(string: str):
+    """
+    Split a string into runs of word characters. Much faster than word_tokenize,
+    but it drops punctuation rather than keeping it as tokens, and doesn't split contractions
+    """
+    return _WORD_RE.findall(string)
+
+
+_TOKENIZERS = {'nltk': word_tokenize, 'regex': regex_tokenize}
+# Fewer strings than this per worker are quicker to preprocess than to send to a process
+_MIN_CHUNK = 1000
+
+
+def tokenize(string: str, tokenizer: str = 'nltk', language: str = 'en'):
+    if tokenizer == 'nltk':
+        return word_tokenize(string, language=_NLTK_LANGUAGES[language])
+    return _TOKENIZERS[tokenizer](string)
 
 
-def preprocess(string: str):
+def preprocess(string: str, tokenizer: str = 'nltk', language: str = 'en'):
+    """
+    Lowercase, tokenize and stem a string, with the Porter stemmer for 'en' or the Snowball French stemmer for 'fr'
+    """
     string = string.lower()
-    return [stem(word) for word in word_tokenize(string)]
+    return [stem(word, language) for word in tokenize(string, tokenizer, language)]
+
+
+def preprocess_all(strings, tokenizer: str = 'nltk', workers: int = 1, language: str = 'en'):
+    """
+    Preprocess many strings, in chunks across worker processes if workers is more than 1
+    and there are enough strings to be worth it.
+    The results are in the order of the strings however many workers there are
+    """
+    if tokenizer not in _TOKENIZERS:
+        raise ValueError(f"tokenizer should be one of {list(_TOKENIZERS)}, not {tokenizer}")
+    if language not in _STEMMERS:
+        raise ValueError(f"language should be one of {list(_STEMMERS)}, not {language}")
+    strings = list(strings)
+    if workers > 1 and len(strings) >= workers * _MIN_CHUNK:
+        chunksize = math.ceil(len(strings) / (workers * 4))
+        return parallel(partial(preprocess, tokenizer=tokenizer, language=language), strings, max_workers=workers,
+                        backend='process', chunksize=chunksize)
+    return [preprocess(string, tokenizer=tokenizer, language=language) for string in strings]
+
+
+# Bumped when the saved index format or the preprocessing changes, so old indexes are rebuilt
+_INDEX_VERSION = 2
+
+
+def _is_saved_index(directory: Path):
+    """
+    Whether a directory holds a complete index saved by this version
+    """
+    try:
+        with open(directory / "index.json", "r", encoding="utf-8") as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return info.get("version") == _INDEX_VERSION and \
+        all((directory / f"{name}.npy").exists() for name in ['indptr', 'indices', 'data', 'idf'])
+
+
+def top_k(scores: np.ndarray, n: int):
+    """
+    The positions of the n highest scores, highest first. Equal scores are in position order
+    """
+    if n <= 0:
+        return np.empty(0, dtype=np.int64)
+    if n < len(scores):
+        threshold = scores[np.argpartition(-scores, n - 1)[n - 1]]
+        above = np.flatnonzero(scores > threshold)
+        ties = np.flatnonzero(scores == threshold)[:n - len(above)]
+        candidates = np.concatenate([above, ties])
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind='stable')][:n]
+
+
+def top_documents(docs, doc_weights, num_docs: int, n: int = 10, mask: np.ndarray = None):
+    """
+    The n best documents from the weights of the query terms they have, only adding up the weights
+    of the documents that have a term. Documents with none of the terms score 0 and pad the results
+    :param docs: the document of each weight, a document can be repeated
+    :param doc_weights: the weights to sum into the score of each document
+    :param num_docs: the number of documents
+    :param mask: a boolean array with an element for each document, only the documents
+    that are True are returned. The mask is applied before the best documents are picked
+    :return: the positions of the documents, and their scores
+    """
+    if mask is not None:
+        keep = mask[docs]
+        docs, doc_weights = docs[keep], doc_weights[keep]
+    if len(doc_weights) and doc_weights.min() < 0:
+        # With negative weights a document with none of the terms can score higher than one with them
+        doc_scores = np.bincount(docs, weights=doc_weights, minlength=num_docs)
+        candidates = np.arange(num_docs) if mask is None else np.flatnonzero(mask)
+        top_indices = candidates[top_k(doc_scores[candidates], n)]
+        return top_indices, doc_scores[top_indices]
+    matched, positions = np.unique(docs, return_inverse=True)
+    matched_scores = np.bincount(positions.ravel(), weights=doc_weights, minlength=len(matched))
+    best = top_k(matched_scores, n)
+    top_indices, top_scores = matched[best], matched_scores[best]
+    if len(top_indices) < n:
+        # The rest score 0, in position order
+        limit = n + len(matched)
+        others = np.arange(min(num_docs, limit)) if mask is None else np.flatnonzero(mask)[:limit]
+        others = others[~np.isin(others, matched)][:n - len(top_indices)]
+        top_indices = np.concatenate([top_indices, others])
+        top_scores = np.concatenate([top_scores, np.zeros(len(others))])
+    return top_indices, top_scores
 
 
 class Bm25Index:
+    """
+    A BM25 Okapi index of a column of text, the same scoring as rank_bm25's BM25Okapi.
+    The weight of each term in each document, idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len / avglen)),
+    is computed once into a sparse matrix, so the scores of a query are the sum of the matrix columns of its terms
+    """
+
+    def __init__(self, column, k1=1.5, b=0.75, epsilon=0.25, tokenizer: str = 'nltk', workers: int = 1,
+                 language: str = 'en'):
+        """
+        :param column: the text to index
+        :param tokenizer: 'nltk' for word_tokenize, or 'regex' for the faster regex_tokenize.
+        Queries are preprocessed with the same tokenizer
+        :param workers: the number of processes to preprocess the text in. The index is the same with any number
+        :param language: the language of the text, 'en' or 'fr', which picks the stemmer
+        """
+        documents = preprocess_all(column.fillna('').astype(str), tokenizer=tokenizer, workers=workers,
+                                   language=language)
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self.tokenizer = tokenizer
+        self.language = language
+        self._build(documents)
+
+    @classmethod
+    def from_tokenized(cls, documents, k1=1.5, b=0.75, epsilon=0.25, tokenizer: str = 'nltk', language: str = 'en'):
+        """
+        Build an index of documents that are already preprocessed into lists of terms
+        """
+        index = cls.__new__(cls)
+        index.k1, index.b, index.epsilon = k1, b, epsilon
+        index.tokenizer, index.language = tokenizer, language
+        index._build(list(documents))
+        return index
+
+    def _build(self, documents):
+        vocabulary = {}
+        indices, counts, indptr = [], [], [0]
+        for document in documents:
+            for term, count in Counter(document).items():
+                indices.append(vocabulary.setdefault(term, len(vocabulary)))
+                counts.append(count)
+            indptr.append(len(indices))
+        self.vocabulary = vocabulary
+        indices = np.array(indices, dtype=np.int64)
+        tf = np.array(counts, dtype=np.float64)
+        indptr = np.array(indptr, dtype=np.int64)
+        num_docs, num_terms = len(documents), len(vocabulary)
+        doc_len = np.array([len(document) for document in documents], dtype=np.float64)
+
+        # The idf of terms in more than half the documents is negative, those get a floor of epsilon * the average idf
+        doc_freq = np.bincount(indices, minlength=num_terms)
+        idf = np.log(num_docs - doc_freq + 0.5) - np.log(doc_freq + 0.5)
+        average_idf = idf.mean() if num_terms else 0.0
+        self.idf = np.where(idf < 0, self.epsilon * average_idf, idf)
+
+        avgdl = doc_len.sum() / num_docs if num_docs else 0.0
+        length_norm = self.k1 * (1 - self.b + self.b * doc_len / avgdl) if avgdl else np.full(num_docs, self.k1)
+        rows = np.repeat(np.arange(num_docs), np.diff(indptr))
+        weights = self.idf[indices] * tf * (self.k1 + 1) / (tf + length_norm[rows])
+        self.weights = csr_matrix((weights, indices, indptr), shape=(num_docs, num_terms)).tocsc()
+
+    def save(self, directory):
+        """
+        Save the index to a directory: the weight matrix as .npy arrays that load can memory map,
+        and the vocabulary and parameters as json. The directory is written under a temporary
+        name and moved into place, so other processes never see a partly written index
+        """
+        directory = Path(directory)
+        directory.parent.mkdir(parents=True, exist_ok=True)
+        temp_dir = Path(tempfile.mkdtemp(dir=directory.parent, prefix=f".{directory.name}."))
+        try:
+            for name in ['indptr', 'indices', 'data']:
+                np.save(temp_dir / f"{name}.npy", getattr(self.weights, name))
+            np.save(temp_dir / "idf.npy", self.idf)
+            terms = sorted(self.vocabulary, key=self.vocabulary.get)
+            with open(temp_dir / "index.json", "w", encoding="utf-8") as f:
+                json.dump({"version": _INDEX_VERSION, "k1": self.k1, "b": self.b, "epsilon": self.epsilon,
+                           "tokenizer": self.tokenizer, "language": self.language,
+                           "shape": list(self.weights.shape), "terms": terms}, f)
+            if directory.exists() and not _is_saved_index(directory):
+                # An index from another version, which would keep the new one from being moved into place
+                shutil.rmtree(directory, ignore_errors=True)
+            try:
+                os.replace(temp_dir, directory)
+            except OSError:
+                # Fine if another process saved the same index first
+                if not _is_saved_index(directory):
+                    raise
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    @classmethod
+    def load(cls, directory):
+        """
+        Load an index saved with save, memory mapping the weight matrix
+        :raises FileNotFoundError: if there is no index in the directory
+        """
+        directory = Path(directory)
+        with open(directory / "index.json", "r", encoding="utf-8") as f:
+            info = json.load(f)
+        if info.get("version") != _INDEX_VERSION:
+            raise FileNotFoundError(f"The index in {directory} is from another version")
+        index = cls.__new__(cls)
+        index.k1, index.b, index.epsilon = info["k1"], info["b"], info["epsilon"]
+        index.tokenizer, index.language = info["tokenizer"], info["language"]
+        index.vocabulary = {term: term_id for term_id, term in enumerate(info["terms"])}
+        index.idf = np.load(directory / "idf.npy", mmap_mode='r')
+        arrays = [np.load(directory / f"{name}.npy", mmap_mode='r') for name in ['data', 'indices', 'indptr']]
+        index.weights = csc_matrix(tuple(arrays), shape=tuple(info["shape"]), copy=False)
+        return index
+
+    def _matches(self, tokenized_query):
+        """
+        :return: the documents that have the terms of the query, once for each term, and the weight of the term
+        """
+        terms = Counter(term for term in tokenized_query if term in self.vocabulary)
+        indptr, indices, weights = self.weights.indptr, self.weights.indices, self.weights.data
+        docs, doc_weights = [np.empty(0, dtype=indices.dtype)], [np.empty(0)]
+        for term, count in terms.items():
+            term_id = self.vocabulary[term]
+            start, end = indptr[term_id], indptr[term_id + 1]
+            docs.append(indices[start:end])
+            doc_weights.append(weights[start:end] * count)
+        return np.concatenate(docs), np.concatenate(doc_weights)
+
+    def scores(self, tokenized_query):
+        """
+        :param tokenized_query: the preprocessed terms of the query
+        :return: the score of every document
+        """
+        docs, doc_weights = self._matches(tokenized_query)
+        return np.bincount(docs, weights=doc_weights, minlength=self.weights.shape[0])
+
+    def top(self, tokenized_query, n=10, mask: np.ndarray = None):
+        """
+        The n best documents for a query, only looking at the documents that have a term of the query
+        :param mask: only return the documents that are True in this boolean array, see top_documents
+        :return: the positions of the documents, and their scores
+        """
+        docs, doc_weights = self._matches(tokenized_query)
+        return top_documents(docs, doc_weights, self.weights.shape[0], n, mask)
+
+    def preprocess(self, sentence: str):
+        return preprocess(sentence, tokenizer=self.tokenizer, language=self.language)
+
+    def get_scores(self, sentence, n=10, mask: np.ndarray = None):
+        return self.top(self.preprocess(sentence), n, mask)
+
+
+class MultiFieldIndex:
+    """
+    BM25 indexes of several fields of the same documents, like the titles and descriptions of datasets.
+    The score of a document is the weighted sum of the scores of its fields
+    """
 
-    def __init__(self, column):
-        column = column.fillna('').astype(str).apply(preprocess)
-        self.bm25 = BM25Okapi(column.tolist())
+    def __init__(self, indexes: dict, weights: dict = None):
+        """
+        :param indexes: a Bm25Index for each field, all of the same documents
+        :param weights: the weight of each field, by default 1
+        """
+        num_docs = {index.weights.shape[0] for index in indexes.values()}
+        if len(num_docs) > 1:
+            raise ValueError(f"The indexes have different numbers of documents: {sorted(num_docs)}")
+        self.indexes = indexes
+        self.weights = {field: (weights or {}).get(field, 1.0) for field in indexes}
+        self.num_docs = num_docs.pop() if num_docs else 0
 
-    def get_scores(self, sentence, n=10):
-        tokenized_query = preprocess(sentence)
-        doc_scores = self.bm25.get_scores(tokenized_query)
-        top_indices = (-doc_scores).argsort()[:n]
-        top_scores = doc_scores[top_indices]
-        return top_indices, top_scores
+    def top(self, sentence: str, n=10, mask: np.ndarray = None):
+        """
+        The n best documents for a query over all the fields, gathering the term weights of every field
+        and picking the best documents in one pass
+        :param mask: only return the documents that are True in this boolean array, see top_documents
+        :return: the positions of the documents, and their scores
+        """
+        queries = {}
+        docs, doc_weights = [np.empty(0, dtype=np.int64)], [np.empty(0)]
+        for field, index in self.indexes.items():
+            weight = self.weights[field]
+            if weight == 0:
+                continue
+            # Fields preprocessed the same way share the preprocessed query
+            key = (index.tokenizer, index.language)
+            if key not in queries:
+                queries[key] = index.preprocess(sentence)
+            field_docs, field_weights = index._matches(queries[key])
+            docs.append(field_docs)
+            doc_weights.append(field_weights * weight)
+        return top_documents(np.concatenate(docs), np.concatenate(doc_weights), self.num_docs, n, mask)
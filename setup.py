@@ -20,5 +20,6 @@ setup(
     author_email='dgunning@gmail.com',
     url='https://github.com/ocan-data/OpenCanadaData',
     license=license,
-    packages=['ocandata']
+    packages=['ocandata'],
+    package_data={'ocandata': ['data/ExpiredDatasets.txt']}
 )
\ No newline at end of file
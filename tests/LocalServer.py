@@ -0,0 +1,101 @@
+import hashlib
+import io
+import os
+import threading
+import zipfile
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+
+
+def make_statscan_zip(resource_id: str = "23100274", data: str = None):
+    """
+    Build an in-memory StatCan style zip from the sample rail data in the data directory
+    :param resource_id: the resource id to name the files with
+    :param data: the contents of the data file, if not the sample rail data
+    """
+    if data is None:
+        data = read_sample_data()
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as zip_file:
+        zip_file.writestr(f"{resource_id}.csv", data.encode("utf-8-sig"))
+        zip_file.write(os.path.join(DATA_DIR, "23100274_MetaData.csv"), f"{resource_id}_MetaData.csv")
+    return buffer.getvalue()
+
+
+def read_sample_data():
+    with open(os.path.join(DATA_DIR, "23100274.csv"), "r", encoding="utf-8-sig") as f:
+        return f.read()
+
+
+class LocalServer:
+    """
+    A local HTTP stand-in that serves fixed content with ETag and Last-Modified validators
+    and records every request it receives
+    """
+
+    def __init__(self):
+        self.content = {}
+        self.requests = []
+        self.failures = {}
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests.append((self.path, dict(self.headers)))
+                if server.failures.get(self.path):
+                    status, times = server.failures[self.path]
+                    server.failures[self.path] = (status, times - 1) if times > 1 else None
+                    self.send_error(status)
+                    return
+                if self.path not in server.content:
+                    self.send_error(404)
+                    return
+                body, etag, last_modified, content_type = server.content[self.path]
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", etag)
+                self.send_header("Last-Modified", last_modified)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def serve(self, path: str, body, content_type: str = "application/octet-stream"):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        self.content[path] = (body, etag, formatdate(usegmt=True), content_type)
+        return self.url(path)
+
+    def fail(self, path: str, times: int = 1, status: int = 503):
+        """
+        Answer the next requests for a path with an error status
+        """
+        self.failures[path] = (status, times)
+
+    def url(self, path: str):
+        host, port = self.httpd.server_address
+        return f"http://{host}:{port}{path}"
+
+    def requests_for(self, path: str):
+        return [headers for p, headers in self.requests if p == path]
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
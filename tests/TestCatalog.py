@@ -0,0 +1,77 @@
+import tempfile
+import unittest
+from unittest import mock
+from ocandata.catalog import ResourceCatalog
+from ocandata.crawler import CrawlResult
+from ocandata.inventory import Dataset
+from ocandata.repo import Repo
+from LocalServer import LocalServer
+from TestCrawler import _RESOURCES, _DELETED
+
+
+class ResourceCatalogTestCase(unittest.TestCase):
+    def test_refresh_and_lookup(self):
+        with LocalServer() as server, tempfile.TemporaryDirectory() as root:
+            active = server.serve("/active", _RESOURCES, content_type="text/html")
+            deleted = server.serve("/deleted", _DELETED, content_type="text/html")
+            missing = server.url("/missing")
+            catalog = ResourceCatalog.in_repo(Repo.at(root))
+            self.assertIsNone(catalog.resources(active))
+
+            self.assertEqual(3, catalog.refresh([active, deleted, missing], retries=0))
+            self.assertEqual(["Terminal dwell time"], catalog.resources(active)["Resource Name"].tolist())
+            self.assertEqual(["Deleted"], catalog.resources(deleted).Status.tolist())
+            self.assertEqual(["Error"], catalog.resources(missing).Status.tolist())
+
+            # Only the page that failed is crawled again
+            catalog = ResourceCatalog.in_repo(Repo.at(root))
+            self.assertEqual([missing], catalog.stale_urls([active, deleted, missing]))
+            self.assertEqual(1, catalog.refresh([active, deleted, missing], retries=0))
+            self.assertEqual(1, len(server.requests_for("/active")))
+            self.assertEqual([active, deleted, missing], catalog.stale_urls([active, deleted, missing], max_age=0))
+
+    def test_error_keeps_previous_resources(self):
+        with tempfile.TemporaryDirectory() as root:
+            catalog = ResourceCatalog.in_repo(Repo.at(root))
+            url = "http://example.com/dataset"
+            table = CrawlResult(url, "Active", resources=CrawlResult.from_record(
+                {"url": url, "status": "Active",
+                 "resources": {"columns": ["Resource Name", "Link"], "data": [["Rail", "http://example.com/a.csv"]]}}
+            ).resources)
+            catalog.update({url: table})
+            catalog.update({url: CrawlResult(url, "Error", error="timeout")})
+            self.assertEqual(["Rail"], catalog.resources(url)["Resource Name"].tolist())
+
+    def test_table_without_status(self):
+        with tempfile.TemporaryDirectory() as root:
+            catalog = ResourceCatalog.in_repo(Repo.at(root))
+            url = "http://example.com/dataset"
+            table = CrawlResult.from_record(
+                {"url": url, "status": "Active",
+                 "resources": {"columns": ["Resource Name", "Link"], "data": [["Rail", "http://example.com/a.csv"]]}}
+            )
+            catalog.update({url: table})
+            resources = ResourceCatalog.in_repo(Repo.at(root)).resources(url)
+            self.assertEqual(["Active"], resources.Status.tolist())
+            self.assertEqual([""], resources.Format.tolist())
+            with mock.patch("ocandata.catalog._default_catalog", catalog):
+                self.assertTrue(Dataset("Rail", "", url=url).is_active())
+
+    def test_dataset_reads_the_catalog(self):
+        with LocalServer() as server, tempfile.TemporaryDirectory() as root:
+            active = server.serve("/active", _RESOURCES, content_type="text/html")
+            deleted = server.serve("/deleted", _DELETED, content_type="text/html")
+            catalog = ResourceCatalog.in_repo(Repo.at(root))
+            catalog.refresh([active, deleted])
+            with mock.patch("ocandata.catalog._default_catalog", catalog):
+                dataset = Dataset("Rail", "", url=active)
+                gone = Dataset("Gone", "", url=deleted)
+            self.assertEqual(1, len(server.requests_for("/active")))
+            self.assertTrue(dataset.is_active())
+            self.assertEqual("Link", dataset.resources.data.columns[4])
+            self.assertFalse(gone.is_active())
+            self.assertEqual("Gone", gone.resources.data["Resource Name"][0])
+
+
+if __name__ == "__main__":
+    unittest.main()
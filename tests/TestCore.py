@@ -0,0 +1,68 @@
+import itertools
+import os
+import threading
+import time
+import unittest
+from ocandata.core import parallel, parallel_iter
+
+
+def square(x):
+    return x * x
+
+
+def fail_on_three(x):
+    if x == 3:
+        raise ValueError(x)
+    return x
+
+
+def slow_first(x):
+    if x == 0:
+        time.sleep(0.2)
+    return x
+
+
+class ParallelTestCase(unittest.TestCase):
+    def test_results_in_input_order(self):
+        self.assertEqual([0, 1, 4, 9, 16], parallel(square, range(5), max_workers=4))
+        self.assertEqual([0, 1, 2, 3], parallel(slow_first, range(4), max_workers=4))
+        self.assertEqual([0, 1, 4], parallel(square, range(3), max_workers=1))
+
+    def test_completion_order(self):
+        results = list(parallel_iter(slow_first, range(4), max_workers=4, ordered=False))
+        self.assertEqual([0, 1, 2, 3], sorted(results))
+        self.assertEqual(0, results[-1])
+
+    def test_all_none_is_a_list(self):
+        self.assertEqual([None, None], parallel(lambda x: None, [1, 2], max_workers=2))
+
+    def test_process_backend(self):
+        self.assertEqual([x * x for x in range(100)],
+                         parallel(square, range(100), max_workers=2, backend='process', chunksize=10))
+        self.assertRaises(ValueError, parallel, square, range(3), backend='fibers')
+
+    def test_exceptions(self):
+        results = parallel(fail_on_three, range(5), max_workers=2, return_exceptions=True)
+        self.assertEqual([0, 1, 2, 4], [r for r in results if not isinstance(r, Exception)])
+        self.assertIsInstance(results[3], ValueError)
+        self.assertRaises(ValueError, parallel, fail_on_three, range(5), max_workers=2)
+        self.assertRaises(ValueError, parallel, fail_on_three, range(5), max_workers=1)
+
+    def test_bounded_submission(self):
+        submitted = []
+        lock = threading.Lock()
+
+        def numbers():
+            for i in itertools.count():
+                with lock:
+                    submitted.append(i)
+                yield i
+
+        results = parallel_iter(square, numbers(), max_workers=2, max_in_flight=3)
+        self.assertEqual([0, 1, 4], list(itertools.islice(results, 3)))
+        self.assertLessEqual(len(submitted), 6)
+        results.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
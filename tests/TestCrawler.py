@@ -0,0 +1,99 @@
+import os
+import tempfile
+import unittest
+import pandas as pd
+from ocandata.inventory import Inventory
+from ocandata.crawler import Crawler, read_checkpoint
+from LocalServer import LocalServer
+
+_RESOURCES = """<html><head><title>Rail dwell time</title></head><body>
+<table>
+<tr><th>Resource Name</th><th>Resource Type</th><th>Format</th><th>Language</th><th>Links</th></tr>
+<tr><td>Terminal dwell time</td><td>Dataset</td><td>CSV</td><td>English</td><td><a href="https://example.com/23100274.csv">Access</a></td></tr>
+</table></body></html>"""
+
+_DELETED = "<html><head><title>Dataset Deleted - Open Government Portal</title></head><body><h1>Dataset Deleted</h1></body></html>"
+
+_LINK = """<html><head><title>Search</title></head><body>
+<a href="/data/en/dataset/4ed351cf-95d8-4c10-97ac-6b3511f359b7">Rail dwell time</a></body></html>"""
+
+
+class CrawlerTestCase(unittest.TestCase):
+    def serve_pages(self, server: LocalServer):
+        return [
+            server.serve("/active", _RESOURCES, content_type="text/html"),
+            server.serve("/deleted", _DELETED, content_type="text/html"),
+            server.serve("/search", _LINK, content_type="text/html"),
+            server.url("/missing"),
+        ]
+
+    def test_crawl(self):
+        with LocalServer() as server:
+            server.serve("/data/en/dataset/4ed351cf-95d8-4c10-97ac-6b3511f359b7", _RESOURCES, content_type="text/html")
+            active, deleted, search, missing = self.serve_pages(server)
+            server.fail("/active", times=2)
+            results = Crawler(per_host_limit=2, backoff_factor=0.01).run([active, deleted, search, missing])
+
+            self.assertEqual([active, deleted, search, missing], list(results))
+            self.assertEqual("Active", results[active].status)
+            self.assertEqual(3, len(server.requests_for("/active")))
+            self.assertEqual(["https://example.com/23100274.csv"], results[active].resources.Link.tolist())
+            self.assertEqual("Deleted", results[deleted].status)
+            self.assertEqual("Active", results[search].status)
+            self.assertEqual("Error", results[missing].status)
+            self.assertEqual(1, len(server.requests_for("/missing")))
+
+    def test_retries_give_up(self):
+        with LocalServer() as server:
+            active = server.serve("/active", _RESOURCES, content_type="text/html")
+            server.fail("/active", times=5)
+            results = Crawler(retries=2, backoff_factor=0.01).run([active])
+            self.assertEqual("Error", results[active].status)
+            self.assertIn("503", results[active].error)
+            self.assertEqual(3, len(server.requests_for("/active")))
+
+    def test_resume_from_checkpoint(self):
+        with LocalServer() as server, tempfile.TemporaryDirectory() as root:
+            active, deleted, search, missing = self.serve_pages(server)
+            checkpoint = os.path.join(root, "crawl.jsonl")
+            Crawler(checkpoint=checkpoint, retries=0).run([active, deleted])
+            with open(checkpoint, "a") as f:
+                f.write('{"url": "http://cut-off')
+
+            server.serve("/missing", _DELETED, content_type="text/html")
+            results = Crawler(checkpoint=checkpoint, retries=0).run([active, deleted, missing])
+            self.assertEqual(1, len(server.requests_for("/active")))
+            self.assertEqual("Deleted", results[missing].status)
+            self.assertEqual(["Terminal dwell time"], results[active].resources["Resource Name"].tolist())
+            self.assertEqual(3, len(read_checkpoint(checkpoint)))
+
+    def test_inventory_active_inactive_datasets(self):
+        with LocalServer() as server:
+            active, deleted, search, missing = self.serve_pages(server)
+            data = pd.DataFrame({
+                "title_en": ["Rail", "Gone"], "description_en": ["", ""], "publisher_en": ["StatCan", "StatCan"],
+                "released": ["2020-01-01", "2019-01-01"], "published": ["2020-01-01", "2019-01-01"],
+                "portal_url_en": [active, deleted],
+            })
+            inventory = Inventory(data)
+            active_datasets, inactive_datasets = inventory.get_active_inactive_datasets(inventory.data)
+            self.assertEqual(["Rail"], [dataset.title for dataset in active_datasets])
+            self.assertEqual(["Gone"], [dataset.title for dataset in inactive_datasets])
+            self.assertEqual("Deleted", inactive_datasets[0].resources.data.Status[0])
+
+    def test_french_inventory_placeholder_resources(self):
+        with LocalServer() as server:
+            active, deleted, search, missing = self.serve_pages(server)
+            data = pd.DataFrame({
+                "title_fr": ["Disparu"], "description_fr": [""], "publisher_fr": ["StatCan"],
+                "released": ["2020-01-01"], "published": ["2020-01-01"], "portal_url_fr": [missing],
+            })
+            inventory = Inventory(data, language="fr")
+            crawled = inventory.crawl_resources(retries=0)
+            dataset = inventory._create_dataset(next(inventory.data.itertuples()), crawled)
+            self.assertEqual("French", dataset.language)
+            self.assertEqual("French", dataset.resources.data.Language[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
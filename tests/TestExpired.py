@@ -0,0 +1,59 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+from ocandata.expired import ExpiredDatasets
+from ocandata.inventory import Inventory
+from ocandata.repo import Repo
+from ocandata.snapshot import CsvSnapshot
+from LocalServer import LocalServer
+from TestSnapshot import inventory_csv
+
+_EXPIRED_TXT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ocandata", "data", "ExpiredDatasets.txt")
+
+
+class ExpiredDatasetsTestCase(unittest.TestCase):
+    def test_shipped_list(self):
+        with open(_EXPIRED_TXT) as f:
+            urls = [line.strip() for line in f if line.strip()]
+        with tempfile.TemporaryDirectory() as root:
+            expired = ExpiredDatasets(delta_file=os.path.join(root, "delta"))
+            self.assertTrue(expired.contains(urls).all())
+            self.assertFalse(expired.contains([url + "x" for url in urls[:100]] + [None, float("nan")]).any())
+            self.assertIn(urls[0], expired)
+            self.assertEqual(len(set(urls)), len(expired))
+
+    def test_add(self):
+        with tempfile.TemporaryDirectory() as root:
+            url_file = os.path.join(root, "expired.txt")
+            delta = os.path.join(root, "delta")
+            with open(url_file, "w") as f:
+                f.write("http://a\n")
+            expired = ExpiredDatasets(url_file, delta)
+            self.assertEqual(2, expired.add(["http://b", "http://c", "http://a", "http://b", None]))
+            self.assertEqual(1, expired.add(["http://c", "http://d"]))
+            with open(delta) as f:
+                self.assertEqual(["http://b", "http://c", "http://d"], f.read().split())
+            self.assertEqual([True, True, True, False],
+                             ExpiredDatasets(url_file, delta).contains(["http://c", "http://a", "http://b", "http://e"]).tolist())
+
+    def test_missing_list_is_logged(self):
+        with tempfile.TemporaryDirectory() as root:
+            expired = ExpiredDatasets(os.path.join(root, "missing.txt"), os.path.join(root, "delta"))
+            with self.assertLogs("ocandata", level="WARNING"):
+                self.assertEqual(0, len(expired))
+
+    def test_inventory_drops_expired(self):
+        with LocalServer() as server, tempfile.TemporaryDirectory() as root:
+            url = server.serve("/inventory.csv", inventory_csv("Rail", "Road", "Air"), content_type="text/csv")
+            url_file = os.path.join(root, "expired.txt")
+            open(url_file, "w").close()
+            expired = ExpiredDatasets(url_file, os.path.join(root, "delta"))
+            expired.add([f"http://ouvert.canada.ca/data/fr/dataset/{1:032d}"])
+            with mock.patch("ocandata.inventory._inventory_snapshot", CsvSnapshot(url, "inventory", repo=Repo.at(root))), \
+                    mock.patch("ocandata.expired._expired_datasets", expired):
+                self.assertEqual(["Air", "Rail"], Inventory().data.title_en.tolist())
+
+
+if __name__ == "__main__":
+    unittest.main()
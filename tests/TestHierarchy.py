@@ -0,0 +1,109 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from ocandata.hierarchy import MemberHierarchy
+from ocandata.repo import Repo
+from ocandata.statscan import StatscanZip, StatscanMetadata
+from LocalServer import LocalServer, make_statscan_zip
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+
+
+def geography():
+    # Canada > Ontario > (Toronto, Ottawa), Canada > Quebec > Montreal > Laval
+    return MemberHierarchy(
+        "GEO",
+        member_ids=[1, 2, 3, 4, 5, 6, 7],
+        parent_ids=[-1, 1, 2, 2, 1, 5, 6],
+        names=["Canada", "Ontario", "Toronto", "Ottawa", "Quebec", "Montreal", "Laval"],
+    )
+
+
+class HierarchyTestCase(unittest.TestCase):
+    def test_descendants(self):
+        hierarchy = geography()
+        self.assertEqual(["Ontario", "Toronto", "Ottawa", "Quebec", "Montreal", "Laval"],
+                         list(hierarchy.descendants("Canada")))
+        self.assertEqual(["Quebec", "Montreal", "Laval"], list(hierarchy.descendants(5, include_self=True)))
+        self.assertEqual([], list(hierarchy.descendants("Toronto")))
+        self.assertEqual("Montreal", hierarchy.parent_of("Laval"))
+        self.assertIsNone(hierarchy.parent_of("Canada"))
+        self.assertEqual(["Toronto", "Ottawa"], list(hierarchy.children("Ontario")))
+        self.assertEqual([0, 1, 2, 2, 1, 2, 3], hierarchy.levels().tolist())
+        self.assertRaises(KeyError, hierarchy.descendants, "Yukon")
+
+    def test_select_and_rollup(self):
+        hierarchy = geography()
+        data = pd.DataFrame({
+            "REF_DATE": ["2020"] * 7 + ["2021"] * 2,
+            "GEO": pd.Categorical(["Canada", "Ontario", "Toronto", "Ottawa", "Quebec", "Montreal", "Laval",
+                                   "Toronto", "Laval"]),
+            "VALUE": [100.0, 30.0, 20.0, 10.0, 70.0, 60.0, 5.0, 21.0, 6.0],
+        })
+        self.assertEqual(["Quebec", "Montreal", "Laval", "Laval"], hierarchy.select(data, "Quebec").GEO.tolist())
+        self.assertEqual(["Montreal", "Laval", "Laval"],
+                         hierarchy.select(data, "Quebec", include_self=False).GEO.tolist())
+
+        provinces = hierarchy.rollup(data, level=1)
+        self.assertEqual(
+            [("2020", "Ontario", 30.0), ("2020", "Quebec", 5.0), ("2021", "Ontario", 21.0), ("2021", "Quebec", 6.0)],
+            list(provinces[["REF_DATE", "GEO", "VALUE"]].itertuples(index=False, name=None)),
+        )
+        everything = hierarchy.rollup(data, level=1, leaves_only=False, aggfunc="max")
+        self.assertEqual(70.0, everything[(everything.REF_DATE == "2020") & (everything.GEO == "Quebec")].VALUE.iloc[0])
+
+        # The control columns are different for every member, so they are not grouped by
+        with_control_cols = data.assign(VECTOR=[f"v{i}" for i in range(9)], COORDINATE=[f"{i}.1" for i in range(9)],
+                                        STATUS="", SYMBOL="", TERMINATED="", DECIMALS=1)
+        pd.testing.assert_frame_equal(provinces, hierarchy.rollup(with_control_cols, level=1))
+
+    def test_cycle(self):
+        self.assertRaises(ValueError, MemberHierarchy, "GEO", [1, 2], [2, 1], ["a", "b"])
+
+    def test_rail_companies(self):
+        metadata = StatscanMetadata(os.path.join(DATA_DIR, "23100274_MetaData.csv"))
+        values = metadata.dimension_values
+        hierarchy = MemberHierarchy.from_dimension_values("Companies", values[values["Dimension ID"] == "2"])
+        terminals = hierarchy.descendants("Canadian National, System-wide")
+        self.assertEqual(10, len(terminals))
+        self.assertEqual("Canadian National, Edmonton terminal, Alberta ", terminals[0])
+
+    def test_statscan_zip_hierarchy(self):
+        with LocalServer() as server, tempfile.TemporaryDirectory() as root:
+            url = server.serve("/23100274-eng.zip", make_statscan_zip())
+            zip = StatscanZip(url, repo=Repo.at(root))
+            hierarchy = zip.hierarchy("Companies")
+            self.assertIs(hierarchy, zip.hierarchy("Companies"))
+            self.assertEqual(["Canada"], list(zip.hierarchy("Geography").descendants("Canada", include_self=True)))
+            self.assertRaises(ValueError, zip.hierarchy, "Province")
+
+            data = zip.get_data(wide=False, materialize=False)
+            cp = hierarchy.select(data, "Canadian Pacific, System-wide")
+            self.assertEqual(11, cp.Companies.nunique())
+            systems = hierarchy.rollup(data, level=0, aggfunc="mean")
+            self.assertEqual(4, systems.Companies.nunique())
+            self.assertTrue(np.isfinite(systems.VALUE).any())
+
+    def test_statscan_zip_geography_hierarchy(self):
+        with LocalServer() as server, tempfile.TemporaryDirectory() as root:
+            url = server.serve("/23100274-eng.zip", make_statscan_zip())
+            zip = StatscanZip(url, repo=Repo.at(root))
+            geography = zip.hierarchy("Geography")
+            self.assertEqual("Geo", geography.dimension)
+            self.assertIs(geography, zip.hierarchy("GEO"))
+            self.assertIs(geography, zip.hierarchy("Geo"))
+
+            data = zip.get_data(wide=False, materialize=False)
+            self.assertEqual(len(data), len(geography.select(data, "Canada")))
+            totals = geography.rollup(data, level=0)
+            self.assertEqual(["Canada"], totals.Geo.unique().tolist())
+            self.assertEqual(
+                len(data.drop_duplicates([col for col in totals.columns if col not in ["Geo", "VALUE"]])),
+                len(totals),
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
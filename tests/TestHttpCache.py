@@ -0,0 +1,121 @@
+import json
+import os
+import tempfile
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock
+from ocandata import core
+from ocandata.httpcache import HttpCache
+from LocalServer import LocalServer
+
+
+def fetch_all(directory, urls):
+    cache = HttpCache(directory, max_bytes=2500)
+    return [cache.get(url) for url in urls]
+
+
+class HttpCacheTestCase(unittest.TestCase):
+    def test_hit_miss_and_revalidate(self):
+        with LocalServer() as server, tempfile.TemporaryDirectory() as root:
+            url = server.serve("/page", "<html>Rail</html>", content_type="text/html; charset=utf-8")
+            cache = HttpCache(root)
+            self.assertEqual("<html>Rail</html>", cache.get(url))
+            self.assertEqual("<html>Rail</html>", HttpCache(root).get(url))
+            self.assertEqual(1, len(server.requests_for("/page")))
+
+            self.assertEqual("<html>Rail</html>", cache.get(url, ttl=0))
+            self.assertEqual(2, len(server.requests_for("/page")))
+            self.assertIn("If-None-Match", server.requests_for("/page")[-1])
+            self.assertEqual(1, cache.revalidated)
+
+            server.serve("/page", "<html>Road</html>", content_type="text/html; charset=utf-8")
+            self.assertEqual("<html>Road</html>", cache.get(url, ttl=0))
+            self.assertEqual(None, cache.get(server.url("/missing")))
+            self.assertEqual({"hits": 1, "misses": 3, "revalidated": 1, "evicted": 0, "entries": 1, "bytes": 17},
+                             cache.stats())
+
+    def test_same_content_is_stored_once(self):
+        with LocalServer() as server, tempfile.TemporaryDirectory() as root:
+            cache = HttpCache(root)
+            cache.get(server.serve("/a", "same"))
+            cache.get(server.serve("/b", "same"))
+            self.assertEqual(2, cache.stats()["entries"])
+            self.assertEqual(4, cache.size())
+
+    def test_evicts_least_recently_used(self):
+        with LocalServer() as server, tempfile.TemporaryDirectory() as root:
+            cache = HttpCache(root, max_bytes=2500)
+            urls = [server.serve(f"/{i}", str(i) * 1000) for i in range(3)]
+            cache.get(urls[0])
+            cache.get(urls[1])
+            os.utime(cache._entry_file(urls[1]), (1, 1))
+            cache.get(urls[0])
+            cache.get(urls[2])
+            self.assertEqual(1, cache.evicted)
+            self.assertEqual(2000, cache.size())
+            cache.get(urls[1])
+            self.assertEqual(2, len(server.requests_for("/1")))
+            self.assertEqual(1, len(server.requests_for("/2")))
+
+    def test_processes_share_the_cache(self):
+        with LocalServer() as server, tempfile.TemporaryDirectory() as root:
+            urls = [server.serve(f"/{i}", str(i % 10) * 500) for i in range(20)]
+            with ProcessPoolExecutor(max_workers=4) as ex:
+                results = list(ex.map(fetch_all, [root] * 4, [urls, urls[::-1], urls, urls[::-1]]))
+            expected = [str(i % 10) * 500 for i in range(20)]
+            self.assertEqual([expected, expected[::-1], expected, expected[::-1]], results)
+            cache = HttpCache(root, max_bytes=2500)
+            self.assertLessEqual(cache.size(), 2500)
+            self.assertEqual(cache.stats()["bytes"], cache.size())
+            for entry_file in cache.entries.glob("*.json"):
+                url = json.loads(entry_file.read_text())["url"]
+                self.assertIsNotNone(cache._lookup(url)[0])
+
+    def test_entries_keep_their_ttl(self):
+        with LocalServer() as server, tempfile.TemporaryDirectory() as root:
+            url = server.serve("/page", "Rail")
+            HttpCache(root).get(url, ttl=0)
+            self.assertEqual(0, json.loads(HttpCache(root)._entry_file(url).read_text())["ttl"])
+            # Another cache with a long default ttl still revalidates the entry
+            HttpCache(root, ttl=3600).get(url)
+            self.assertEqual(2, len(server.requests_for("/page")))
+
+    def test_storing_does_not_scan_the_cache(self):
+        with LocalServer() as server, tempfile.TemporaryDirectory() as root:
+            cache = HttpCache(root)
+            urls = [server.serve(f"/{i}", str(i) * 10) for i in range(3)]
+            cache.get(urls[0])
+            with mock.patch("pathlib.Path.glob", side_effect=AssertionError("The cache was scanned")):
+                cache.get(urls[1])
+                cache.get(urls[2])
+                server.serve("/2", "changed")
+                cache.get(urls[2], ttl=0)
+                self.assertEqual(27, cache.size())
+            self.assertEqual(27, cache.stats()["bytes"])
+
+    def test_index_is_rebuilt(self):
+        with LocalServer() as server, tempfile.TemporaryDirectory() as root:
+            cache = HttpCache(root)
+            cache.get(server.serve("/a", "same"))
+            cache.get(server.serve("/b", "same"))
+            os.remove(cache._index_file)
+            os.remove(cache._references_file(json.loads(cache._entry_file(server.url("/a")).read_text())["digest"]))
+            self.assertEqual(4, cache.size())
+            server.serve("/a", "different")
+            cache.get(server.url("/a"), ttl=0)
+            # /b still uses the old body
+            self.assertEqual(13, cache.size())
+            self.assertEqual("same", cache.get(server.url("/b")))
+
+    def test_core_get_uses_the_cache(self):
+        with LocalServer() as server, tempfile.TemporaryDirectory() as root:
+            url = server.serve("/page", "Rail")
+            with mock.patch("ocandata.core._http_cache", HttpCache(root)):
+                self.assertEqual("Rail", core.get(url))
+                self.assertEqual("Rail", core.get(url))
+                self.assertEqual("Rail", core.get(url, cache=False))
+            self.assertEqual(2, len(server.requests_for("/page")))
+
+
+if __name__ == "__main__":
+    unittest.main()
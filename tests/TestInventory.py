@@ -1,4 +1,8 @@
 import unittest
+import unittest.mock
+import tempfile
+from ocandata.repo import Repo
+from ocandata.text import Bm25Index
 from ocandata import Inventory
 import pandas as pd
 
@@ -35,5 +39,134 @@ class InventoryTestCase(unittest.TestCase):
         print(inventory.statscan)
 
 
+class InventoryViewTestCase(unittest.TestCase):
+
+    def create_inventory(self):
+        data = pd.DataFrame({'title_en': ['Rail', 'Road', 'Old'], 'title_fr': ['Rail fr', 'Route', 'Vieux'],
+                             'owner_org': ['statcan'] * 3,
+                             'released': ['2019-01-01', '2020-01-01', '1999-01-01'],
+                             'portal_url_en': ['http://open.canada.ca/data/en/dataset/1',
+                                               'http://open.canada.ca/data/en/dataset/2',
+                                               'http://open.canada.ca/data/en/dataset/3'],
+                             'portal_url_fr': ['http://ouvert.canada.ca/data/fr/dataset/1',
+                                               'http://ouvert.canada.ca/data/fr/dataset/2',
+                                               'http://ouvert.canada.ca/data/fr/dataset/3']})
+        return Inventory(data)
+
+    def test_language_views(self):
+        inventory = self.create_inventory()
+        self.assertEqual(['title', 'released', 'portal_url'], list(inventory.en.data.columns))
+        self.assertEqual(['Road', 'Rail'], inventory.en.data.title.tolist())
+        self.assertEqual(['Route', 'Rail fr'], inventory.FR.data.title.tolist())
+        self.assertEqual('fr', inventory.fr.language)
+        self.assertEqual('http://ouvert.canada.ca/data/fr/dataset/2', inventory.fr.data.portal_url[0])
+
+    def test_language_views_are_kept(self):
+        inventory = self.create_inventory()
+        self.assertIs(inventory.en, inventory.EN)
+        self.assertIs(inventory.fr, inventory.FR)
+        with unittest.mock.patch.object(Inventory, '__init__') as init:
+            inventory.en
+            inventory._view()
+            self.assertEqual('Road', inventory.query("title_en == 'Road'").en.data.title[0])
+            init.assert_not_called()
+
+
+class InventorySearchTestCase(unittest.TestCase):
+
+    def create_inventory(self, descriptions, repo=None):
+        return Inventory(pd.DataFrame({'title_en': [f'Title {i}' for i in range(len(descriptions))],
+                                       'description_en': descriptions,
+                                       'released': ['2020-01-01'] * len(descriptions),
+                                       'portal_url_en': [f'http://open.canada.ca/data/en/dataset/{i}'
+                                                         for i in range(len(descriptions))]}),
+                         sort_by_date=False, repo=repo)
+
+    def test_search_index_is_saved(self):
+        descriptions = ['rail dwell time', 'road traffic', 'air passengers', 'ferry routes']
+        with tempfile.TemporaryDirectory() as root, \
+                unittest.mock.patch('ocandata.text.preprocess', lambda text, **kwargs: text.lower().split()):
+            results = self.create_inventory(descriptions, Repo.at(root)).search('rail')
+            self.assertEqual('Title 0', results.data.title_en[0])
+            with unittest.mock.patch.object(Bm25Index, '_build') as build:
+                results = self.create_inventory(descriptions, Repo.at(root)).search('road')
+                build.assert_not_called()
+            self.assertEqual('Title 1', results.data.title_en[0])
+
+            changed = self.create_inventory(descriptions + ['rail freight'], Repo.at(root))
+            with unittest.mock.patch.object(Bm25Index, '_build', autospec=True, side_effect=Bm25Index._build) as build:
+                self.assertEqual('Title 4', changed.search('freight').data.title_en[0])
+                # The title and description indexes
+                self.assertEqual(2, build.call_count)
+
+    def test_search_index_without_a_repo_is_not_saved(self):
+        with unittest.mock.patch('ocandata.text.preprocess', lambda text, **kwargs: text.lower().split()), \
+                unittest.mock.patch.object(Bm25Index, 'save') as save:
+            inventory = self.create_inventory(['rail dwell time', 'road traffic'])
+            self.assertEqual('Title 1', inventory.search('road').data.title_en[0])
+            self.assertIsNone(inventory.repo)
+            save.assert_not_called()
+
+    def test_search_settings_are_in_the_index_key(self):
+        with tempfile.TemporaryDirectory() as root:
+            inventory = self.create_inventory(['rail dwell time', 'road traffic'], Repo.at(root))
+            directory = inventory._search_index_dir(inventory.data.description_en)
+            with unittest.mock.patch('ocandata.inventory.SEARCH_TOKENIZER', 'regex'):
+                self.assertNotEqual(directory, inventory._search_index_dir(inventory.data.description_en))
+            with unittest.mock.patch.dict('ocandata.inventory.SEARCH_FIELD_WEIGHTS', {'title': 3.0}):
+                self.assertEqual(directory, inventory._search_index_dir(inventory.data.description_en))
+            self.assertEqual(directory, inventory._search_index_dir(inventory.data.description_en))
+
+    def test_old_search_indexes_are_pruned(self):
+        with tempfile.TemporaryDirectory() as root, \
+                unittest.mock.patch('ocandata.text.preprocess', lambda text, **kwargs: text.lower().split()):
+            for version in range(6):
+                inventory = self.create_inventory(['rail dwell time', f'road traffic {version}'], Repo.at(root))
+                inventory.search('rail')
+            search_dir = Repo.at(root).dataset / 'search'
+            saved = sorted(path.name.split('-')[0] for path in search_dir.iterdir())
+            self.assertEqual(['description_en'] * 4 + ['title_en'], saved)
+            self.assertTrue(inventory._search_index_dir(inventory.data.description_en).exists())
+
+    def test_fields_and_filters(self):
+        data = pd.DataFrame({'title_en': ['Housing starts', 'Rail freight', 'Housing prices', 'Road traffic',
+                                          'Air passengers', 'Ferry routes'],
+                             'title_fr': ['Mises en chantier', 'Fret ferroviaire', 'Prix des logements', 'Trafic',
+                                          'Passagers aériens', 'Traversiers'],
+                             'description_en': ['New homes', 'Housing of rail cars', 'Prices', 'Cars', 'Planes', 'Boats'],
+                             'description_fr': ['Maisons', 'Wagons', 'Prix', 'Voitures', 'Avions', 'Bateaux'],
+                             'publisher_en': ['CMHC', 'Statistics Canada', 'CMHC'] + ['Transport Canada'] * 3,
+                             'publisher_fr': ['SCHL', 'Statistique Canada', 'SCHL'] + ['Transports Canada'] * 3,
+                             'owner_org': ['cmhc-schl', 'statcan', 'cmhc-schl', 'tc', 'tc', 'tc'],
+                             'released': ['2017-06-01', '2020-01-01', '2019-03-01', '2021-01-01', '2022-01-01', '2016-01-01'],
+                             'portal_url_en': [f'http://open.canada.ca/data/en/dataset/{i}' for i in range(6)]})
+        with tempfile.TemporaryDirectory() as root, \
+                unittest.mock.patch('ocandata.text.preprocess', lambda text, **kwargs: text.lower().split()):
+            inventory = Inventory(data, sort_by_date=False, repo=Repo.at(root))
+            results = inventory.search('housing', n=2)
+            self.assertEqual(['Housing starts', 'Housing prices'], results.data.title_en.tolist())
+            self.assertEqual(['title', 'description', 'publisher'], list(inventory.search_indexes))
+            self.assertEqual('en', inventory.search_indexes['title'].language)
+
+            # The description match counts for more than the title match when titles are weighted down
+            results = inventory.search('housing', n=1, field_weights={'title': 0.1})
+            self.assertEqual(['Rail freight'], results.data.title_en.tolist())
+
+            # The filters are applied before the best results are picked
+            results = inventory.search('housing', n=2, owner_org='cmhc-schl', released_after='2018')
+            self.assertEqual(['Housing prices'], results.data.title_en.tolist())
+            results = inventory.search('housing', n=2, publisher=['Statistics Canada', 'Transport Canada'])
+            self.assertEqual(['Rail freight', 'Road traffic'], results.data.title_en.tolist())
+            mask = inventory.filter_mask(released_before='2020-01')
+            self.assertEqual([True, False, True, False, False, True], mask.tolist())
+            self.assertIsNone(inventory.filter_mask())
+            self.assertRaises(KeyError, inventory.filter_mask, keywords='housing')
+
+            french = Inventory(data, language='fr', sort_by_date=False, repo=Repo.at(root))
+            results = french.search('logements', n=1, owner_org='cmhc-schl')
+            self.assertEqual(['Prix des logements'], results.data.title_fr.tolist())
+            self.assertEqual('fr', french.search_indexes['title'].language)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,7 +1,12 @@
 import unittest
 from ocandata.datatools import get_filename_from_url, download_file, unzip_data
+import io
 import os
+import tempfile
+import tracemalloc
+import zipfile
 from environs import Env
+from LocalServer import LocalServer, make_statscan_zip
 
 class IOTests(unittest.TestCase):
 
@@ -43,5 +48,40 @@ class IOTests(unittest.TestCase):
         env.read_env()
         env('LALA', 'a')
 
+    def test_download_file_from_local_server(self):
+        with LocalServer() as server, tempfile.TemporaryDirectory() as download_dir:
+            body = make_statscan_zip()
+            url = server.serve("/23100274-eng.zip", body)
+            local_file = download_file(url, download_dir)
+            self.assertEqual(os.path.join(download_dir, "23100274-eng.zip"), local_file)
+            with open(local_file, "rb") as f:
+                self.assertEqual(body, f.read())
+
+    def test_unzip_data_from_local_server(self):
+        with LocalServer() as server, tempfile.TemporaryDirectory() as download_dir:
+            url = server.serve("/23100274-eng.zip", make_statscan_zip())
+            files = unzip_data(url, path=download_dir)
+            self.assertEqual(
+                (os.path.join(download_dir, "23100274.csv"), os.path.join(download_dir, "23100274_MetaData.csv")),
+                files,
+            )
+            self.assertTrue(all(os.path.exists(f) for f in files))
+
+    def test_unzip_data_memory_is_bounded(self):
+        member_size = 32 * 1024 * 1024
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_STORED) as zip_file:
+            zip_file.writestr("big.csv", os.urandom(member_size))
+        with LocalServer() as server, tempfile.TemporaryDirectory() as download_dir:
+            url = server.serve("/big.zip", buffer.getvalue())
+            del buffer
+            tracemalloc.start()
+            files = unzip_data(url, path=download_dir)
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.assertEqual(member_size, os.path.getsize(files[0]))
+            self.assertLess(peak, member_size / 4)
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
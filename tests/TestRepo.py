@@ -1,8 +1,10 @@
 import unittest
 import os
 import shutil
+import tempfile
 from pathlib import Path
 from ocandata.repo import Repo
+from LocalServer import LocalServer, make_statscan_zip
 
 RAIL_DATA_URL: str = "https://www150.statcan.gc.ca/n1/tbl/csv/23100274-eng.zip"
 
@@ -39,6 +41,40 @@ class RepoTestCase(unittest.TestCase):
         files = repo.unzip(RAIL_DATA_URL)
         print(files)
 
+    def test_unzip_uses_downloaded_copy(self):
+        with LocalServer() as server, tempfile.TemporaryDirectory() as root:
+            url = server.serve("/23100274-eng.zip", make_statscan_zip())
+            repo: Repo = Repo.at(root)
+            files = repo.unzip(url, resource_id="23100274-eng")
+            self.assertEqual(2, len(files))
+            self.assertTrue(all(os.path.exists(f) for f in files))
+            self.assertTrue((repo.downloaded / "23100274-eng.json").exists())
+
+            # Fresh copy: no request at all
+            self.assertEqual(files, repo.unzip(url, resource_id="23100274-eng"))
+            self.assertEqual(1, len(server.requests_for("/23100274-eng.zip")))
+
+            # Stale copy: conditional GET answered with 304
+            self.assertEqual(files, repo.unzip(url, resource_id="23100274-eng", max_age=0))
+            requests = server.requests_for("/23100274-eng.zip")
+            self.assertEqual(2, len(requests))
+            self.assertIsNotNone(requests[-1].get("If-None-Match"))
+            self.assertIsNotNone(requests[-1].get("If-Modified-Since"))
+
+    def test_download_when_changed(self):
+        with LocalServer() as server, tempfile.TemporaryDirectory() as root:
+            url = server.serve("/23100274-eng.zip", make_statscan_zip())
+            repo: Repo = Repo.at(root)
+            repo.unzip(url, resource_id="23100274-eng")
+            zip_file, changed = repo.download(url, resource_id="23100274-eng", max_age=0)
+            self.assertFalse(changed)
+
+            server.serve("/23100274-eng.zip", make_statscan_zip("23100275"))
+            zip_file, changed = repo.download(url, resource_id="23100274-eng", max_age=0)
+            self.assertTrue(changed)
+            files = repo.unzip(url, resource_id="23100274-eng", max_age=0)
+            self.assertTrue(files[0].endswith("23100275.csv"))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,63 @@
+import tempfile
+import time
+import unittest
+from unittest import mock
+from ocandata.inventory import Inventory
+from ocandata.repo import Repo
+from ocandata.snapshot import CsvSnapshot
+from LocalServer import LocalServer
+
+_HEADER = "ref_number,size,eligible_for_release,user_votes,date_released,date_published,title_en,title_fr," \
+          "description_en,description_fr,publisher_en,publisher_fr,portal_url_en,portal_url_fr\n"
+
+
+def inventory_csv(*titles):
+    rows = [f"A-{i},1,Y,0,2020-01-0{i + 1},2020-01-0{i + 1},{title},{title} fr,About {title},Au sujet,StatCan,StatCan,"
+            f"http://open.canada.ca/data/en/dataset/{i:032d},http://ouvert.canada.ca/data/fr/dataset/{i:032d}\n"
+            for i, title in enumerate(titles)]
+    return _HEADER + "".join(rows)
+
+
+class CsvSnapshotTestCase(unittest.TestCase):
+    def test_load_and_refresh(self):
+        with LocalServer() as server, tempfile.TemporaryDirectory() as root:
+            url = server.serve("/inventory.csv", inventory_csv("Rail", "Road"), content_type="text/csv")
+            repo = Repo.at(root)
+            snapshot = CsvSnapshot(url, "inventory", repo=repo)
+            self.assertEqual(["Rail", "Road"], snapshot.load().title_en.tolist())
+            self.assertTrue(snapshot.parquet_file.exists())
+
+            # A new snapshot object uses the copy in the repo
+            start = time.time()
+            self.assertEqual(["Rail", "Road"], CsvSnapshot(url, "inventory", repo=repo).load().title_en.tolist())
+            self.assertLess(time.time() - start, 0.5)
+            self.assertEqual(1, len(server.requests_for("/inventory.csv")))
+
+            # A stale copy is returned as is and revalidated in the background
+            modified = snapshot.parquet_file.stat().st_mtime_ns
+            self.assertEqual(2, len(snapshot.load(max_age=0)))
+            snapshot.wait()
+            self.assertIn("If-None-Match", server.requests_for("/inventory.csv")[-1])
+            self.assertEqual(modified, snapshot.parquet_file.stat().st_mtime_ns)
+
+            server.serve("/inventory.csv", inventory_csv("Rail", "Road", "Air"), content_type="text/csv")
+            self.assertEqual(2, len(snapshot.load(max_age=0)))
+            snapshot.wait()
+            self.assertEqual(["Rail", "Road", "Air"], snapshot.load().title_en.tolist())
+            requests = len(server.requests_for("/inventory.csv"))
+            self.assertEqual(3, len(snapshot.load(max_age=0, background=False)))
+            self.assertEqual(requests + 1, len(server.requests_for("/inventory.csv")))
+
+    def test_inventory_reads_the_snapshot(self):
+        with LocalServer() as server, tempfile.TemporaryDirectory() as root:
+            url = server.serve("/inventory.csv", inventory_csv("Rail", "Road"), content_type="text/csv")
+            with mock.patch("ocandata.inventory._inventory_snapshot", CsvSnapshot(url, "inventory", repo=Repo.at(root))):
+                inventory = Inventory()
+                self.assertEqual(["Road", "Rail"], inventory.data.title_en.tolist())
+                self.assertNotIn("ref_number", inventory.data.columns)
+                Inventory()
+            self.assertEqual(1, len(server.requests_for("/inventory.csv")))
+
+
+if __name__ == "__main__":
+    unittest.main()
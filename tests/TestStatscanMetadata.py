@@ -0,0 +1,84 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from ocandata.statscan import StatscanMetadata, read_metadata_sections, get_encoding_type
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+METADATA_FILE = os.path.join(DATA_DIR, "23100274_MetaData.csv")
+
+
+class StatscanMetadataTestCase(unittest.TestCase):
+    def test_sections(self):
+        metadata = StatscanMetadata(METADATA_FILE)
+        self.assertEqual(["CubeInfo", "Dimensions", "DimensionValues", "Notes"], list(metadata.sections))
+        self.assertEqual("Weekly rail terminal performance indicator, Transport Canada", metadata.name)
+        self.assertEqual("Indicator", metadata.pivot_column())
+        self.assertEqual(["Geography", "Companies", "Indicator"], metadata.dimensions["Dimension name"].tolist())
+
+    def test_quoted_member_names(self):
+        metadata = StatscanMetadata(METADATA_FILE)
+        members = metadata.dimension_values
+        self.assertEqual(40, len(members))
+        self.assertEqual("Canadian National, System-wide", members["Member Name"][1])
+        self.assertEqual("1", members["Parent Member ID"][2])
+
+    def test_reads_only_up_to_wanted_sections(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            metadata_file = os.path.join(temp_dir, "metadata.csv")
+            with open(METADATA_FILE, "rb") as f:
+                content = f.read()
+            cut = content.index(b'"Dimension ID","Member Name"')
+            # Nothing past the Dimensions section is decoded, so the invalid bytes are never seen
+            padding = b"2,Member\n" * 20000
+            with open(metadata_file, "wb") as f:
+                f.write(content[:cut] + b'"Dimension ID","Member Name"\n' + padding + b'\xff\xfe"broken\n')
+            sections = read_metadata_sections(metadata_file, wanted=["Dimensions"])
+            self.assertEqual(["Dimensions"], list(sections))
+
+    def test_sections_are_cached_per_file(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            metadata_file = os.path.join(temp_dir, "metadata.csv")
+            shutil.copy(METADATA_FILE, metadata_file)
+            self.assertEqual("Indicator", StatscanMetadata(metadata_file).pivot_column())
+            with mock.patch("ocandata.statscan.read_metadata_sections") as read_sections:
+                self.assertEqual("Indicator", StatscanMetadata(metadata_file).pivot_column())
+                read_sections.assert_not_called()
+
+            with open(metadata_file, "r", encoding="utf-8-sig") as f:
+                content = f.read().replace("3,Indicator", "3,Performance indicator")
+            with open(metadata_file, "w", encoding="utf-8-sig") as f:
+                f.write(content + "\n")
+            self.assertEqual("Performance indicator", StatscanMetadata(metadata_file).pivot_column())
+
+    def test_parse_sections_reads_every_section(self):
+        sections = list(StatscanMetadata.parse_sections(METADATA_FILE))
+        self.assertEqual(7, len(sections))
+        self.assertEqual("Symbol Legend", sections[3].columns[0])
+        everything = read_metadata_sections(METADATA_FILE, everything=True)
+        self.assertIn("Symbol Legend", everything)
+        self.assertIn("Survey Code", everything)
+        self.assertEqual(40, len(everything["DimensionValues"]))
+
+    def test_cached_sections_are_copies(self):
+        metadata = StatscanMetadata(METADATA_FILE)
+        dims = metadata.dimensions
+        dims["Dimension name"] = "changed"
+        self.assertNotIn("changed", metadata.dimensions["Dimension name"].tolist())
+        self.assertEqual("Indicator", StatscanMetadata(METADATA_FILE).pivot_column())
+        self.assertEqual("Indicator", metadata.pivot_column())
+
+    def test_encoding(self):
+        self.assertEqual("utf-8-sig", get_encoding_type(METADATA_FILE))
+        with tempfile.TemporaryDirectory() as temp_dir:
+            latin_file = os.path.join(temp_dir, "latin.csv")
+            with open(latin_file, "w", encoding="latin-1") as f:
+                f.write('"Dimension ID","Dimension name"\n1,Géographie\n2,Caractéristiques du ménage\n')
+            self.assertNotIn(get_encoding_type(latin_file), ["utf-8", "utf-8-sig"])
+            sections = read_metadata_sections(latin_file)
+            self.assertEqual("Géographie", sections["Dimensions"]["Dimension name"][0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,11 @@
+import pickle
 import unittest
+import tempfile
+from unittest import mock
 import pandas as pd
-from ocandata.statscan import StatscanZip, StatscanUrl, StatscanMetadata
+from ocandata.repo import Repo
+from ocandata.statscan import StatscanZip, StatscanUrl, StatscanMetadata, compact_statscan_data
+from LocalServer import LocalServer, make_statscan_zip, read_sample_data
 pd.set_option('display.max_columns', 20)
 
 RAIL_DATA_URL: str = "https://www150.statcan.gc.ca/n1/tbl/csv/23100274-eng.zip"
@@ -77,5 +82,283 @@ class StatscanZipTests(unittest.TestCase):
         print(data)
         print(data.columns)
 
+    def test_get_data_from_repo_download(self):
+        with LocalServer() as server, tempfile.TemporaryDirectory() as root:
+            url = server.serve("/23100274-eng.zip", make_statscan_zip())
+            repo: Repo = Repo.at(root)
+            data = StatscanZip(url, repo=repo).get_data()
+            self.assertTrue("Terminal dwell-time" in data.columns)
+            # A second instance reuses the download
+            StatscanZip(url, repo=repo).get_data()
+            self.assertEqual(1, len(server.requests_for("/23100274-eng.zip")))
+
+    def test_iter_data(self):
+        with LocalServer() as server, tempfile.TemporaryDirectory() as root:
+            url = server.serve("/23100274-eng.zip", make_statscan_zip())
+            zip = StatscanZip(url, repo=Repo.at(root))
+            chunks = list(zip.iter_data(chunksize=500))
+            self.assertEqual([500, 500, 448], [len(chunk) for chunk in chunks])
+            for chunk in chunks:
+                self.assertTrue(pd.api.types.is_datetime64_any_dtype(chunk.Date))
+                self.assertFalse("VECTOR" in chunk.columns)
+                self.assertTrue("Indicator" in chunk.columns)
+            self.assertIsNotNone(zip.metadata)
+
+    def test_get_data_with_filters(self):
+        with LocalServer() as server, tempfile.TemporaryDirectory() as root:
+            url = server.serve("/23100274-eng.zip", make_statscan_zip())
+            zip = StatscanZip(url, repo=Repo.at(root))
+            companies = ["Canadian Pacific, System-wide", "CSXT, System-wide"]
+            data = zip.get_data(
+                filters={"Companies": companies, "REF_DATE": ("2019-01-01", "2019-03-31")}
+            )
+            full = zip.get_data()
+            expected = full[
+                full.Companies.isin(companies)
+                & (full.Date >= "2019-01-01")
+                & (full.Date <= "2019-03-31")
+            ].reset_index(drop=True)
+            self.assertEqual(len(expected), len(data))
+            self.assertEqual(set(companies), set(data.Companies))
+            pd.testing.assert_series_equal(expected["Terminal dwell-time"], data["Terminal dwell-time"])
+
+    def test_get_data_with_columns(self):
+        with LocalServer() as server, tempfile.TemporaryDirectory() as root:
+            url = server.serve("/23100274-eng.zip", make_statscan_zip())
+            zip = StatscanZip(url, repo=Repo.at(root))
+            data = zip.get_data(
+                wide=False, filters={"Geography": ["Canada"]}, columns=["REF_DATE", "Companies", "VALUE"]
+            )
+            self.assertEqual(["Date", "Companies", "VALUE"], data.columns.tolist())
+            self.assertEqual(1448, len(data))
+
+    def test_get_data_with_invalid_filter(self):
+        with LocalServer() as server, tempfile.TemporaryDirectory() as root:
+            url = server.serve("/23100274-eng.zip", make_statscan_zip())
+            zip = StatscanZip(url, repo=Repo.at(root))
+            self.assertRaises(ValueError, zip.get_data, filters={"Province": ["Ontario"]})
+            self.assertRaises(ValueError, zip.get_data, columns=["REF_DATE", "VALUE"])
+
+    def test_get_data_is_materialized_in_repo(self):
+        with LocalServer() as server, tempfile.TemporaryDirectory() as root:
+            url = server.serve("/23100274-eng.zip", make_statscan_zip())
+            repo: Repo = Repo.at(root)
+            data = StatscanZip(url, repo=repo).get_data()
+            self.assertEqual(1, len(list((repo.dataset / "23100274-eng").glob("*.parquet"))))
+
+            with mock.patch("ocandata.statscan.read_statscan_csv", side_effect=AssertionError("CSV was read")):
+                zip = StatscanZip(url, repo=repo)
+                cached = zip.get_data()
+                pd.testing.assert_frame_equal(data, cached)
+                self.assertEqual(["Hours"], zip.get_units_of_measure().UOM.tolist())
+
+            # Other options are kept in a file of their own
+            long = StatscanZip(url, repo=repo).get_data(wide=False)
+            self.assertEqual(1448, len(long))
+            self.assertEqual(2, len(list((repo.dataset / "23100274-eng").glob("*.parquet"))))
+
+    def test_materialized_data_is_refreshed_when_zip_changes(self):
+        with LocalServer() as server, tempfile.TemporaryDirectory() as root:
+            url = server.serve("/23100274-eng.zip", make_statscan_zip())
+            repo: Repo = Repo.at(root)
+            StatscanZip(url, repo=repo).get_data()
+
+            changed = make_statscan_zip(data=read_sample_data().replace("Terminal dwell-time", "Terminal dwell-hour"))
+            server.serve("/23100274-eng.zip", changed)
+            with mock.patch("ocandata.repo.DOWNLOAD_MAX_AGE", 0):
+                data = StatscanZip(url, repo=repo).get_data()
+            self.assertTrue("Terminal dwell-hour" in data.columns)
+
+    def test_vector(self):
+        with LocalServer() as server, tempfile.TemporaryDirectory() as root:
+            url = server.serve("/23100274-eng.zip", make_statscan_zip())
+            zip = StatscanZip(url, repo=Repo.at(root))
+            data = zip.get_data(wide=False, drop_control_cols=False, materialize=False)
+            expected = data[data.VECTOR == "v1014136365"]
+
+            series = zip.vector("v1014136365")
+            self.assertEqual(len(expected), len(series))
+            self.assertTrue(series.Date.is_monotonic_increasing)
+            self.assertEqual(sorted(expected.VALUE.tolist()), sorted(series.VALUE.tolist()))
+            self.assertEqual(["Canadian National, System-wide"], series.Companies.unique().tolist())
+            pd.testing.assert_frame_equal(series, zip.vector(1014136365))
+            self.assertIn("v1014136365", zip.vector_index())
+            self.assertNotIn("v1", zip.vector_index())
+            self.assertRaises(KeyError, zip.vector, "v1")
+
+            both = zip.vectors(["v1014136366", "v1014136365"])
+            self.assertEqual(["v1014136366", "v1014136365"], both.VECTOR.unique().tolist())
+            self.assertEqual(len(expected) + len(data[data.VECTOR == "v1014136366"]), len(both))
+            self.assertEqual(data.VECTOR.nunique(), len(zip.vector_index()))
+
+    def test_vector_index_from_loaded_data(self):
+        with LocalServer() as server, tempfile.TemporaryDirectory() as root:
+            url = server.serve("/23100274-eng.zip", make_statscan_zip())
+            from_file = StatscanZip(url, repo=Repo.at(root)).vector("v1014136365")
+            zip = StatscanZip(url, repo=Repo.at(root))
+            zip.get_data(wide=False, drop_control_cols=False, materialize=False)
+            with mock.patch("ocandata.statscan.read_statscan_csv", side_effect=AssertionError("CSV was read")):
+                pd.testing.assert_frame_equal(from_file, zip.vector("v1014136365"))
+
+            # The lock is left out when a StatscanZip is pickled, e.g. for a process pool
+            copy = pickle.loads(pickle.dumps(StatscanZip(url, repo=Repo.at(root))))
+            pd.testing.assert_frame_equal(from_file, copy.vector("v1014136365"))
+
+    def test_vector_index_after_wide_data(self):
+        lines = read_sample_data().splitlines(keepends=True)
+        # A second indicator with its own vectors, which the wide data pivots into columns
+        cars = [line.replace("Terminal dwell-time", "Cars online").replace('"v10141363', '"v20141363')
+                for line in lines[1:]]
+        with LocalServer() as server, tempfile.TemporaryDirectory() as root:
+            url = server.serve("/23100274-eng.zip", make_statscan_zip(data="".join(lines + cars)))
+            zip = StatscanZip(url, repo=Repo.at(root))
+            zip.get_data(wide=True, drop_control_cols=False, materialize=False)
+            dwell_time = zip.vector("v1014136365")
+            cars_online = zip.vector("v2014136365")
+            self.assertEqual(["Terminal dwell-time"], dwell_time.Indicator.unique().tolist())
+            self.assertEqual(["Cars online"], cars_online.Indicator.unique().tolist())
+            self.assertEqual(dwell_time.VALUE.tolist(), cars_online.VALUE.tolist())
+
+    def test_refresh_rewrites_only_changed_partitions(self):
+        lines = read_sample_data().splitlines(keepends=True)
+        header, rows = lines[0], lines[1:]
+        last_date = rows[-1][1:11]
+        first_row = rows[0]
+        # The first download is missing the last week, has a vector that goes away, and a value that is revised
+        terminated_row = first_row.replace("v1014136365", "v999").replace('"18.6"', '"1.0"')
+        earlier = [row for row in rows if not row.startswith(f'"{last_date}"')]
+        earlier = [first_row.replace('"18.6"', '"18.5"'), terminated_row] + earlier[1:]
+        with LocalServer() as server, tempfile.TemporaryDirectory() as root:
+            url = server.serve("/23100274-eng.zip", make_statscan_zip(data=header + "".join(earlier)))
+            repo: Repo = Repo.at(root)
+            first = StatscanZip(url, repo=repo).refresh()
+            self.assertEqual(len(earlier), len(first.rows))
+            self.assertIn("v999", first.added)
+            self.assertEqual([], first.revised)
+
+            partitions = StatscanZip(url, repo=repo)._partitions_dir()
+            written = {path.name: path.stat().st_mtime_ns for path in partitions.glob("*.parquet")}
+            self.assertFalse(StatscanZip(url, repo=repo).refresh(max_age=0).changed)
+
+            server.serve("/23100274-eng.zip", make_statscan_zip())
+            zip = StatscanZip(url, repo=repo)
+            report = zip.refresh(max_age=0)
+            self.assertEqual([last_date], report.ref_dates_added)
+            self.assertEqual(["2018-11-24"], report.ref_dates_revised)
+            self.assertEqual(["v1014136365"], report.revised)
+            self.assertEqual(["v999"], report.terminated)
+            self.assertEqual([], report.added)
+            self.assertEqual(
+                len([row for row in rows if row.startswith(f'"{last_date}"')]) + 1, len(report.rows)
+            )
+            for path in partitions.glob("*.parquet"):
+                if path.stem not in [last_date, "2018-11-24"]:
+                    self.assertEqual(written[path.name], path.stat().st_mtime_ns)
+
+            stored = zip.read_partitions()
+            self.assertEqual(len(rows), len(stored))
+            self.assertEqual(18.6, stored[stored.VECTOR == "v1014136365"].VALUE.iloc[0])
+            self.assertEqual(1, zip.read_partitions([last_date]).REF_DATE.nunique())
+
+    def test_read_from_zip_without_extracting(self):
+        with LocalServer() as server, tempfile.TemporaryDirectory() as root:
+            url = server.serve("/23100274-eng.zip", make_statscan_zip())
+            repo: Repo = Repo.at(root)
+            zip = StatscanZip(url, repo=repo, extract=False)
+            data = zip.get_data(materialize=False)
+            self.assertEqual('Indicator', zip.get_metadata().pivot_column())
+            self.assertEqual([], list(repo.extracted.iterdir()))
+            self.assertEqual(3, len(list(zip.iter_data(chunksize=500))))
+            self.assertEqual(48, len(zip.get_data(filters={"Companies": ["CSXT, System-wide"]}, wide=False)))
+
+            extracted = StatscanZip(url, repo=repo).get_data(materialize=False)
+            pd.testing.assert_frame_equal(extracted, data)
+
+    def test_fetch_many(self):
+        with LocalServer() as server, tempfile.TemporaryDirectory() as root:
+            urls = [server.serve(f"/2310027{i}-eng.zip", make_statscan_zip(f"2310027{i}")) for i in range(4, 8)]
+            server.fail("/23100275-eng.zip", times=2)
+            missing = server.url("/23100279-eng.zip")
+            report = StatscanZip.fetch_many(
+                urls + [missing, "notazip"], repo=Repo.at(root), max_workers=3, backoff_factor=0
+            )
+            self.assertEqual(set(urls), set(report.zips))
+            self.assertEqual({missing, "notazip"}, set(report.errors))
+            self.assertEqual(3, len(server.requests_for("/23100275-eng.zip")))
+            self.assertGreater(report.bytes_downloaded, 4 * 10000)
+            self.assertGreater(report.throughput, 0)
+            for url, zip in report.zips.items():
+                self.assertEqual('Indicator', zip.metadata.pivot_column())
+                self.assertIsNone(zip.session)
+            self.assertEqual(1448, len(report.zips[urls[0]].get_data(wide=False)))
+
+    def test_dimension_columns_use_metadata_categories(self):
+        with LocalServer() as server, tempfile.TemporaryDirectory() as root:
+            extra = read_sample_data().replace('"CSXT, Sarnia, Ontario "', '"CSXT, Sarnia yard, Ontario"')
+            url = server.serve("/23100274-eng.zip", make_statscan_zip(data=extra))
+            zip = StatscanZip(url, repo=Repo.at(root))
+            data = zip.get_data(wide=False, materialize=False)
+            companies = data.Companies.cat.categories.tolist()
+            self.assertEqual("Canadian National, System-wide", companies[0])
+            self.assertEqual(1, companies.count("Not applicable"))
+            # A value that isn't in the metadata is kept rather than lost
+            self.assertEqual("CSXT, Sarnia yard, Ontario", companies[-1])
+            self.assertFalse(data.Companies.isna().any())
+            self.assertTrue(isinstance(data.Indicator.dtype, pd.CategoricalDtype))
+
+            chunks = list(zip.iter_data(chunksize=500))
+            self.assertTrue(all(chunk.Companies.dtype == chunks[0].Companies.dtype for chunk in chunks))
+            wide = zip.get_data(materialize=False)
+            self.assertTrue(isinstance(wide.Companies.dtype, pd.CategoricalDtype))
+
+    def test_iter_data_chunks_have_the_same_dtypes(self):
+        with LocalServer() as server, tempfile.TemporaryDirectory() as root:
+            lines = read_sample_data().splitlines()
+            # A company that isn't in the metadata in the last chunk, and a missing date in the first
+            lines[-1] = lines[-1].replace('"CSXT, Sarnia, Ontario "', '"CSXT, Sarnia yard, Ontario"')
+            lines[1] = lines[1].replace('"2018-11-24"', '""', 1)
+            url = server.serve("/23100274-eng.zip", make_statscan_zip(data="\n".join(lines) + "\n"))
+            chunks = list(StatscanZip(url, repo=Repo.at(root)).iter_data(chunksize=500))
+            for column in ["Companies", "Date"]:
+                self.assertTrue(all(chunk[column].dtype == chunks[0][column].dtype for chunk in chunks))
+            self.assertEqual("CSXT, Sarnia yard, Ontario", chunks[0].Companies.cat.categories[-1])
+            data = pd.concat(chunks, ignore_index=True)
+            self.assertTrue(isinstance(data.Companies.dtype, pd.CategoricalDtype))
+            self.assertTrue(pd.api.types.is_datetime64_any_dtype(data.Date))
+            self.assertTrue(pd.isna(data.Date[0]))
+
+    def test_get_data_compact(self):
+        with LocalServer() as server, tempfile.TemporaryDirectory() as root:
+            url = server.serve("/23100274-eng.zip", make_statscan_zip())
+            repo: Repo = Repo.at(root)
+            data = StatscanZip(url, repo=repo).get_data(wide=False, drop_control_cols=False)
+            zip = StatscanZip(url, repo=repo)
+            compact = zip.get_data(wide=False, drop_control_cols=False, compact=True)
+            self.assertEqual("float32", compact.VALUE.dtype)
+            self.assertEqual("int8", compact.DECIMALS.dtype)
+            # Rounded to the published decimals the values are unchanged
+            self.assertTrue(
+                ((compact.VALUE.astype("float64") * 10).round() / 10).equals(data.VALUE)
+            )
+            report = zip.memory_report()
+            self.assertLess(report.loc["Total", "bytes_after"], report.loc["Total", "bytes_before"] / 2)
+            self.assertEqual("float64", report.loc["VALUE", "dtype_before"])
+
+            # The compacted data is read back from the repo, with the report from when it was compacted
+            reused = StatscanZip(url, repo=repo)
+            with mock.patch("ocandata.statscan.read_statscan_csv", side_effect=AssertionError("CSV was read")):
+                reused.get_data(wide=False, drop_control_cols=False, compact=True)
+                pd.testing.assert_frame_equal(report, reused.memory_report())
+
+            wide = StatscanZip(url, repo=repo).get_data(compact=True)
+            self.assertEqual("float32", wide["Terminal dwell-time"].dtype)
+
+    def test_compact_keeps_float64_when_float32_loses_precision(self):
+        data = pd.DataFrame({"VALUE": [1.5, 1234567.891], "DECIMALS": [1, 3]})
+        self.assertEqual("float64", compact_statscan_data(data).VALUE.dtype)
+        data = pd.DataFrame({"VALUE": [1.5, 12.345], "DECIMALS": [1, 3]})
+        self.assertEqual("float32", compact_statscan_data(data).VALUE.dtype)
+
+
 if __name__ == "__main__":
     unittest.main()
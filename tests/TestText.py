@@ -0,0 +1,153 @@
+import json
+import os
+import random
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+import pandas as pd
+from ocandata.text import Bm25Index, MultiFieldIndex, top_k, top_documents, preprocess, preprocess_all, \
+    regex_tokenize, stem
+
+try:
+    from rank_bm25 import BM25Okapi
+except ImportError:
+    BM25Okapi = None
+
+
+def random_corpus(num_docs=2000, seed=0):
+    rng = random.Random(seed)
+    words = [f"w{i}" for i in range(500)]
+    return [rng.choices(words[:rng.randint(5, 500)], k=rng.randint(0, 40)) for _ in range(num_docs)]
+
+
+class Bm25IndexTestCase(unittest.TestCase):
+
+    @unittest.skipIf(BM25Okapi is None, "rank_bm25 is not installed")
+    def test_scores_match_rank_bm25(self):
+        corpus = random_corpus()
+        reference = BM25Okapi(corpus)
+        index = Bm25Index.from_tokenized(corpus)
+        for query in [["w1", "w2", "w3"], ["w1", "w1", "w400"], ["w0"], ["missing"], []]:
+            expected = reference.get_scores(query)
+            np.testing.assert_allclose(expected, index.scores(query), rtol=1e-12, atol=1e-12)
+            top_indices, top_scores = index.top(query, 10)
+            np.testing.assert_array_equal(np.argsort(-expected, kind='stable')[:10], top_indices)
+            np.testing.assert_allclose(expected[top_indices], top_scores, rtol=1e-12, atol=1e-12)
+
+    def test_negative_idf_floor(self):
+        # "common" is in every document, so its idf is negative and gets the floor
+        corpus = [["common", "rail"], ["common", "road"], ["common", "air"], ["common"]]
+        index = Bm25Index.from_tokenized(corpus)
+        idf = index.idf[index.vocabulary["common"]]
+        rare_idf = np.log(4 - 1 + 0.5) - np.log(1 + 0.5)
+        average_idf = (3 * rare_idf + np.log(0.5) - np.log(4.5)) / 4
+        self.assertAlmostEqual(0.25 * average_idf, idf)
+        top_indices, top_scores = index.top(["rail", "common"], 2)
+        self.assertEqual(0, top_indices[0])
+
+    def test_top_pads_with_unmatched_documents(self):
+        index = Bm25Index.from_tokenized([["a"], ["b"], ["a", "b"], ["c"]])
+        top_indices, top_scores = index.top(["c"], 3)
+        self.assertEqual([3, 0, 1], top_indices.tolist())
+        self.assertEqual([0.0, 0.0], top_scores[1:].tolist())
+        self.assertEqual(4, len(index.top(["c"], 10)[0]))
+
+    def test_save_and_load(self):
+        index = Bm25Index.from_tokenized(random_corpus(200))
+        with tempfile.TemporaryDirectory() as root:
+            directory = os.path.join(root, "index")
+            self.assertRaises(FileNotFoundError, Bm25Index.load, directory)
+            index.save(directory)
+            loaded = Bm25Index.load(directory)
+            self.assertIsInstance(np.load(os.path.join(directory, "data.npy"), mmap_mode="r"), np.memmap)
+            np.testing.assert_array_equal(index.scores(["w1", "w2"]), loaded.scores(["w1", "w2"]))
+            self.assertEqual(index.vocabulary, loaded.vocabulary)
+            self.assertEqual([], [name for name in os.listdir(root) if name != "index"])
+
+    def test_save_replaces_an_old_version(self):
+        index = Bm25Index.from_tokenized(random_corpus(200))
+        with tempfile.TemporaryDirectory() as root:
+            directory = os.path.join(root, "index")
+            index.save(directory)
+            with mock.patch("ocandata.text._INDEX_VERSION", -1):
+                self.assertRaises(FileNotFoundError, Bm25Index.load, directory)
+                index.save(directory)
+                with open(os.path.join(directory, "index.json")) as f:
+                    self.assertEqual(-1, json.load(f)["version"])
+                Bm25Index.load(directory)
+
+    def test_top_k(self):
+        scores = np.array([1.0, 3.0, 2.0, 3.0, 0.0, 2.0])
+        self.assertEqual([1, 3, 2], top_k(scores, 3).tolist())
+        self.assertEqual([1, 3, 2, 5, 0, 4], top_k(scores, 10).tolist())
+        self.assertEqual([], top_k(scores, 0).tolist())
+
+    def test_get_scores(self):
+        with mock.patch("ocandata.text.preprocess", lambda text, **kwargs: text.lower().split()):
+            index = Bm25Index(pd.Series(["Rail dwell time", "Road traffic", None, "rail rail", "Air"]))
+            top_indices, top_scores = index.get_scores("rail", 2)
+        self.assertEqual([3, 0], top_indices.tolist())
+        self.assertGreater(top_scores[0], top_scores[1])
+
+    def test_parallel_build_matches_serial(self):
+        rng = random.Random(0)
+        words = ["rail", "railways", "dwelling", "dwell", "times", "road", "traffic", "passengers", "ferries"]
+        column = pd.Series([" ".join(rng.choices(words, k=rng.randint(0, 12))).capitalize() + "."
+                            for _ in range(2500)])
+        serial = Bm25Index(column, tokenizer="regex")
+        parallel = Bm25Index(column, tokenizer="regex", workers=2)
+        self.assertEqual(serial.vocabulary, parallel.vocabulary)
+        np.testing.assert_array_equal(serial.weights.toarray(), parallel.weights.toarray())
+        np.testing.assert_array_equal(serial.idf, parallel.idf)
+        self.assertEqual(serial.get_scores("Railways", 5)[0].tolist(), parallel.get_scores("railway", 5)[0].tolist())
+
+    def test_regex_tokenizer(self):
+        self.assertEqual(["rail", "s", "dwell", "time_2020"], regex_tokenize("rail's dwell-time_2020!"))
+        self.assertEqual(["railway", "dwell", "time"], preprocess("Railways, dwelling times.", tokenizer="regex"))
+        self.assertRaises(ValueError, preprocess_all, ["rail"], tokenizer="missing")
+
+    def test_stems_are_cached(self):
+        stem.cache_clear()
+        preprocess_all(["rail rail", "rail road"], tokenizer="regex")
+        info = stem.cache_info()
+        self.assertEqual((2, 2), (info.hits, info.misses))
+
+    def test_french_stemmer(self):
+        self.assertEqual(["log", "publi"], preprocess("Logements publiés", tokenizer="regex", language="fr"))
+        index = Bm25Index(pd.Series(["Prix des logements", "Mises en chantier"]), tokenizer="regex", language="fr")
+        self.assertEqual(0, index.get_scores("logement", 1)[0][0])
+        self.assertRaises(ValueError, preprocess_all, ["logement"], language="de")
+
+    def test_top_documents_mask(self):
+        docs, weights = np.array([0, 1, 1, 3]), np.array([1.0, 2.0, 2.0, 3.0])
+        mask = np.array([True, False, True, True, True])
+        top_indices, top_scores = top_documents(docs, weights, 5, 3, mask)
+        self.assertEqual([3, 0, 2], top_indices.tolist())
+        self.assertEqual([3.0, 1.0, 0.0], top_scores.tolist())
+        self.assertEqual([], top_documents(docs, weights, 5, 3, np.zeros(5, dtype=bool))[0].tolist())
+
+
+class MultiFieldIndexTestCase(unittest.TestCase):
+
+    def test_weighted_fields(self):
+        corpus = random_corpus(300)
+        titles = Bm25Index.from_tokenized(corpus[:150] * 2)
+        descriptions = Bm25Index.from_tokenized(corpus[150:] * 2)
+        index = MultiFieldIndex({"title": titles, "description": descriptions}, {"title": 2.0})
+        with mock.patch("ocandata.text.preprocess", lambda text, **kwargs: text.split()):
+            top_indices, top_scores = index.top("w1 w2 w30", 10)
+            mask = np.arange(300) % 2 == 0
+            masked_indices, _ = index.top("w1 w2 w30", 10, mask)
+        expected = 2.0 * titles.scores(["w1", "w2", "w30"]) + descriptions.scores(["w1", "w2", "w30"])
+        np.testing.assert_allclose(expected[top_indices], top_scores)
+        self.assertEqual(top_k(expected, 10).tolist(), top_indices.tolist())
+        self.assertEqual(np.flatnonzero(mask)[top_k(expected[mask], 10)].tolist(), masked_indices.tolist())
+
+    def test_different_documents(self):
+        self.assertRaises(ValueError, MultiFieldIndex, {"title": Bm25Index.from_tokenized([["a"]]),
+                                                        "description": Bm25Index.from_tokenized([["a"], ["b"]])})
+
+
+if __name__ == "__main__":
+    unittest.main()
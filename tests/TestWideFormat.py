@@ -0,0 +1,102 @@
+import os
+import unittest
+import numpy as np
+import pandas as pd
+from ocandata.statscan import to_wide_format, read_statscan_csv, CONTROL_COLS
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+
+
+def reference_to_wide_format(statscan_data: pd.DataFrame, pivot_column):
+    """
+    The groupby / pivot_table / merge implementation that to_wide_format replaced
+    """
+    base = statscan_data.copy()
+    group_cols = [
+        col
+        for col in base.columns.tolist()
+        if col not in CONTROL_COLS + [pivot_column, "VALUE"]
+    ]
+    base["group"] = base.groupby(group_cols).ngroup()
+    values = base.pivot_table(
+        index="group",
+        columns=pivot_column,
+        values="VALUE",
+        aggfunc=np.max,
+        dropna=False,
+    )
+    base = base.drop(columns=[pivot_column, "VALUE"]).drop_duplicates(subset=group_cols)
+    return base.merge(values, on="group").drop(columns="group")
+
+
+def synthetic_cube(n_dates: int = 200, seed: int = 42):
+    """
+    A long format cube with a categorical GEO that has unused members, a string dimension,
+    a categorical pivot column, missing values and duplicate rows
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2000-01-01", periods=n_dates, freq="MS").strftime("%Y-%m")
+    geos = ["Canada", "Ontario", "Quebec", "Alberta"]
+    products = [f"Product {i}" for i in range(25)]
+    indicators = ["Sales", "Inventory", "Shipments", "Orders"]
+    index = pd.MultiIndex.from_product([dates, geos, products, indicators])
+    data = index.to_frame(index=False, name=["REF_DATE", "GEO", "Products", "Indicator"])
+    data["GEO"] = pd.Categorical(data["GEO"], categories=geos + ["Yukon"])
+    data["Indicator"] = pd.Categorical(data["Indicator"], categories=["Unused"] + indicators)
+    data["UOM"] = "Dollars"
+    data["VECTOR"] = "v" + (data.index % 10000).astype(str)
+    data["VALUE"] = rng.normal(100, 20, len(data)).round(1)
+    data.loc[rng.random(len(data)) < 0.05, "VALUE"] = np.nan
+    # Keep only some of the rows and repeat a few so groups are ragged and duplicated
+    data = data[rng.random(len(data)) < 0.9]
+    data = pd.concat([data, data.sample(frac=0.01, random_state=seed)]).reset_index(drop=True)
+    return data
+
+
+class WideFormatTestCase(unittest.TestCase):
+    def test_parity_on_rail_data(self):
+        data = read_statscan_csv(os.path.join(DATA_DIR, "23100274.csv"))
+        pd.testing.assert_frame_equal(
+            reference_to_wide_format(data, "Indicator"), to_wide_format(data, "Indicator")
+        )
+
+    def test_parity_on_synthetic_cube(self):
+        data = synthetic_cube()
+        self.assertGreater(len(data), 70_000)
+        pd.testing.assert_frame_equal(
+            reference_to_wide_format(data, "Indicator"), to_wide_format(data, "Indicator")
+        )
+
+    def test_parity_with_string_pivot_and_missing_members(self):
+        data = synthetic_cube(n_dates=24)
+        data["Indicator"] = data["Indicator"].astype(object)
+        data.loc[data.index[::97], "Indicator"] = np.nan
+        pd.testing.assert_frame_equal(
+            reference_to_wide_format(data, "Indicator"), to_wide_format(data, "Indicator")
+        )
+
+    def test_missing_dimension_values_are_their_own_group(self):
+        # The groupby implementation lumped every row with a missing dimension value into one group
+        data = pd.DataFrame(
+            {
+                "REF_DATE": ["2020", "2020", "2020", "2021"],
+                "Products": [np.nan, np.nan, "Milk", np.nan],
+                "Indicator": ["Sales", "Orders", "Sales", "Sales"],
+                "VALUE": [1.0, 2.0, 3.0, 4.0],
+            }
+        )
+        wide = to_wide_format(data, "Indicator")
+        self.assertEqual(["2020", "2020", "2021"], wide.REF_DATE.tolist())
+        self.assertEqual(2.0, wide.Orders[0])
+        self.assertTrue(wide.Orders[1:].isna().all())
+        self.assertEqual([1.0, 3.0, 4.0], wide.Sales.tolist())
+
+    def test_does_not_modify_input(self):
+        data = synthetic_cube(n_dates=12)
+        before = data.copy()
+        to_wide_format(data, "Indicator")
+        pd.testing.assert_frame_equal(before, data)
+
+
+if __name__ == "__main__":
+    unittest.main()